@@ -1,10 +1,20 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Form, WebSocket
+from fastapi import FastAPI, UploadFile, File, HTTPException, Form, WebSocket, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
 from typing import Optional
 import shutil
+import hashlib
+import asyncio
 import os
-from src.service import transcribe_audio, generate_prompts as generate_prompt_suggestions, evaluate_transcription, create_analysis, evaluate_conversation, read_all_reports, read_report_by_id, read_reports_by_employee, generate_reports_analysis, generate_employee_analysis, get_reports_analysis, get_prompt_options, evaluate_script
+from src.service import transcribe_audio, generate_prompts as generate_prompt_suggestions, evaluate_transcription, create_analysis, evaluate_conversation, read_all_reports, read_report_by_id, read_reports_by_employee, read_reports_by_date, generate_reports_analysis, generate_employee_analysis, get_reports_analysis, get_prompt_options, evaluate_script, submit_conversation, get_conversation_status, get_conversation_result, load_models, get_models_report, get_chart_image, get_charts_report, stream_evaluation, get_evaluator_report, get_transcription_report, submit_batch, read_batch_status, stream_batch, get_metrics_text, follow_report_feed, read_reports_page, get_reports_version, generate_leaderboard, generate_trends
+from src.jobs.scratch import make_scratch_dir, remove_scratch_dir
+from src.telemetry.telemetry import configure_logging
+import logging
+
+configure_logging()
+logger = logging.getLogger(__name__)
 
 app = FastAPI()
 
@@ -16,6 +26,38 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# responses streamed as they are produced, compressing them would hold chunks back
+STREAMED_PATHS = ("/evaluate-stream", "/batch")
+
+class ListingGZipMiddleware(GZipMiddleware):
+    """ gzip for everything large except the streamed endpoints """
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].startswith(STREAMED_PATHS):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+app.add_middleware(ListingGZipMiddleware, minimum_size=1024)
+
+def versioned_response(request: Request, build):
+    """
+    JSON response tagged with the report store version and the query, every save changes the version.
+    A client whose If-None-Match still matches gets a 304 without the reports being read.
+    """
+    query = hashlib.sha256(str(request.url.query).encode("utf-8")).hexdigest()[:16]
+    etag = f'W/"{get_reports_version()}-{query}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(content=build(), headers=headers)
+
+@app.on_event("startup")
+def warm_models():
+    # load whisper, pyannote and spacy once up front instead of on the first request
+    if os.getenv("PRELOAD_MODELS", "1") == "1":
+        load_models()
+
 class PromptRequest(BaseModel):
     transcription: str
     user_prompt: Optional[str] = None
@@ -23,18 +65,37 @@ class PromptRequest(BaseModel):
 
 class EvaluatorRequest(BaseModel):
     prompt: str
+    use_cache: bool = True
 
 class AnalysisRequest(BaseModel):
     report: list[tuple[str, float, str]]
     summary: str
 
+class BatchItem(BaseModel):
+    id: Optional[str] = None                      # echoed back so clients can match results
+    transcript: Optional[str] = None              # evaluated like /test
+    audio_path: Optional[str] = None              # relative to BATCH_AUDIO_DIR, evaluated like /evaluate_audio
+    employee_id: Optional[str] = None
+    user_prompt: Optional[str] = None
+    metric_name: Optional[str] = None
+
+class BatchRequest(BaseModel):
+    items: list[BatchItem]
+    use_cache: bool = True
+
+def save_upload(file: UploadFile, scratch: str) -> str:
+    # each upload lives in its own scratch directory, so uploads with the same name never collide
+    temp_filename = os.path.join(scratch, os.path.basename(file.filename or "upload"))
+    with open(temp_filename, "wb") as buffer:
+        shutil.copyfileobj(file.file, buffer)
+        logger.debug("Temp file created: %s", temp_filename)
+    return temp_filename
+
 @app.post("/transcribe")
 async def transcribe(file: UploadFile = File(...)):
-    temp_filename = f"temp_{file.filename}"
+    scratch = make_scratch_dir("upload-")
     try:
-        with open(temp_filename, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-            print(f"Temp file created: {temp_filename}")
+        temp_filename = save_upload(file, scratch)
 
         transcription = await transcribe_audio(temp_filename)
         return {"transcription": transcription}
@@ -43,8 +104,7 @@ async def transcribe(file: UploadFile = File(...)):
         raise HTTPException(status_code=500, detail=str(e))
 
     finally:
-        if os.path.exists(temp_filename):
-            os.remove(temp_filename)
+        remove_scratch_dir(scratch)
 
 @app.post("/generate-prompts")
 def generate_prompts(prompt_payload: PromptRequest):
@@ -58,16 +118,30 @@ def generate_prompts(prompt_payload: PromptRequest):
 @app.post("/evaluate")
 def evaluate(evaluator_payload: EvaluatorRequest):
     try:
-        result = evaluate_transcription(evaluator_payload.prompt)
+        result = evaluate_transcription(evaluator_payload.prompt, evaluator_payload.use_cache)
         return {"evaluation": result}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Evaluation failed: {str(e)}")
 
+@app.post("/evaluate-stream")
+def evaluate_stream(evaluator_payload: EvaluatorRequest):
+    # tokens are forwarded as ollama generates them
+    return StreamingResponse(stream_evaluation(evaluator_payload.prompt, evaluator_payload.use_cache), media_type="text/plain")
+
+@app.get("/evaluator")
+def get_evaluator():
+    try:
+        return get_evaluator_report()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.post("/generate-report-analysis")
-def generate_report_analysis(analysis_payload: AnalysisRequest):
+def generate_report_analysis(analysis_payload: AnalysisRequest, charts: str = "inline"):
     try:
-        analysis = create_analysis(analysis_payload.report, analysis_payload.summary)
+        analysis = create_analysis(analysis_payload.report, analysis_payload.summary, charts)
         return analysis
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Analysis generation failed: {str(e)}")
 
@@ -76,64 +150,181 @@ async def evaluate_audio(
     file: UploadFile = File(...),                 # required
     employee_id: str = Form(...),
     user_prompt: Optional[str] = Form(None),      # optional, defaults to None
-    metric_name: Optional[str] = Form(None)       # optional, defaults to None
+    metric_name: Optional[str] = Form(None),      # optional, defaults to None
+    use_cache: bool = Form(True)                  # set to false to ask the LLM again
 ):
-    temp_filename = f"temp_{file.filename}"
+    scratch = make_scratch_dir("upload-")
     try:
-        with open(temp_filename, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-            print(f"Temp file created: {temp_filename}")
+        temp_filename = save_upload(file, scratch)
 
-        complete_analysis = await evaluate_conversation(temp_filename, employee_id, user_prompt, metric_name)
+        complete_analysis = await evaluate_conversation(temp_filename, employee_id, user_prompt, metric_name, use_cache)
         return complete_analysis
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
     finally:
-        if os.path.exists(temp_filename):
-            os.remove(temp_filename)
+        remove_scratch_dir(scratch)
+
+@app.post("/jobs/evaluate_audio")
+def submit_evaluate_audio(
+    file: UploadFile = File(...),
+    employee_id: str = Form(...),
+    user_prompt: Optional[str] = Form(None),
+    metric_name: Optional[str] = Form(None),
+    use_cache: bool = Form(True)
+):
+    # the scratch directory is removed by the worker when the job finishes
+    scratch = make_scratch_dir("upload-")
+    try:
+        temp_filename = save_upload(file, scratch)
+
+        job_id = submit_conversation(temp_filename, employee_id, user_prompt, metric_name, use_cache, scratch)
+        return JSONResponse(status_code=202, content={"job_id": job_id, "status": "queued"})
+
+    except HTTPException:
+        remove_scratch_dir(scratch)
+        raise
+    except Exception as e:
+        remove_scratch_dir(scratch)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/jobs/{job_id}")
+def get_job_status(job_id: str):
+    return get_conversation_status(job_id)
+
+@app.get("/jobs/{job_id}/result")
+def get_job_result(job_id: str):
+    status, result = get_conversation_result(job_id)
+    if status != "done":
+        # still running, hand back the current status so the client keeps polling
+        return JSONResponse(status_code=202, content=get_conversation_status(job_id))
+    return result
+
+@app.post("/batch")
+def evaluate_batch(batch_payload: BatchRequest):
+    # results stream back as NDJSON in completion order, reconnect with /batch/{batch_id}/resume if the stream drops
+    batch_id = submit_batch([item.model_dump(exclude_none=True) for item in batch_payload.items], batch_payload.use_cache)
+    return StreamingResponse(stream_batch(batch_id), media_type="application/x-ndjson", headers={"X-Batch-Id": batch_id})
+
+@app.post("/batch/{batch_id}/resume")
+def resume_batch(batch_id: str):
+    read_batch_status(batch_id)
+    return StreamingResponse(stream_batch(batch_id), media_type="application/x-ndjson", headers={"X-Batch-Id": batch_id})
+
+@app.get("/batch/{batch_id}")
+def get_batch(batch_id: str):
+    return read_batch_status(batch_id)
+
+@app.get("/reports")
+def get_reports_page(
+    request: Request,
+    cursor: int = 0,
+    limit: Optional[int] = None,
+    fields: str = "summary",
+    employee_ids: Optional[str] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+):
+    # pass next_cursor back as cursor for the following page
+    try:
+        return versioned_response(request, lambda: read_reports_page(cursor, limit, fields, employee_ids, start, end))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Report listing failed: {str(e)}")
 
 @app.get("/get-reports")
-def get_reports():
+def get_reports(request: Request, fields: Optional[str] = None):
     try:
-        all_reports = read_all_reports()
-        return all_reports
+        return versioned_response(request, lambda: read_all_reports(fields))
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Analysis generation failed: {str(e)}")
 
 @app.get("/get-report-id")
-def get_report_id(job_id: str):
+def get_report_id(request: Request, job_id: str):
     try:
-        report = read_report_by_id(job_id)
-        return report
+        return versioned_response(request, lambda: read_report_by_id(job_id))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Analysis generation failed: {str(e)}")
     
 @app.get("/get-report-employee")
-def get_report_employee(employee_id: str):
+def get_report_employee(request: Request, employee_id: str, fields: Optional[str] = None):
+    try:
+        return versioned_response(request, lambda: read_reports_by_employee(employee_id, fields))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Analysis generation failed: {str(e)}")
+
+@app.get("/get-report-date")
+def get_report_date(request: Request, start: Optional[str] = None, end: Optional[str] = None, fields: Optional[str] = None):
     try:
-        report = read_reports_by_employee(employee_id)
-        return report
+        return versioned_response(request, lambda: read_reports_by_date(start, end, fields))
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Analysis generation failed: {str(e)}")
 
 @app.post("/generate-overall-analysis")
-def generate_overall_analysis():
+def generate_overall_analysis(charts: str = "inline"):
     try:
-        analysis = generate_reports_analysis()
+        analysis = generate_reports_analysis(charts)
         return analysis
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Analysis generation failed: {str(e)}")
     
 @app.post("/generate-employee-analysis")
-def get_employee_analysis(employee_id: str):
+def get_employee_analysis(employee_id: str, charts: str = "inline"):
     try:
-        analysis = generate_employee_analysis(employee_id)
+        analysis = generate_employee_analysis(employee_id, charts)
         return analysis
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Analysis generation failed: {str(e)}")
 
+@app.get("/leaderboard")
+def get_leaderboard(
+    sort: str = "overall",
+    order: str = "desc",
+    threshold: float = 4.5,
+    min_reports: int = 1,
+    offset: int = 0,
+    limit: Optional[int] = None,
+    charts: str = "none",
+    employee_ids: Optional[str] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+):
+    try:
+        return generate_leaderboard(sort, order, threshold, min_reports, offset, limit, charts, employee_ids, start, end)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Leaderboard generation failed: {str(e)}")
+
+@app.get("/trends")
+def get_trends(
+    bucket: str = "week",
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    employee_ids: Optional[str] = None,
+    window: Optional[int] = None,
+    max_points: Optional[int] = None,
+    charts: str = "none",
+):
+    try:
+        return generate_trends(bucket, start, end, employee_ids, window, max_points, charts)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Trend generation failed: {str(e)}")
+
 @app.get("/get-overall-analysis")
 def get_overall_analysis():
     try:
@@ -142,6 +333,43 @@ def get_overall_analysis():
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Analysis generation failed: {str(e)}")
     
+@app.get("/charts")
+def get_charts():
+    try:
+        return get_charts_report()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/charts/{key}")
+def get_chart(key: str, request: Request):
+    # charts are content-addressed, the key never changes meaning so it doubles as a strong ETag
+    etag = f'"{key}"'
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=31536000, immutable"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    image, media_type = get_chart_image(key)
+    return Response(content=image, media_type=media_type, headers=headers)
+
+@app.get("/models")
+def get_models():
+    try:
+        return get_models_report()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/transcription")
+def get_transcription():
+    try:
+        return get_transcription_report()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/metrics")
+def get_metrics():
+    # Prometheus text exposition format
+    return Response(content=get_metrics_text(), media_type="text/plain; version=0.0.4")
+
 @app.get("/get-prompt-options")
 def get_prompt_options_route():
     try:
@@ -151,22 +379,37 @@ def get_prompt_options_route():
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.websocket("/ws/reports")
-async def websocket_get_reports(websocket: WebSocket):
+async def websocket_get_reports(websocket: WebSocket, since: int = 0, employee_ids: Optional[str] = None, fields: str = "summary"):
+    # long-lived: a snapshot of the reports after `since`, then every new or changed report as it is saved
     await websocket.accept()
-    try:
-        all_reports = read_all_reports()
-        await websocket.send_json(all_reports)
-    except Exception as e:
-        await websocket.send_json({"error": str(e)})
-    finally:
-        await websocket.close()
+
+    async def push():
+        async for message in follow_report_feed(since, employee_ids, fields):
+            await websocket.send_json(message)
+
+    async def wait_for_disconnect():
+        # the client never sends anything, reading only notices it going away
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+
+    pusher = asyncio.create_task(push())
+    receiver = asyncio.create_task(wait_for_disconnect())
+    done, pending = await asyncio.wait({pusher, receiver}, return_when=asyncio.FIRST_COMPLETED)
+    for task in pending:
+        task.cancel()
+    if pusher in done and pusher.exception() is not None:
+        try:
+            await websocket.send_json({"error": str(pusher.exception())})
+            await websocket.close()
+        except Exception:
+            pass
 
 @app.websocket("/ws/overall-analysis")
 async def websocket_get_overall_analysis(websocket: WebSocket):
     await websocket.accept()
     try:
-        generate_reports_analysis()
-        analysis = get_reports_analysis()
+        # cached against the report store version, only the first client after a save waits for a recompute
+        analysis = await asyncio.to_thread(generate_reports_analysis)
         await websocket.send_json(analysis)
     except Exception as e:
         await websocket.send_json({"error": str(e)})
@@ -175,10 +418,11 @@ async def websocket_get_overall_analysis(websocket: WebSocket):
 
 @app.post("/test")
 async def test(
-    transcript: str = Form(...)
+    transcript: str = Form(...),
+    use_cache: bool = Form(True)
 ):
     try:
-        complete_analysis = await evaluate_script(transcript)
+        complete_analysis = await evaluate_script(transcript, use_cache)
         return complete_analysis
 
     except Exception as e:
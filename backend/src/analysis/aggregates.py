@@ -0,0 +1,230 @@
+import os
+import json
+import math
+import sqlite3
+from typing import Dict, Iterable, List, Optional
+
+# score thresholds whose hit counts are kept alongside each aggregate
+AGGREGATE_THRESHOLDS = [float(t) for t in os.getenv("AGGREGATE_THRESHOLDS", "3,4,4.5").split(",")]
+# bin width of the quantile sketch, scores on a 0-5 scale are exact at this resolution
+SKETCH_RESOLUTION = float(os.getenv("SKETCH_RESOLUTION", "0.01"))
+
+# scope of the aggregates over every report, employee scopes are "employee:<id>"
+OVERALL_SCOPE = "*"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS metric_aggregates (
+    scope TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    state TEXT NOT NULL,
+    PRIMARY KEY (scope, metric)
+);
+"""
+
+
+def employee_scope(employee_id: str) -> str:
+    return f"employee:{employee_id}"
+
+
+def report_scores(report: dict) -> List[tuple]:
+    """ (metric, score) pairs of a report, skipping rows the LLM didn't score numerically """
+    scores = []
+    evaluated_transcription = report.get("evaluated_transcription", [])
+    if not isinstance(evaluated_transcription, list):
+        return scores
+    for row in evaluated_transcription:
+        if not isinstance(row, (list, tuple)) or len(row) < 2:
+            continue
+        try:
+            score = float(row[1])
+        except (TypeError, ValueError):
+            continue
+        if not math.isnan(score):
+            scores.append((row[0], score))
+    return scores
+
+
+class QuantileSketch:
+    """
+    Mergeable quantile sketch made of fixed-width bins.
+
+    Scores live on a small bounded scale, so binning them at SKETCH_RESOLUTION keeps the sketch
+    to a few hundred counters while staying exact for scores that are multiples of the resolution.
+    Counts can be added and subtracted, which makes merges and report replacements trivial.
+    """
+
+    def __init__(self, bins: Optional[Dict[int, int]] = None, resolution: float = SKETCH_RESOLUTION):
+        self.bins = bins or {}
+        self.resolution = resolution
+
+    def add(self, value: float, count: int = 1):
+        key = int(round(value / self.resolution))
+        self.bins[key] = self.bins.get(key, 0) + count
+        if self.bins[key] <= 0:
+            del self.bins[key]
+
+    def merge(self, other: "QuantileSketch"):
+        for key, count in other.bins.items():
+            self.bins[key] = self.bins.get(key, 0) + count
+
+    def count(self) -> int:
+        return sum(self.bins.values())
+
+    def count_at_least(self, threshold: float) -> int:
+        return sum(count for key, count in self.bins.items() if key * self.resolution >= threshold - 1e-9)
+
+    def min(self) -> Optional[float]:
+        return min(self.bins) * self.resolution if self.bins else None
+
+    def max(self) -> Optional[float]:
+        return max(self.bins) * self.resolution if self.bins else None
+
+    def quantile(self, q: float) -> Optional[float]:
+        """ q-th percentile (0-100) with the same linear interpolation as np.percentile """
+        n = self.count()
+        if n == 0:
+            return None
+        position = q / 100 * (n - 1)
+        lower_rank, upper_rank = math.floor(position), math.ceil(position)
+
+        lower = upper = None
+        seen = 0
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if lower is None and seen > lower_rank:
+                lower = key * self.resolution
+            if seen > upper_rank:
+                upper = key * self.resolution
+                break
+
+        return lower + (upper - lower) * (position - lower_rank)
+
+    def to_json(self) -> dict:
+        return {str(key): count for key, count in self.bins.items()}
+
+    @classmethod
+    def from_json(cls, data: dict) -> "QuantileSketch":
+        return cls({int(key): count for key, count in data.items()})
+
+
+class MetricAggregate:
+    """ Running statistics of one metric within one scope """
+
+    def __init__(self, state: Optional[dict] = None):
+        state = state or {}
+        self.count = state.get("count", 0)
+        self.sum = state.get("sum", 0.0)
+        self.sum_sq = state.get("sum_sq", 0.0)
+        self.min = state.get("min")
+        self.max = state.get("max")
+        self.threshold_counts = state.get("threshold_counts", {str(t): 0 for t in AGGREGATE_THRESHOLDS})
+        self.sketch = QuantileSketch.from_json(state.get("sketch", {}))
+
+    def add(self, score: float, sign: int = 1):
+        """ Fold a score in (sign=1) or take it back out (sign=-1) """
+        self.count += sign
+        self.sum += sign * score
+        self.sum_sq += sign * score * score
+        for threshold in AGGREGATE_THRESHOLDS:
+            if score >= threshold:
+                self.threshold_counts[str(threshold)] = self.threshold_counts.get(str(threshold), 0) + sign
+        self.sketch.add(score, sign)
+
+        if sign > 0:
+            self.min = score if self.min is None else min(self.min, score)
+            self.max = score if self.max is None else max(self.max, score)
+        else:
+            # min/max can't be undone, fall back to the sketch bounds
+            self.min, self.max = self.sketch.min(), self.sketch.max()
+
+    def merge(self, other: "MetricAggregate"):
+        self.count += other.count
+        self.sum += other.sum
+        self.sum_sq += other.sum_sq
+        for threshold, count in other.threshold_counts.items():
+            self.threshold_counts[threshold] = self.threshold_counts.get(threshold, 0) + count
+        self.sketch.merge(other.sketch)
+        self.min = min(v for v in (self.min, other.min) if v is not None) if self.count else None
+        self.max = max(v for v in (self.max, other.max) if v is not None) if self.count else None
+
+    def above(self, threshold: float) -> int:
+        if str(threshold) in self.threshold_counts:
+            return self.threshold_counts[str(threshold)]
+        return self.sketch.count_at_least(threshold)
+
+    def performance(self, threshold: float = 4.5) -> dict:
+        """ Mean, median, min, max, 10th/90th percentile and percentage at or above the threshold for one metric """
+        mean = self.sum / self.count if self.count else 0.0
+        variance = max(self.sum_sq / self.count - mean * mean, 0.0) if self.count else 0.0
+        return {
+            "mean": float(mean),
+            "median": float(self.sketch.quantile(50) or 0.0),
+            "min": float(self.min or 0.0),
+            "max": float(self.max or 0.0),
+            "10th_percentile": float(self.sketch.quantile(10) or 0.0),
+            "90th_percentile": float(self.sketch.quantile(90) or 0.0),
+            "percentage_above_threshold": (self.above(threshold) / self.count) * 100 if self.count else 0,
+            "std": float(math.sqrt(variance)),
+            "count": self.count,
+        }
+
+    def to_json(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "sum_sq": self.sum_sq,
+            "min": self.min,
+            "max": self.max,
+            "threshold_counts": self.threshold_counts,
+            "sketch": self.sketch.to_json(),
+        }
+
+
+class MetricAggregateIndex:
+    """
+    Report store index that keeps per-metric aggregates for all reports and for each employee.
+    It is applied inside the store's write transaction so the aggregates never drift from the reports.
+    """
+
+    schema = SCHEMA
+
+    def is_empty(self, conn: sqlite3.Connection) -> bool:
+        return conn.execute("SELECT 1 FROM metric_aggregates LIMIT 1").fetchone() is None
+
+    def rebuild(self, conn: sqlite3.Connection, reports: Iterable[dict]):
+        conn.execute("DELETE FROM metric_aggregates")
+        for report in reports:
+            self.apply(conn, report, 1)
+
+    def apply(self, conn: sqlite3.Connection, report: dict, sign: int):
+        scores = report_scores(report)
+        if not scores:
+            return
+
+        scopes = [OVERALL_SCOPE]
+        if report.get("employee_id") is not None:
+            scopes.append(employee_scope(report["employee_id"]))
+
+        for scope in scopes:
+            for metric, score in scores:
+                row = conn.execute(
+                    "SELECT state FROM metric_aggregates WHERE scope = ? AND metric = ?", (scope, metric)
+                ).fetchone()
+                aggregate = MetricAggregate(json.loads(row[0]) if row else None)
+                aggregate.add(score, sign)
+                if aggregate.count > 0:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO metric_aggregates (scope, metric, state) VALUES (?, ?, ?)",
+                        (scope, metric, json.dumps(aggregate.to_json())),
+                    )
+                else:
+                    conn.execute("DELETE FROM metric_aggregates WHERE scope = ? AND metric = ?", (scope, metric))
+
+
+def load_aggregates(conn: sqlite3.Connection, scope: str) -> Dict[str, MetricAggregate]:
+    rows = conn.execute("SELECT metric, state FROM metric_aggregates WHERE scope = ?", (scope,))
+    return {metric: MetricAggregate(json.loads(state)) for metric, state in rows}
+
+
+def compute_performance_from_aggregates(aggregates: Dict[str, MetricAggregate], threshold: float = 4.5) -> Dict[str, Dict]:
+    return {metric: aggregate.performance(threshold) for metric, aggregate in aggregates.items()}
@@ -1,16 +1,14 @@
 import numpy as np
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-import seaborn as sns
-import io
-import base64
+from src.analysis.charts import chart_entry
+import logging
 
-def generate_analysis(data: list[tuple[str, float, str]], summary: str):
+logger = logging.getLogger(__name__)
+
+def generate_analysis(data: list[tuple[str, float, str]], summary: str, charts: str = "inline"):
     # Turn into dict
     scores_dict = {metric: score for (metric, score, _) in data}
     individual_scores = "\n".join([f"- {metric}: {score}" for metric, score in scores_dict.items()])
-    print(individual_scores)
+    logger.debug("individual scores: %s", individual_scores)
     metrics = list(scores_dict.keys())
     scores = list(scores_dict.values())
 
@@ -27,35 +25,18 @@ def generate_analysis(data: list[tuple[str, float, str]], summary: str):
         "Performance Evaluation": "Consistent Performance" if average_score > 4.5 and std_dev < 0.5 else "Inconsistent Performance",
     }
 
-    # Bar chart
-    plt.figure(figsize=(8, 7))
-    sns.barplot(x=metrics, y=scores, palette="Blues_d")
-    plt.xticks(rotation=45)
-    plt.ylim(0, 5.5)
-    plt.title("Customer Service Evaluation Metrics")
-    plt.ylabel("Score (out of 5)")
-    plt.xlabel("Metrics")
-
-    buf = io.BytesIO()
-    plt.savefig(buf, format="png")
-    buf.seek(0)
-    bar_chart_base64 = base64.b64encode(buf.getvalue()).decode("utf-8")
-    plt.close()
-
-    # Box plot
-    plt.figure(figsize=(8, 7))
-    sns.boxplot(x=scores, color="lightblue")
-    plt.title("Customer Service Score Distribution")
-    plt.xlabel("Score (out of 5)")
-
-    buf = io.BytesIO()
-    plt.savefig(buf, format="png")
-    buf.seek(0)
-    box_chart_base64 = base64.b64encode(buf.getvalue()).decode("utf-8")
-    plt.close()
+    # Charts are cached by their data, identical reports reuse the rendered images
+    bar_chart = chart_entry("bar", charts, metrics=metrics, scores=scores)
+    box_chart = chart_entry("box", charts, scores=scores)
 
     return {
         "analysis_report": analysis_report,
-        "bar_chart": f"data:image/png;base64,{bar_chart_base64}",
-        "box_chart": f"data:image/png;base64,{box_chart_base64}",
+        "scores": scores_dict,
+        "bar_chart": chart_value(bar_chart, "image/png"),
+        "box_chart": chart_value(box_chart, "image/png"),
     }
+
+def chart_value(entry: dict, media_type: str):
+    if "base64" in entry:
+        return f"data:{media_type};base64,{entry['base64']}"
+    return entry.get("url")
@@ -0,0 +1,135 @@
+import os
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from src.analysis.aggregates import OVERALL_SCOPE, employee_scope
+from src.storage.storage import add_report_listener, get_scope_version
+from src.telemetry.telemetry import counter
+
+logger = logging.getLogger(__name__)
+
+# analyses kept, one per scope (overall or employee) and chart mode
+ANALYSIS_CACHE_ENTRIES = int(os.getenv("ANALYSIS_CACHE_ENTRIES", "256"))
+# ad-hoc query results kept (leaderboards, trends), checked on read and never refreshed in the background
+ANALYSIS_QUERY_ENTRIES = int(os.getenv("ANALYSIS_QUERY_ENTRIES", "32"))
+# analyses recomputed at once in the background
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "2"))
+
+analysis_requests = counter("analysis_cache_requests_total", "Analysis requests, by whether the cached result was current", ("result",))
+analysis_computes = counter("analysis_computes_total", "Analyses computed")
+
+
+class AnalysisCache:
+    """
+    Analyses cached against the report store version of their scope.
+
+    A cached analysis is served as long as no report of its scope was saved since it was computed.
+    Saves schedule one background recompute per cached analysis of the scope; saves arriving while
+    it runs fold into a single follow-up run. Readers needing a recompute wait for the one in flight
+    instead of starting their own, so any number of clients costs one computation per change.
+
+    Ad-hoc queries (refresh=False) are kept in a separate, smaller LRU and only recomputed when
+    they are read after a save, so a one-off query never costs anything on later saves.
+    """
+
+    def __init__(self, max_entries: int = ANALYSIS_CACHE_ENTRIES, workers: int = ANALYSIS_WORKERS, max_queries: int = ANALYSIS_QUERY_ENTRIES):
+        self.max_entries = max_entries
+        self.max_queries = max_queries
+        # key -> (version, analysis), refreshed on every save of their scope
+        self.entries = OrderedDict()
+        # key -> (version, result) of ad-hoc queries
+        self.queries = OrderedDict()
+        # key -> (scope, compute) of every cached analysis, so a save can recompute it
+        self.sources = {}
+        # key -> Future of the recompute in flight
+        self.running = {}
+        # keys saved to again while their recompute was running
+        self.dirty = set()
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="analysis")
+
+    def get(self, key: tuple, scope: str, compute, refresh: bool = True):
+        """
+        The analysis for key, computed by compute() when nothing current is cached.
+
+        key identifies the analysis (scope and chart mode), scope is the report scope whose version it depends on.
+        With refresh the analysis is recomputed in the background after every save of its scope, without it
+        the result is only recomputed when read again after one.
+        """
+        version = get_scope_version(scope)
+        entries = self.entries if refresh else self.queries
+        with self.lock:
+            entry = entries.get(key)
+            if entry is not None and entry[0] == version:
+                entries.move_to_end(key)
+                analysis_requests.inc(result="hit")
+                return entry[1]
+            analysis_requests.inc(result="miss")
+            # a recompute already running serves this reader too
+            future = self.running.get(key) or self._schedule(key, scope, compute, refresh)
+        return future.result()
+
+    def refresh(self, scopes: set):
+        """ Recompute in the background every cached analysis of the given scopes """
+        with self.lock:
+            for key, (scope, compute) in list(self.sources.items()):
+                if scope in scopes:
+                    self._schedule(key, scope, compute)
+
+    def _schedule(self, key: tuple, scope: str, compute, refresh: bool = True) -> Future:
+        # called with the lock held
+        future = self.running.get(key)
+        if future is not None:
+            self.dirty.add(key)
+            return future
+        future = self.running[key] = self.executor.submit(self._run, key, scope, compute, refresh)
+        return future
+
+    def _run(self, key: tuple, scope: str, compute, refresh: bool = True):
+        try:
+            while True:
+                with self.lock:
+                    self.dirty.discard(key)
+                # read before computing, a save that lands meanwhile leaves the entry behind and marks it dirty
+                version = get_scope_version(scope)
+                analysis = compute()
+                analysis_computes.inc()
+                with self.lock:
+                    if refresh:
+                        self.entries[key] = (version, analysis)
+                        self.entries.move_to_end(key)
+                        self.sources[key] = (scope, compute)
+                        while len(self.entries) > self.max_entries:
+                            evicted, _ = self.entries.popitem(last=False)
+                            self.sources.pop(evicted, None)
+                    else:
+                        self.queries[key] = (version, analysis)
+                        self.queries.move_to_end(key)
+                        while len(self.queries) > self.max_queries:
+                            self.queries.popitem(last=False)
+                    # cleared under the same lock as the check, a save after this schedules a new run
+                    if key not in self.dirty:
+                        self.running.pop(key, None)
+                        return analysis
+        except Exception as e:
+            with self.lock:
+                self.running.pop(key, None)
+                self.dirty.discard(key)
+            # background refreshes have nobody waiting on them, readers get the error from result()
+            logger.warning("analysis %s failed: %s", key, e)
+            raise
+
+
+# shared process-wide cache
+analysis_cache = AnalysisCache()
+
+
+def _on_report_saved(seq: int, report: dict):
+    scopes = {OVERALL_SCOPE}
+    if report.get("employee_id") is not None:
+        scopes.add(employee_scope(report["employee_id"]))
+    analysis_cache.refresh(scopes)
+
+
+add_report_listener(_on_report_saved)
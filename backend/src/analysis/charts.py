@@ -0,0 +1,207 @@
+import os
+import io
+import json
+import base64
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import seaborn as sns
+from src.telemetry.telemetry import span
+
+# total bytes of rendered images kept in memory
+CHART_CACHE_BYTES = int(os.getenv("CHART_CACHE_BYTES", str(64 * 1024 * 1024)))
+# chart inputs remembered so /charts/{key} can render them on demand
+CHART_SPECS_MAX = int(os.getenv("CHART_SPECS_MAX", "5000"))
+
+# "inline" embeds base64 images, "url" links to /charts/{key}, "none" returns the data only
+CHART_MODES = ("inline", "url", "none")
+# x-axis labels drawn at most on a trend chart, and points up to which each one gets a marker
+MAX_TICKS = 30
+MARKER_POINTS = 100
+
+# pyplot keeps global state, only one figure may be drawn at a time
+render_lock = threading.Lock()
+
+
+def _savefig(fmt: str) -> bytes:
+    buf = io.BytesIO()
+    plt.savefig(buf, format=fmt)
+    plt.close()
+    return buf.getvalue()
+
+
+def render_trend_graph(metric_name: str, labels: list, values: list) -> bytes:
+    # Create a new figure
+    plt.figure(figsize=(10, 6))
+
+    # Plot the values for the current metric, x-axis: report index with employee id and job id
+    plt.plot(labels, values, marker='o' if len(values) <= MARKER_POINTS else None, label=metric_name)
+
+    # Set titles and labels
+    plt.title(f'Trending Graph for {metric_name}')
+    plt.xlabel('Reports')
+    plt.ylabel(f'{metric_name} Score')
+
+    # Add grid and labels, only every few reports is labeled on long series
+    plt.grid(True)
+    step = max(1, len(labels) // MAX_TICKS)
+    plt.xticks(range(0, len(labels), step), labels[::step], rotation=45)  # Rotate x-axis labels for better readability
+    plt.tight_layout()
+
+    return _savefig('jpeg')
+
+
+def render_bucketed_trend(metric_name: str, bucket: str, buckets: list, means: list, rolling: list) -> bytes:
+    plt.figure(figsize=(10, 6))
+    days = np.array(buckets, dtype="datetime64[D]")
+    plt.plot(days, means, marker='o' if len(means) <= MARKER_POINTS else None, label=f'{bucket} mean')
+    plt.plot(days, rolling, linestyle='--', label='rolling mean')
+    plt.title(f'Trending Graph for {metric_name}')
+    plt.xlabel(bucket.capitalize())
+    plt.ylabel(f'{metric_name} Score')
+    plt.ylim(0, 5.5)
+    plt.grid(True)
+    plt.legend()
+    plt.xticks(rotation=45)
+    plt.tight_layout()
+
+    return _savefig('jpeg')
+
+
+def render_bar_chart(metrics: list, scores: list) -> bytes:
+    plt.figure(figsize=(8, 7))
+    sns.barplot(x=metrics, y=scores, palette="Blues_d")
+    plt.xticks(rotation=45)
+    plt.ylim(0, 5.5)
+    plt.title("Customer Service Evaluation Metrics")
+    plt.ylabel("Score (out of 5)")
+    plt.xlabel("Metrics")
+
+    return _savefig('png')
+
+
+def render_box_chart(scores: list) -> bytes:
+    plt.figure(figsize=(8, 7))
+    sns.boxplot(x=scores, color="lightblue")
+    plt.title("Customer Service Score Distribution")
+    plt.xlabel("Score (out of 5)")
+
+    return _savefig('png')
+
+
+def render_leaderboard_chart(metric_name: str, employees: list, means: list) -> bytes:
+    # one bar per employee in leaderboard order, best at the top
+    plt.figure(figsize=(8, max(3, 0.3 * len(employees) + 1)))
+    sns.barplot(x=means, y=employees, orient="h", palette="Blues_d")
+    plt.xlim(0, 5.5)
+    plt.title(f"Leaderboard: {metric_name}")
+    plt.xlabel("Mean score (out of 5)")
+    plt.ylabel("Employee")
+    plt.tight_layout()
+
+    return _savefig('png')
+
+
+RENDERERS = {
+    "trend": (render_trend_graph, "image/jpeg"),
+    "trend_buckets": (render_bucketed_trend, "image/jpeg"),
+    "bar": (render_bar_chart, "image/png"),
+    "box": (render_box_chart, "image/png"),
+    "leaderboard": (render_leaderboard_chart, "image/png"),
+}
+
+
+class ChartCache:
+    """
+    Size-bounded LRU of rendered charts keyed by a hash of the chart kind and its input data.
+    Identical inputs always map to the same key, so an unchanged chart is rendered only once.
+    """
+
+    def __init__(self, max_bytes: int = CHART_CACHE_BYTES, max_specs: int = CHART_SPECS_MAX):
+        self.max_bytes = max_bytes
+        self.max_specs = max_specs
+        self.images = OrderedDict()
+        self.specs = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def register(self, kind: str, **data) -> str:
+        """ Remember a chart's inputs and return its key without rendering it """
+        key = hashlib.sha256(json.dumps([kind, data], sort_keys=True, default=str).encode("utf-8")).hexdigest()
+        with self.lock:
+            self.specs[key] = (kind, data)
+            self.specs.move_to_end(key)
+            while len(self.specs) > self.max_specs:
+                self.specs.popitem(last=False)
+        return key
+
+    def get(self, key: str):
+        """ (image bytes, media type) for a registered chart, rendering it on first request """
+        with self.lock:
+            if key in self.images:
+                self.hits += 1
+                self.images.move_to_end(key)
+                return self.images[key]
+            if key not in self.specs:
+                return None
+            self.misses += 1
+            kind, data = self.specs[key]
+
+        renderer, media_type = RENDERERS[kind]
+        with render_lock, span("chart_render"):
+            image = (renderer(**data), media_type)
+
+        with self.lock:
+            if key not in self.images:
+                self.images[key] = image
+                self.size += len(image[0])
+            while self.size > self.max_bytes and len(self.images) > 1:
+                _, (evicted, _) = self.images.popitem(last=False)
+                self.size -= len(evicted)
+        return image
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"images": len(self.images), "bytes": self.size, "specs": len(self.specs), "hits": self.hits, "misses": self.misses}
+
+
+# shared process-wide cache
+chart_cache = ChartCache()
+
+
+def check_chart_mode(mode: str) -> str:
+    if mode not in CHART_MODES:
+        raise ValueError(f"Unknown chart mode '{mode}', expected one of {', '.join(CHART_MODES)}")
+    return mode
+
+
+def chart_entry(kind: str, mode: str = "inline", **data) -> dict:
+    """
+    Chart reference in the requested mode, merged into analysis responses.
+
+    Returns:
+        dict: {"base64": ...} for inline, {"url": ...} for url and {} when only data is wanted
+    """
+    if check_chart_mode(mode) == "none":
+        return {}
+
+    key = chart_cache.register(kind, **data)
+    if mode == "url":
+        return {"url": f"/charts/{key}"}
+
+    image, _ = chart_cache.get(key)
+    return {"base64": base64.b64encode(image).decode("utf-8")}
+
+
+def get_chart(key: str):
+    return chart_cache.get(key)
+
+
+def get_chart_cache_stats() -> dict:
+    return chart_cache.stats()
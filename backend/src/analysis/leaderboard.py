@@ -0,0 +1,165 @@
+import numpy as np
+from typing import Optional
+from src.analysis.charts import chart_entry
+
+# statistics computed per employee and metric, same names as the overall_performance_data of the analyses
+PERCENTILES = {"10th_percentile": 10, "median": 50, "90th_percentile": 90}
+SORT_ORDERS = ("desc", "asc")
+
+
+def grouped_quantiles(groups: np.ndarray, scores: np.ndarray, n_groups: int, percentiles: dict) -> dict:
+    """
+    Percentiles of the scores of every group in one sort, interpolated linearly like np.percentile.
+    Groups without scores get NaN.
+    """
+    order = np.lexsort((scores, groups))
+    sorted_scores = scores[order]
+    counts = np.bincount(groups, minlength=n_groups)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    present = counts > 0
+
+    result = {}
+    for name, q in percentiles.items():
+        position = starts + (counts - 1).clip(min=0) * (q / 100)
+        low = np.floor(position).astype(np.int64)
+        high = np.ceil(position).astype(np.int64)
+        values = np.full(n_groups, np.nan)
+        lo, hi = sorted_scores[low[present]], sorted_scores[high[present]]
+        values[present] = lo + (hi - lo) * (position[present] - low[present])
+        result[name] = values
+    return result
+
+
+def grouped_statistics(groups: np.ndarray, scores: np.ndarray, n_groups: int, threshold: float) -> dict:
+    """ count, mean, std, min, max, percentiles and the share at or above threshold for every group """
+    counts = np.bincount(groups, minlength=n_groups).astype(np.float64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.bincount(groups, weights=scores, minlength=n_groups) / counts
+        mean_sq = np.bincount(groups, weights=scores * scores, minlength=n_groups) / counts
+        above = np.bincount(groups, weights=(scores >= threshold).astype(np.float64), minlength=n_groups) / counts * 100
+
+    minimum = np.full(n_groups, np.inf)
+    maximum = np.full(n_groups, -np.inf)
+    np.minimum.at(minimum, groups, scores)
+    np.maximum.at(maximum, groups, scores)
+    empty = counts == 0
+    minimum[empty] = np.nan
+    maximum[empty] = np.nan
+
+    return {
+        "count": counts,
+        "mean": mean,
+        "std": np.sqrt(np.clip(mean_sq - mean * mean, 0, None)),
+        "min": minimum,
+        "max": maximum,
+        "percentage_above_threshold": above,
+        **grouped_quantiles(groups, scores, n_groups, PERCENTILES),
+    }
+
+
+def competition_rank(values: np.ndarray) -> np.ndarray:
+    """ 1 for the highest value, ties share a rank, NaN stays unranked (0) """
+    ranked = ~np.isnan(values)
+    ordered = np.sort(values[ranked])
+    ranks = np.zeros(len(values), dtype=np.int64)
+    ranks[ranked] = len(ordered) - np.searchsorted(ordered, values[ranked], side="right") + 1
+    return ranks
+
+
+def build_leaderboard(
+    employee_codes: np.ndarray,
+    metric_codes: np.ndarray,
+    scores: np.ndarray,
+    employees: list,
+    metrics: list,
+    report_counts: np.ndarray,
+    threshold: float = 4.5,
+    min_reports: int = 1,
+) -> dict:
+    """
+    Per-employee statistics of every metric from one group-by over (employee, metric) pairs.
+
+    employee_codes, metric_codes and scores hold one entry per scored metric of a report,
+    report_counts the number of reports of each employee.
+
+    Returns:
+        dict: "stats" {statistic: (metrics x employees) array}, "rank" per metric, "overall" mean
+              of the metric means and "overall_rank", employees with fewer than min_reports unranked
+    """
+    n_employees, n_metrics = len(employees), len(metrics)
+    groups = metric_codes * n_employees + employee_codes
+    stats = {
+        name: values.reshape(n_metrics, n_employees)
+        for name, values in grouped_statistics(groups, scores.astype(np.float64), n_metrics * n_employees, threshold).items()
+    }
+
+    eligible = report_counts >= min_reports
+    ranked_means = np.where(eligible, stats["mean"], np.nan)
+    rank = np.stack([competition_rank(row) for row in ranked_means]) if n_metrics else np.zeros((0, n_employees), dtype=np.int64)
+
+    with np.errstate(invalid="ignore"):
+        scored = (~np.isnan(stats["mean"])).sum(axis=0)
+        overall = np.where(scored > 0, np.nansum(stats["mean"], axis=0) / np.maximum(scored, 1), np.nan)
+    overall_rank = competition_rank(np.where(eligible, overall, np.nan))
+
+    return {"stats": stats, "rank": rank, "overall": overall, "overall_rank": overall_rank}
+
+
+def leaderboard_rows(
+    board: dict,
+    employees: list,
+    metrics: list,
+    report_counts: np.ndarray,
+    sort: str = "overall",
+    order: str = "desc",
+    offset: int = 0,
+    limit: Optional[int] = None,
+) -> list:
+    """ JSON-ready rows for a page of the employees sorted by the overall mean or one metric's mean """
+    if order not in SORT_ORDERS:
+        raise ValueError(f"Unknown order '{order}', expected one of {', '.join(SORT_ORDERS)}")
+    if sort == "overall":
+        key = board["overall"]
+    elif sort in metrics:
+        key = board["stats"]["mean"][metrics.index(sort)]
+    else:
+        raise ValueError(f"Unknown sort '{sort}', expected 'overall' or one of: {', '.join(metrics)}")
+
+    # NaN (employee never scored on the metric) always sorts last
+    direction = -1 if order == "desc" else 1
+    positions = np.lexsort((np.arange(len(employees)), direction * np.nan_to_num(key, nan=0.0), np.isnan(key)))
+    positions = positions[offset:offset + limit if limit is not None else None]
+
+    stats = board["stats"]
+    rows = []
+    for e in positions:
+        row_metrics = {}
+        for m, metric in enumerate(metrics):
+            if stats["count"][m, e] == 0:
+                continue
+            row_metrics[metric] = {name: _number(values[m, e]) for name, values in stats.items()}
+            row_metrics[metric]["count"] = int(stats["count"][m, e])
+            row_metrics[metric]["rank"] = int(board["rank"][m, e]) or None
+        rows.append({
+            "employee_id": employees[e],
+            "reports": int(report_counts[e]),
+            "overall": _number(board["overall"][e]),
+            "rank": int(board["overall_rank"][e]) or None,
+            "metrics": row_metrics,
+        })
+    return rows
+
+
+def leaderboard_chart(rows: list, sort: str, charts: str) -> dict:
+    """ Bar chart of the listed employees' means on the sort column, only rendered for charts != "none" """
+    if sort == "overall":
+        values = [row["overall"] for row in rows]
+    else:
+        values = [row["metrics"].get(sort, {}).get("mean") for row in rows]
+    pairs = [(str(row["employee_id"]), value) for row, value in zip(rows, values) if value is not None]
+    return chart_entry("leaderboard", charts, metric_name=sort, employees=[p[0] for p in pairs], means=[p[1] for p in pairs])
+
+
+def _number(value) -> Optional[float]:
+    value = float(value)
+    return None if np.isnan(value) else round(value, 4)
@@ -0,0 +1,139 @@
+import os
+import numpy as np
+from typing import Optional
+from src.analysis.charts import chart_entry
+
+# most points in any trend series, longer ones are downsampled keeping their shape
+TREND_MAX_POINTS = int(os.getenv("TREND_MAX_POINTS", "500"))
+# buckets a rolling mean spans by default
+TREND_WINDOW = int(os.getenv("TREND_WINDOW", "4"))
+
+BUCKETS = ("day", "week", "month")
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Indices of the points Largest-Triangle-Three-Buckets keeps out of a series.
+
+    The first and last points are always kept. In between, the points are split into threshold - 2
+    buckets, and each bucket keeps the point forming the largest triangle with the point kept before it
+    and the average of the next bucket. Peaks and dips survive, unlike with striding or averaging.
+    """
+    n = len(y)
+    if threshold >= n or n <= 2:
+        return np.arange(n)
+    threshold = max(threshold, 3)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    every = (n - 2) / (threshold - 2)
+    kept = np.empty(threshold, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = int(i * every) + 1, int((i + 1) * every) + 1
+        next_start, next_end = end, min(int((i + 2) * every) + 1, n)
+        avg_x = x[next_start:next_end].mean() if next_end > next_start else x[n - 1]
+        avg_y = y[next_start:next_end].mean() if next_end > next_start else y[n - 1]
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        kept[i + 1] = a
+    return kept
+
+
+def downsample_metrics(metrics_data: dict, max_points: int = TREND_MAX_POINTS) -> dict:
+    """ extract_column_metrics output with every metric cut to max_points reports, "reports" keeps the full count """
+    result = {}
+    for metric, data in metrics_data.items():
+        scores = data["scores"]
+        kept = lttb(np.arange(len(scores)), np.asarray(scores, dtype=np.float64), max_points)
+        result[metric] = {
+            "scores": [scores[i] for i in kept],
+            "labels": [data["labels"][i] for i in kept],
+            "reports": len(scores),
+        }
+    return result
+
+
+def bucket_starts(timestamps: np.ndarray, bucket: str) -> np.ndarray:
+    """ First day of the day, week (Monday) or month each timestamp falls in """
+    if bucket not in BUCKETS:
+        raise ValueError(f"Unknown bucket '{bucket}', expected one of {', '.join(BUCKETS)}")
+    days = timestamps.astype("datetime64[D]")
+    if bucket == "week":
+        # day 0 (1970-01-01) was a Thursday
+        return days - ((days.astype(np.int64) + 3) % 7).astype("timedelta64[D]")
+    if bucket == "month":
+        return timestamps.astype("datetime64[M]").astype("datetime64[D]")
+    return days
+
+
+def bucketed_trends(
+    columns: dict,
+    rows: Optional[np.ndarray] = None,
+    bucket: str = "week",
+    window: int = TREND_WINDOW,
+    max_points: int = TREND_MAX_POINTS,
+    charts: str = "none",
+) -> dict:
+    """
+    Scores of the selected reports per metric and time bucket, from the score columns.
+
+    rows is a mask of the reports to include, reports without a submission time are left out.
+    Every metric gets its buckets' mean, count, min, max and a rolling mean weighted by count over the
+    last `window` buckets with scores. Metrics with more than max_points buckets are downsampled
+    with LTTB on the mean, "buckets_total" keeps the full count.
+    """
+    if window < 1:
+        raise ValueError("window must be at least 1")
+    if max_points < 3:
+        raise ValueError("max_points must be at least 3")
+
+    selected = np.flatnonzero(rows) if rows is not None else np.arange(len(columns["timestamp"]))
+    selected = selected[~np.isnat(columns["timestamp"][selected])]
+    keys, groups = np.unique(bucket_starts(columns["timestamp"][selected], bucket), return_inverse=True)
+    scores = columns["scores"][selected]
+
+    result = {}
+    for m, metric in enumerate(columns["metrics"]):
+        scored = ~np.isnan(scores[:, m])
+        if not scored.any():
+            continue
+        metric_groups, values = groups[scored], scores[scored, m].astype(np.float64)
+        counts = np.bincount(metric_groups, minlength=len(keys))
+        sums = np.bincount(metric_groups, weights=values, minlength=len(keys))
+        minimum = np.full(len(keys), np.inf)
+        maximum = np.full(len(keys), -np.inf)
+        np.minimum.at(minimum, metric_groups, values)
+        np.maximum.at(maximum, metric_groups, values)
+
+        present = counts > 0
+        counts, sums, minimum, maximum, starts = counts[present], sums[present], minimum[present], maximum[present], keys[present]
+        mean = sums / counts
+        running_sums, running_counts = np.cumsum(sums), np.cumsum(counts)
+        running_sums[window:] -= running_sums[:-window].copy()
+        running_counts[window:] -= running_counts[:-window].copy()
+        rolling = running_sums / running_counts
+
+        kept = lttb(starts.astype(np.int64), mean, max_points)
+        series = {
+            "buckets": [str(day) for day in starts[kept]],
+            "mean": _numbers(mean[kept]),
+            "count": counts[kept].tolist(),
+            "min": _numbers(minimum[kept]),
+            "max": _numbers(maximum[kept]),
+            "rolling_mean": _numbers(rolling[kept]),
+            "buckets_total": int(len(starts)),
+        }
+        result[metric] = {
+            **series,
+            **chart_entry(
+                "trend_buckets", charts, metric_name=metric, bucket=bucket,
+                buckets=series["buckets"], means=series["mean"], rolling=series["rolling_mean"],
+            ),
+        }
+    return result
+
+
+def _numbers(values: np.ndarray) -> list:
+    return np.round(values, 4).tolist()
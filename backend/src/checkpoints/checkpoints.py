@@ -0,0 +1,134 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import tempfile
+import logging
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_DIR = os.getenv("CHECKPOINT_DIR", "./checkpoints")
+CHECKPOINTS_ENABLED = os.getenv("CHECKPOINTS_ENABLED", "1") == "1"
+# checkpoints unused for longer than this are deleted, in seconds (default 7 days)
+CHECKPOINT_MAX_AGE = int(os.getenv("CHECKPOINT_MAX_AGE", str(7 * 24 * 3600)))
+# total size of the checkpoint directory, least recently used checkpoints are deleted past it
+CHECKPOINT_MAX_BYTES = int(os.getenv("CHECKPOINT_MAX_BYTES", str(1024 * 1024 * 1024)))
+# the directory is scanned for expired checkpoints at most this often, in seconds
+CHECKPOINT_PRUNE_INTERVAL = 60
+# bump when a stage's output format changes so old checkpoints are ignored
+CHECKPOINT_FORMAT = "1"
+
+
+def audio_digest(filepath: str) -> str:
+    """ SHA-256 of the uploaded file's bytes, read in chunks """
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def stage_key(*parts: str) -> str:
+    """ Key of a stage output from the audio digest and the model versions that produced it """
+    return hashlib.sha256("\0".join((CHECKPOINT_FORMAT,) + tuple(str(part) for part in parts)).encode("utf-8")).hexdigest()
+
+
+class CheckpointStore:
+    """
+    Content-addressed store of pipeline stage outputs, one JSON file per stage and key.
+    A retried or duplicate upload finds the finished stages here and resumes after the last one.
+
+    A checkpoint's mtime is its last use: loading one touches it, and saves prune the directory by
+    age and then least recently used first down to max_bytes.
+    """
+
+    def __init__(self, root: str = CHECKPOINT_DIR, enabled: bool = CHECKPOINTS_ENABLED, max_age: int = CHECKPOINT_MAX_AGE, max_bytes: int = CHECKPOINT_MAX_BYTES):
+        self.root = root
+        self.enabled = enabled
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.last_prune = 0.0
+        self.prune_lock = threading.Lock()
+
+    def _path(self, stage: str, key: str) -> str:
+        return os.path.join(self.root, stage, key[:2], f"{key}.json")
+
+    def load(self, stage: str, key: str):
+        if not self.enabled or key is None:
+            return None
+        path = self._path(stage, key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.max_age:
+                return None
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+            os.utime(path)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+        logger.info("resuming from %s checkpoint %s", stage, key[:12])
+        return value
+
+    def save(self, stage: str, key: str, value):
+        if not self.enabled or key is None:
+            return
+        path = self._path(stage, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # write to a temp file and rename so readers never see a half written checkpoint
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(value, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._maybe_prune()
+
+    def _maybe_prune(self):
+        now = time.time()
+        with self.prune_lock:
+            if now - self.last_prune < CHECKPOINT_PRUNE_INTERVAL:
+                return
+            self.last_prune = now
+        try:
+            self.prune(now)
+        except OSError as e:
+            logger.warning("failed to prune checkpoints in %s: %s", self.root, e)
+
+    def prune(self, now: float = None) -> int:
+        """ Delete expired checkpoints, then the least recently used ones until the directory fits max_bytes """
+        now = now or time.time()
+        files = []
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+
+        removed = 0
+        total = sum(size for _, size, _ in files)
+        for mtime, size, path in sorted(files):
+            if now - mtime <= self.max_age and total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        if removed:
+            logger.info("pruned %d checkpoints from %s", removed, self.root)
+        return removed
+
+
+# shared process-wide store
+checkpoints = CheckpointStore()
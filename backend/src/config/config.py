@@ -0,0 +1,93 @@
+import os
+import json
+import string
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+CONFIG_DIR = os.getenv("CONFIG_DIR", os.path.join(os.path.dirname(__file__), "../../configs"))
+METRICS_PATH = os.path.join(CONFIG_DIR, "metrics.json")
+PROMPTS_PATH = os.path.join(CONFIG_DIR, "prompts.json")
+
+# placeholders each prompt template must provide, checked once when the file is loaded
+TEMPLATE_FIELDS = {
+    "template": {"transcription", "metrics", "user_prompt"},
+    # map prompt of the chunked evaluation, one per window of a long call
+    "chunk_template": {"transcription", "metrics", "user_prompt", "part", "parts"},
+    # reduce prompt that writes the final reasons and summary from the per-window results
+    "reduce_template": {"metrics", "user_prompt", "scores", "notes"},
+}
+
+
+def parse_metrics(data: dict) -> dict:
+    """ Keep the rubrics as-is and pre-join each rubric's metric names for the prompt """
+    return {
+        "metrics": data,
+        "metric_names": {name: ", ".join(rubric.keys()) for name, rubric in data.items()},
+    }
+
+
+def parse_prompts(data: dict) -> dict:
+    """ Check every template's placeholders and that it formats, so bad edits fail here and not per request """
+    for name, fields in TEMPLATE_FIELDS.items():
+        if name not in data:
+            raise ValueError(f"prompts.json is missing the '{name}' template")
+        template = data[name]
+        found = {field for _, field, _, _ in string.Formatter().parse(template) if field}
+        if found != fields:
+            raise ValueError(f"Template '{name}' has placeholders {sorted(found)}, expected {sorted(fields)}")
+        template.format(**{field: "" for field in fields})
+    return data
+
+
+class ConfigFile:
+    """
+    A JSON config file parsed once and kept in memory, reloaded only when its mtime changes.
+    If a reload fails the last good version keeps being served.
+    """
+
+    def __init__(self, path: str, parse):
+        self.path = path
+        self.parse = parse
+        self.mtime = None
+        self.value = None
+        self.lock = threading.Lock()
+
+    def get(self):
+        mtime = os.stat(self.path).st_mtime_ns
+        if mtime == self.mtime:
+            return self.value
+
+        with self.lock:
+            if mtime != self.mtime:
+                try:
+                    with open(self.path, "r", encoding="utf-8") as f:
+                        value = self.parse(json.load(f))
+                except Exception as e:
+                    if self.value is None:
+                        raise RuntimeError(f"Failed to load {self.path}: {e}")
+                    logger.warning("keeping previous %s, reload failed: %s", os.path.basename(self.path), e)
+                    return self.value
+
+                logger.info("loaded %s", os.path.basename(self.path))
+                self.value = value
+                self.mtime = mtime
+
+        return self.value
+
+
+metrics_config = ConfigFile(METRICS_PATH, parse_metrics)
+prompts_config = ConfigFile(PROMPTS_PATH, parse_prompts)
+
+
+def get_metrics() -> dict:
+    return metrics_config.get()["metrics"]
+
+
+def get_metric_names(metric_name: str) -> str:
+    return metrics_config.get()["metric_names"][metric_name]
+
+
+def get_prompt_template(name: str = "template") -> str:
+    return prompts_config.get()[name]
@@ -0,0 +1,114 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Optional
+
+LLM_CACHE_DB = os.getenv("LLM_CACHE_DB", "./cache/llm_cache.db")
+# entries older than this are never served, in seconds (default 30 days)
+LLM_CACHE_MAX_AGE = int(os.getenv("LLM_CACHE_MAX_AGE", str(30 * 24 * 3600)))
+# total size of cached answers, least recently used entries are evicted past it
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") == "1"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_cache (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_llm_cache_last_access ON llm_cache(last_access);
+"""
+
+
+def cache_key(prompt: str, model: str, options: Optional[dict]) -> str:
+    """ Hash of everything that decides the model's answer """
+    payload = json.dumps([prompt, model, options or {}], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class EvaluationCache:
+    """
+    Disk-backed cache of LLM answers keyed by prompt, model and options.
+    Survives restarts, so replays of the same transcripts return without calling the model.
+    """
+
+    def __init__(self, path: str = LLM_CACHE_DB, max_age: int = LLM_CACHE_MAX_AGE, max_bytes: int = LLM_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.local = threading.local()
+        self.stats_lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            self.local.conn = conn
+        return conn
+
+    def _count(self, key: str, value: int = 1):
+        with self.stats_lock:
+            self.stats[key] += value
+
+    def get(self, key: str) -> Optional[str]:
+        conn = self._connect()
+        now = time.time()
+        row = conn.execute("SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+        if row is None or now - row[1] > self.max_age:
+            self._count("misses")
+            return None
+
+        conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+        self._count("hits")
+        return row[0]
+
+    def put(self, key: str, value: str):
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, size, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value.encode("utf-8")), now, now),
+            )
+            evicted = self._evict(conn, now)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self._count("writes")
+        self._count("evictions", evicted)
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> int:
+        evicted = conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.max_age,)).rowcount
+
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return evicted
+
+        # drop least recently used entries until the cache fits again
+        for key, size in conn.execute("SELECT key, size FROM llm_cache ORDER BY last_access").fetchall():
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+        return evicted
+
+    def report(self) -> dict:
+        entries, size = self._connect().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+        with self.stats_lock:
+            return {"enabled": LLM_CACHE_ENABLED, "entries": entries, "bytes": size, **self.stats}
+
+
+# shared process-wide cache
+evaluation_cache = EvaluationCache()
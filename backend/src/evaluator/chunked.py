@@ -0,0 +1,158 @@
+import os
+import json
+import logging
+import asyncio
+from src.evaluator.evaluator import evaluate_transcription_quality_async, default_options, OLLAMA_MAX_INFLIGHT
+from src.prompts.prompts import chunk_transcription, build_chunk_prompts, build_reduce_prompt
+
+logger = logging.getLogger(__name__)
+
+# "single" sends the whole call in one prompt, "chunked" always map-reduces over windows of the call,
+# "auto" map-reduces only calls that don't fit in one window
+EVAL_MODE = os.getenv("EVAL_MODE", "auto")
+# longest transcription window sent in one prompt, about 4 characters per token
+EVAL_CHUNK_CHARS = int(os.getenv("EVAL_CHUNK_CHARS", "10000"))
+# characters of trailing turns repeated at the start of the next window
+EVAL_CHUNK_OVERLAP = int(os.getenv("EVAL_CHUNK_OVERLAP", "1000"))
+# windows of one call scored at once, the client's in-flight limit still applies on top
+EVAL_CHUNK_CONCURRENCY = int(os.getenv("EVAL_CHUNK_CONCURRENCY", str(OLLAMA_MAX_INFLIGHT)))
+# tokens kept free in the context window for the model's answer
+EVAL_ANSWER_TOKENS = int(os.getenv("EVAL_ANSWER_TOKENS", "1024"))
+# conservative characters per token when sizing the context window for a prompt
+CHARS_PER_TOKEN = 3
+
+
+def evaluation_mode(transcription: str, mode: str = None) -> str:
+    """ "single" or "chunked" for this transcription """
+    mode = mode or EVAL_MODE
+    if mode == "auto":
+        return "chunked" if len(transcription) > EVAL_CHUNK_CHARS else "single"
+    if mode not in ("single", "chunked"):
+        raise ValueError(f"Unknown evaluation mode: '{mode}'")
+    return mode
+
+
+def context_options(prompt: str) -> dict:
+    """
+    Model options with a context window that holds the whole prompt and the answer.
+
+    Ollama silently drops the start of a prompt longer than its context window, so evaluation
+    requests never rely on the server's default size.
+    """
+    needed = len(prompt) // CHARS_PER_TOKEN + EVAL_ANSWER_TOKENS
+    # rounded up to 1024 so prompts of similar length share the loaded model's context
+    needed = -(-needed // 1024) * 1024
+    options = dict(default_options() or {})
+    if options.get("num_ctx", 0) < needed:
+        if "num_ctx" in options:
+            logger.warning("OLLAMA_NUM_CTX=%d is too small for a %d character prompt, using %d", options["num_ctx"], len(prompt), needed)
+        options["num_ctx"] = needed
+    return options
+
+
+def parse_feedback(feedback) -> dict:
+    """ The model's answer as a dict with a report list, None when it failed or didn't parse """
+    if not isinstance(feedback, str):
+        return None
+    try:
+        value = json.loads(feedback)
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(value, dict) or not isinstance(value.get("report"), list):
+        return None
+    return value
+
+
+def merge_scores(parts) -> dict:
+    """
+    Merge the per-window reports into one score per metric, weighted by window length.
+
+    Args:
+        parts (list of tuple): (part number, window length, parsed answer)
+
+    Returns:
+        dict: metric -> (score, [(part number, reason)]), metrics in first-seen order
+    """
+    totals = {}
+    for part, weight, answer in parts:
+        for row in answer["report"]:
+            if not isinstance(row, list) or len(row) < 2:
+                continue
+            try:
+                score = float(row[1])
+            except (TypeError, ValueError):
+                continue
+            total = totals.setdefault(str(row[0]), [0.0, 0, []])
+            total[0] += score * weight
+            total[1] += weight
+            if len(row) > 2 and row[2]:
+                total[2].append((part, str(row[2])))
+
+    return {metric: (round(total / weight, 1), reasons) for metric, (total, weight, reasons) in totals.items()}
+
+
+async def evaluate_chunked_async(transcription: str, user_prompt: str, metric_name: str, use_cache: bool = True) -> dict:
+    """
+    Map-reduce evaluation of a long call.
+
+    The transcription is cut into overlapping windows on speaker-turn boundaries and every window
+    is scored against the rubric concurrently. The scores are merged per metric and a final reduce
+    prompt writes one reason per metric and the summary, giving the same report/summary shape as a
+    single prompt, plus "prompts": every prompt sent, the windows' first and the reduce prompt last.
+    """
+    windows = chunk_transcription(transcription, EVAL_CHUNK_CHARS, EVAL_CHUNK_OVERLAP)
+    prompts = build_chunk_prompts(windows, user_prompt, metric_name)
+
+    logger.info("Evaluating %d windows of the transcription, %d at a time", len(windows), EVAL_CHUNK_CONCURRENCY)
+
+    semaphore = asyncio.Semaphore(EVAL_CHUNK_CONCURRENCY)
+
+    async def score(prompt):
+        async with semaphore:
+            return await evaluate_transcription_quality_async(prompt, use_cache=use_cache, options=context_options(prompt))
+
+    answers = await asyncio.gather(*(score(prompt) for prompt in prompts))
+    parts = [(i + 1, len(windows[i]), parse_feedback(answer)) for i, answer in enumerate(answers)]
+    parts = [part for part in parts if part[2] is not None]
+    if len(parts) < len(windows):
+        logger.warning("%d of %d windows could not be scored", len(windows) - len(parts), len(windows))
+    if not parts:
+        return {
+            "report": "Evaluation failed: no part of the conversation could be scored",
+            "summary": "N/A",
+            "prompts": prompts,
+        }
+
+    merged = merge_scores(parts)
+    scores_text = "\n".join(
+        f"- {metric}: {score}" + "".join(f"\n  part {part}: {reason}" for part, reason in reasons)
+        for metric, (score, reasons) in merged.items()
+    )
+    notes = [(part, str(answer.get("notes", "")).strip()) for part, _, answer in parts]
+    notes_text = "\n".join(f"Part {part}: {text}" for part, text in notes if text)
+
+    reduce_prompt = build_reduce_prompt(scores_text, notes_text, user_prompt, metric_name)
+    final = parse_feedback(await evaluate_transcription_quality_async(
+        reduce_prompt,
+        use_cache=use_cache,
+        options=context_options(reduce_prompt),
+    )) or {}
+
+    # the merged scores are kept even if the reduce pass changed them, its reasons and summary are used when present
+    reasons = {
+        str(row[0]): str(row[2])
+        for row in final.get("report", [])
+        if isinstance(row, list) and len(row) > 2 and row[2]
+    }
+    report = [
+        [metric, score, reasons.get(metric) or " ".join(dict.fromkeys(reason for _, reason in part_reasons))]
+        for metric, (score, part_reasons) in merged.items()
+    ]
+    summary = final.get("summary") or " ".join(text for _, text in notes if text) or "N/A"
+
+    return {"report": report, "summary": summary, "prompts": prompts + [reduce_prompt]}
+
+
+def evaluate_chunked(transcription: str, user_prompt: str, metric_name: str, use_cache: bool = True) -> dict:
+    """ Blocking evaluate_chunked_async for the job worker threads """
+    return asyncio.run(evaluate_chunked_async(transcription, user_prompt, metric_name, use_cache))
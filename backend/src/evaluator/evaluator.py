@@ -1,35 +1,269 @@
 import os
-from ollama import Client
+import json
+import logging
+import time
+import asyncio
+import threading
+import httpx
+from ollama import AsyncClient
+from src.evaluator.cache import evaluation_cache, cache_key, LLM_CACHE_ENABLED
+from src.telemetry.telemetry import span, counter, gauge, histogram
 
-client = Client(host=os.getenv("OLLAMA_HOST", "http://localhost:11434"))
+logger = logging.getLogger(__name__)
 
-def evaluate_transcription_quality(prompt: str) -> dict:
+OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "mistral")
+# how long ollama keeps the model in memory after a request, avoids reloading it between jobs
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+# context window in tokens, unset keeps the server's default
+OLLAMA_NUM_CTX = os.getenv("OLLAMA_NUM_CTX")
+# requests allowed in flight to the ollama server at once, the rest wait for a slot
+OLLAMA_MAX_INFLIGHT = int(os.getenv("OLLAMA_MAX_INFLIGHT", "2"))
+# forward tokens as they are generated instead of waiting for the whole answer
+OLLAMA_STREAM = os.getenv("OLLAMA_STREAM", "0") == "1"
+
+llm_requests = counter("llm_requests_total", "Chat requests sent to ollama, by outcome", ("status",))
+llm_prompt_tokens = counter("llm_prompt_tokens_total", "Prompt tokens evaluated by ollama")
+llm_completion_tokens = counter("llm_completion_tokens_total", "Tokens generated by ollama")
+llm_tokens_per_second = gauge("llm_tokens_per_second", "Generation speed of the last finished request")
+llm_time_to_first_token = histogram("llm_time_to_first_token_seconds", "Time from sending a streamed request to its first token")
+llm_cache_hits = counter("llm_cache_hits_total", "Evaluations answered from the cache without calling ollama")
+
+
+class OllamaEvaluator:
+    """
+    Async ollama client shared by the whole process.
+
+    The client, its pooled HTTP connections and the in-flight limit live on one background event
+    loop, so request handlers (async) and job workers (threads) all share the same pool and limit.
+    """
+
+    def __init__(self, host: str = OLLAMA_HOST, max_inflight: int = OLLAMA_MAX_INFLIGHT):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="ollama-client", daemon=True)
+        self.thread.start()
+
+        limits = httpx.Limits(max_connections=max_inflight, max_keepalive_connections=max_inflight)
+        self.client = AsyncClient(host=host, limits=limits)
+        self.max_inflight = max_inflight
+        self.semaphore = None
+        self.stats_lock = threading.Lock()
+        self.stats = {
+            "requests": 0,
+            "failures": 0,
+            "in_flight": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "last_time_to_first_token": None,
+            "last_tokens_per_second": None,
+        }
+
+    def _count(self, **changes):
+        with self.stats_lock:
+            for key, value in changes.items():
+                if key.startswith("last_"):
+                    self.stats[key] = value
+                else:
+                    self.stats[key] += value
+
+    async def _chat(self, prompt: str, model: str, options: dict, stream: bool, on_token) -> str:
+        if self.semaphore is None:
+            # created lazily so it belongs to the client loop
+            self.semaphore = asyncio.Semaphore(self.max_inflight)
+
+        async with self.semaphore:
+            self._count(in_flight=1)
+            start = time.perf_counter()
+            status = "failed"
+            try:
+                if not stream:
+                    response = await self.client.chat(
+                        model=model,
+                        messages=[{"role": "user", "content": prompt}],
+                        options=options,
+                        keep_alive=OLLAMA_KEEP_ALIVE,
+                    )
+                    self._count_tokens(response)
+                    status = "done"
+                    return response['message']['content']
+
+                parts = []
+                async for chunk in await self.client.chat(
+                    model=model,
+                    messages=[{"role": "user", "content": prompt}],
+                    options=options,
+                    keep_alive=OLLAMA_KEEP_ALIVE,
+                    stream=True,
+                ):
+                    token = chunk['message']['content']
+                    if token and not parts:
+                        first_token = time.perf_counter() - start
+                        llm_time_to_first_token.observe(first_token)
+                        self._count(last_time_to_first_token=round(first_token, 3))
+                    if token:
+                        parts.append(token)
+                        if on_token is not None:
+                            on_token(token)
+                    if chunk.get('done'):
+                        self._count_tokens(chunk)
+                status = "done"
+                return "".join(parts)
+            finally:
+                self._count(in_flight=-1, requests=1)
+                llm_requests.inc(status=status)
+
+    def _count_tokens(self, response):
+        prompt_tokens = response.get('prompt_eval_count') or 0
+        completion_tokens = response.get('eval_count') or 0
+        eval_seconds = (response.get('eval_duration') or 0) / 1e9
+        tokens_per_second = completion_tokens / eval_seconds if eval_seconds else None
+        self._count(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            last_tokens_per_second=round(tokens_per_second, 1) if tokens_per_second else None,
+        )
+        llm_prompt_tokens.inc(prompt_tokens)
+        llm_completion_tokens.inc(completion_tokens)
+        if tokens_per_second:
+            llm_tokens_per_second.set(tokens_per_second)
+
+    def submit(self, prompt: str, model: str = None, options: dict = None, stream: bool = None, on_token=None):
+        """ Schedule a chat on the client loop, returns a concurrent.futures.Future with the answer """
+        options = default_options() if options is None else options
+        coro = self._chat(prompt, model or OLLAMA_MODEL, options, OLLAMA_STREAM if stream is None else stream, on_token)
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def report(self) -> dict:
+        with self.stats_lock:
+            return {"model": OLLAMA_MODEL, "max_inflight": self.max_inflight, **self.stats}
+
+
+def default_options() -> dict:
+    return {"num_ctx": int(OLLAMA_NUM_CTX)} if OLLAMA_NUM_CTX else None
+
+
+# shared process-wide client
+evaluator = OllamaEvaluator()
+
+gauge("llm_in_flight", "Chat requests being generated by ollama", callback=lambda: evaluator.report()["in_flight"])
+
+
+def _cached(prompt: str, use_cache: bool, options: dict = None):
+    """ (cache key, cached answer) for the prompt, the key is None when caching is off for this request """
+    if not (use_cache and LLM_CACHE_ENABLED):
+        return None, None
+    key = cache_key(prompt, OLLAMA_MODEL, default_options() if options is None else options)
+    cached = evaluation_cache.get(key)
+    if cached is not None:
+        llm_cache_hits.inc()
+    return key, cached
+
+
+def _remember(key: str, feedback: str):
+    # only keep answers that parse, a retry of a malformed one should ask the model again
+    if key is None:
+        return
+    try:
+        json.loads(feedback)
+    except json.JSONDecodeError:
+        return
+    try:
+        evaluation_cache.put(key, feedback)
+    except Exception as e:
+        # a cache write problem must never fail the evaluation itself
+        logger.warning("failed to cache evaluation: %s", e)
+
+
+def _failed(e: Exception) -> dict:
+    evaluator._count(failures=1)
+    return {
+        "report": f"Evaluation failed: {str(e)}",
+        "summary": "N/A"
+    }
+
+
+def evaluate_transcription_quality(prompt: str, stream: bool = None, on_token=None, use_cache: bool = True, options: dict = None) -> dict:
     """
     Evaluate a transcription-related prompt using a local LLM (via Ollama).
     Assumes the input 'prompt' includes both the system and user instructions.
+    Answers are cached on disk by prompt, model and options unless use_cache is False.
+    options replace the default model options.
     """
-    print("-----------------------")
-    print(f"Log: evaluating transcription: {prompt}")
-    print("-----------------------")
+    logger.info("Evaluating transcription (%d chars)", len(prompt))
 
+    key, cached = _cached(prompt, use_cache, options)
+    if cached is not None:
+        logger.info("Evaluation served from cache")
+        if on_token is not None:
+            on_token(cached)
+        return cached
 
     try:
-        response = client.chat(
-            model='mistral',
-            messages=[{"role": "user", "content": prompt}]
-        )
-        feedback = response['message']['content'].strip()
+        with span("llm"):
+            feedback = evaluator.submit(prompt, options=options, stream=stream, on_token=on_token).result().strip()
+        _remember(key, feedback)
 
+        logger.info("Completed evaluation of prompts_payload")
 
-        print("-----------------------")
-        print("Log: completed evaluation of prompts_payload")
-        print("-----------------------")
-  
         return feedback
 
+    except Exception as e:
+        return _failed(e)
+
+
+async def evaluate_transcription_quality_async(prompt: str, stream: bool = None, on_token=None, use_cache: bool = True, options: dict = None) -> dict:
+    """
+    Same as evaluate_transcription_quality but awaitable, so the caller's event loop keeps serving
+    other requests while the model is generating. options replace the default model options.
+    """
+    logger.info("Evaluating transcription (%d chars)", len(prompt))
+
+    key, cached = _cached(prompt, use_cache, options)
+    if cached is not None:
+        logger.info("Evaluation served from cache")
+        if on_token is not None:
+            on_token(cached)
+        return cached
+
+    try:
+        with span("llm"):
+            feedback = (await asyncio.wrap_future(evaluator.submit(prompt, options=options, stream=stream, on_token=on_token))).strip()
+        _remember(key, feedback)
+
+        logger.info("Completed evaluation of prompts_payload")
+
+        return feedback
 
     except Exception as e:
-        return {
-            "report": f"Evaluation failed: {str(e)}",
-            "summary": "N/A"
-        }
+        return _failed(e)
+
+
+async def stream_transcription_quality(prompt: str, use_cache: bool = True):
+    """ Yield the evaluation token by token as ollama generates it """
+    key, cached = _cached(prompt, use_cache)
+    if cached is not None:
+        yield cached
+        return
+
+    loop = asyncio.get_running_loop()
+    tokens = asyncio.Queue()
+
+    def on_token(token):
+        # called on the client loop, hand the token over to the caller's loop
+        loop.call_soon_threadsafe(tokens.put_nowait, token)
+
+    future = asyncio.wrap_future(evaluator.submit(prompt, stream=True, on_token=on_token))
+    future.add_done_callback(lambda _: tokens.put_nowait(None))
+
+    while True:
+        token = await tokens.get()
+        if token is None:
+            break
+        yield token
+
+    # surface errors from the request once the tokens are drained
+    _remember(key, (await future).strip())
+
+
+def get_evaluator_stats() -> dict:
+    return {**evaluator.report(), "cache": evaluation_cache.report()}
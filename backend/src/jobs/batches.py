@@ -0,0 +1,195 @@
+import os
+import json
+import logging
+import uuid
+import asyncio
+import sqlite3
+import datetime
+import threading
+from typing import Optional
+from fastapi import HTTPException
+
+logger = logging.getLogger(__name__)
+
+BATCH_DB = os.getenv("BATCH_DB", "./batches/batches.db")
+# items of one batch evaluated at once, the LLM client's in-flight limit still applies on top
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+# largest batch accepted in one request
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "10000"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS batches (
+    batch_id TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    use_cache INTEGER NOT NULL,
+    total INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS batch_items (
+    batch_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    item TEXT NOT NULL,
+    status TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    finished_at TEXT,
+    PRIMARY KEY (batch_id, idx)
+);
+"""
+
+
+class BatchStore:
+    """
+    Batches and the outcome of every item, kept in sqlite so an interrupted batch can be resumed.
+    Items are "pending" until they finish as "done" (with their result) or "failed" (with the error).
+    """
+
+    def __init__(self, path: str = BATCH_DB):
+        self.path = path
+        self.local = threading.local()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            self.local.conn = conn
+        return conn
+
+    def create(self, items: list, use_cache: bool) -> str:
+        batch_id = str(uuid.uuid4())
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT INTO batches (batch_id, created_at, use_cache, total) VALUES (?, ?, ?, ?)",
+                (batch_id, datetime.datetime.now().isoformat(), int(use_cache), len(items)),
+            )
+            conn.executemany(
+                "INSERT INTO batch_items (batch_id, idx, item, status) VALUES (?, ?, ?, 'pending')",
+                ((batch_id, i, json.dumps(item, ensure_ascii=False)) for i, item in enumerate(items)),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return batch_id
+
+    def get(self, batch_id: str) -> Optional[dict]:
+        row = self._connect().execute(
+            "SELECT batch_id, created_at, use_cache, total FROM batches WHERE batch_id = ?", (batch_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {"batch_id": row[0], "created_at": row[1], "use_cache": bool(row[2]), "total": row[3]}
+
+    def items(self, batch_id: str) -> list:
+        """ (index, item, status, result, error) for every item, in submission order """
+        rows = self._connect().execute(
+            "SELECT idx, item, status, result, error FROM batch_items WHERE batch_id = ? ORDER BY idx", (batch_id,)
+        ).fetchall()
+        return [
+            (idx, json.loads(item), status, json.loads(result) if result is not None else None, error)
+            for idx, item, status, result, error in rows
+        ]
+
+    def finish(self, batch_id: str, idx: int, status: str, result=None, error: str = None):
+        self._connect().execute(
+            "UPDATE batch_items SET status = ?, result = ?, error = ?, finished_at = ? WHERE batch_id = ? AND idx = ?",
+            (
+                status,
+                json.dumps(result, ensure_ascii=False) if result is not None else None,
+                error,
+                datetime.datetime.now().isoformat(),
+                batch_id,
+                idx,
+            ),
+        )
+
+    def counts(self, batch_id: str) -> dict:
+        counts = {"pending": 0, "done": 0, "failed": 0}
+        rows = self._connect().execute(
+            "SELECT status, COUNT(*) FROM batch_items WHERE batch_id = ? GROUP BY status", (batch_id,)
+        ).fetchall()
+        counts.update(dict(rows))
+        return counts
+
+
+# shared process-wide store
+batch_store = BatchStore()
+
+
+def create_batch(items: list, use_cache: bool = True) -> str:
+    if not items:
+        raise HTTPException(status_code=400, detail="A batch needs at least one item.")
+    if len(items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"A batch holds at most {BATCH_MAX_ITEMS} items.")
+    return batch_store.create(items, use_cache)
+
+
+def get_batch_status(batch_id: str) -> dict:
+    batch = batch_store.get(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail=f"Unknown batch_id: {batch_id}")
+    return {**batch, **batch_store.counts(batch_id)}
+
+
+async def run_batch(batch_id: str, evaluate, concurrency: int = BATCH_CONCURRENCY, prepare=None):
+    """
+    Evaluate a batch's unfinished items and yield one event dict per item as it finishes.
+
+    Items already done are replayed first from the store, then pending and failed items are
+    evaluated by `concurrency` workers calling `await evaluate(item, use_cache)`. An item that
+    raises is recorded as failed and the batch carries on. Every outcome is written before it is
+    yielded, so if the client goes away the batch can be resumed where it stopped.
+
+    prepare, when given, is called in a worker thread with the items about to be evaluated before
+    the workers start, for work the items share.
+    """
+    batch = get_batch_status(batch_id)
+    rows = await asyncio.to_thread(batch_store.items, batch_id)
+    yield {"batch_id": batch_id, "total": batch["total"], "done": batch["done"]}
+
+    todo = asyncio.Queue()
+    for idx, item, status, result, error in rows:
+        if status == "done":
+            yield {"batch_id": batch_id, "index": idx, "id": item.get("id"), "status": "done", "result": result, "replayed": True}
+        else:
+            todo.put_nowait((idx, item))
+
+    pending = todo.qsize()
+    finished = asyncio.Queue()
+
+    if prepare is not None and pending:
+        try:
+            await asyncio.to_thread(prepare, [item for _, item, status, _, _ in rows if status != "done"])
+        except Exception as e:
+            # only a head start, every item still does its own work
+            logger.warning("failed to prepare batch %s: %s", batch_id, e)
+
+    async def worker():
+        while not todo.empty():
+            idx, item = todo.get_nowait()
+            event = {"batch_id": batch_id, "index": idx, "id": item.get("id")}
+            try:
+                event.update(status="done", result=await evaluate(item, batch["use_cache"]))
+            except Exception as e:
+                event.update(status="failed", error=e.detail if isinstance(e, HTTPException) else str(e))
+            try:
+                await asyncio.to_thread(batch_store.finish, batch_id, idx, event["status"], event.get("result"), event.get("error"))
+            except Exception as e:
+                # the item stays pending and is evaluated again on resume
+                logger.warning("failed to record batch %s item %d: %s", batch_id, idx, e)
+            await finished.put(event)
+
+    workers = [asyncio.create_task(worker()) for _ in range(min(max(concurrency, 1), pending))]
+    try:
+        for _ in range(pending):
+            yield await finished.get()
+    finally:
+        # the client disconnected or the batch is over, unfinished items stay pending for a resume
+        for task in workers:
+            task.cancel()
+
+    yield {"batch_id": batch_id, "summary": await asyncio.to_thread(batch_store.counts, batch_id)}
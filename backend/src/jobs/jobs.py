@@ -0,0 +1,139 @@
+import os
+import threading
+import uuid
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException
+from src.telemetry.telemetry import job_context, get_job_timings, gauge, counter
+
+# number of pipelines that may run at once, the rest wait in the queue. Each job works in its own
+# scratch directory and model calls are serialized per model, so jobs overlap across stages
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+# maximum number of jobs waiting for a worker before submissions are rejected
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "32"))
+# number of finished jobs kept around so clients can still fetch their results
+JOB_HISTORY = int(os.getenv("JOB_HISTORY", "1000"))
+
+
+class JobQueue:
+    """
+    Bounded background worker pool that runs long pipelines off the request thread.
+
+    Each job is a callable taking (job_id, progress). The callable reports its
+    stage with progress(stage, fraction) and returns the job result.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, queue_size: int = JOB_QUEUE_SIZE, history: int = JOB_HISTORY):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job-worker")
+        self.queue_size = queue_size
+        self.history = history
+        self.jobs = {}
+        self.finished = []
+        self.lock = threading.Lock()
+
+    def submit(self, run, cleanup=None, job_id: str = None) -> str:
+        job_id = job_id or str(uuid.uuid4())
+
+        with self.lock:
+            queued = sum(1 for job in self.jobs.values() if job["started_at"] is None)
+            if queued >= self.queue_size:
+                raise HTTPException(status_code=503, detail="Job queue is full, try again later.")
+
+            self.jobs[job_id] = {
+                "job_id": job_id,
+                "status": "queued",
+                "progress": {},
+                "submitted_at": datetime.datetime.now().isoformat(),
+                "started_at": None,
+                "finished_at": None,
+                "error": None,
+                "result": None,
+            }
+
+        self.executor.submit(self._run, job_id, run, cleanup)
+        return job_id
+
+    def _update(self, job_id: str, **fields):
+        with self.lock:
+            self.jobs[job_id].update(fields)
+
+    def _progress(self, job_id: str, stage: str, fraction: float):
+        with self.lock:
+            job = self.jobs[job_id]
+            job["status"] = stage
+            job["progress"][stage] = round(min(max(fraction, 0.0), 1.0), 3)
+
+    def _run(self, job_id: str, run, cleanup):
+        self._update(job_id, started_at=datetime.datetime.now().isoformat())
+        try:
+            with job_context(job_id):
+                result = run(job_id, lambda stage, fraction: self._progress(job_id, stage, fraction))
+            self._update(job_id, status="done", result=result)
+            jobs_finished.inc(status="done")
+        except Exception as e:
+            detail = e.detail if isinstance(e, HTTPException) else str(e)
+            self._update(job_id, status="failed", error=detail)
+            jobs_finished.inc(status="failed")
+        finally:
+            if cleanup is not None:
+                cleanup()
+            self._update(job_id, finished_at=datetime.datetime.now().isoformat())
+            self._forget_old(job_id)
+
+    def _forget_old(self, job_id: str):
+        # keep memory bounded by dropping the oldest finished jobs
+        with self.lock:
+            self.finished.append(job_id)
+            while len(self.finished) > self.history:
+                self.jobs.pop(self.finished.pop(0), None)
+
+    def status(self, job_id: str) -> dict:
+        with self.lock:
+            if job_id not in self.jobs:
+                raise HTTPException(status_code=404, detail=f"Unknown job_id: {job_id}")
+            job = self.jobs[job_id]
+            status = {key: value for key, value in job.items() if key != "result"}
+            status["progress"] = dict(job["progress"])
+            status["queue_position"] = self._queue_position(job_id) if job["started_at"] is None else None
+        status["timings"] = get_job_timings(job_id)
+        return status
+
+    def depth(self) -> tuple:
+        """ (jobs waiting for a worker, jobs running) """
+        with self.lock:
+            queued = sum(1 for job in self.jobs.values() if job["started_at"] is None)
+            running = sum(1 for job in self.jobs.values() if job["started_at"] is not None and job["finished_at"] is None)
+        return queued, running
+
+    def _queue_position(self, job_id: str) -> int:
+        queued = [key for key, job in self.jobs.items() if job["started_at"] is None]
+        return queued.index(job_id)
+
+    def result(self, job_id: str):
+        with self.lock:
+            if job_id not in self.jobs:
+                raise HTTPException(status_code=404, detail=f"Unknown job_id: {job_id}")
+            job = self.jobs[job_id]
+            if job["status"] == "failed":
+                raise HTTPException(status_code=500, detail=job["error"])
+            return job["status"], job["result"]
+
+
+# shared process-wide queue
+job_queue = JobQueue()
+
+gauge("jobs_queued", "Jobs waiting for a worker", callback=lambda: job_queue.depth()[0])
+gauge("jobs_in_flight", "Jobs being processed by a worker", callback=lambda: job_queue.depth()[1])
+jobs_finished = counter("jobs_finished_total", "Jobs that finished, by outcome", ("status",))
+
+
+def submit_job(run, cleanup=None, job_id: str = None) -> str:
+    return job_queue.submit(run, cleanup, job_id)
+
+
+def get_job_status(job_id: str) -> dict:
+    return job_queue.status(job_id)
+
+
+def get_job_result(job_id: str):
+    return job_queue.result(job_id)
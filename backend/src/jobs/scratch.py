@@ -0,0 +1,28 @@
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+# parent of every per-job scratch directory, the system temp dir when unset
+SCRATCH_DIR = os.getenv("SCRATCH_DIR") or None
+
+
+def make_scratch_dir(prefix: str = "job-") -> str:
+    """ Create a private directory for one job's files, nothing else ever writes into it """
+    if SCRATCH_DIR:
+        os.makedirs(SCRATCH_DIR, exist_ok=True)
+    return tempfile.mkdtemp(prefix=prefix, dir=SCRATCH_DIR)
+
+
+def remove_scratch_dir(path: str):
+    shutil.rmtree(path, ignore_errors=True)
+
+
+@contextmanager
+def scratch_dir(prefix: str = "job-"):
+    """ Scratch directory that is removed when the block exits, also when it raises """
+    path = make_scratch_dir(prefix)
+    try:
+        yield path
+    finally:
+        remove_scratch_dir(path)
@@ -0,0 +1,152 @@
+import os
+import time
+import threading
+import resource
+from dotenv import load_dotenv
+import logging
+
+logger = logging.getLogger(__name__)
+
+# read the Hugging Face token once for the whole process
+load_dotenv()
+
+WHISPER_MODEL = os.getenv("WHISPER_MODEL", "small")
+DIARIZATION_MODEL = os.getenv("DIARIZATION_MODEL", "pyannote/speaker-diarization-3.1")
+SPACY_MODEL = os.getenv("SPACY_MODEL", "en_core_web_sm")
+# keyword extraction only reads POS tags, the dependency parser, NER and lemmatizer are never loaded
+SPACY_EXCLUDE = [name for name in os.getenv("SPACY_EXCLUDE", "parser,ner,lemmatizer").split(",") if name]
+# cpu threads each torch model may use, pinned so parallel jobs don't oversubscribe the machine
+MODEL_THREADS = int(os.getenv("MODEL_THREADS", str(os.cpu_count() or 1)))
+
+
+def _rss_mb() -> float:
+    """ Current resident set size of the process in MB """
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        # ru_maxrss is the peak rather than the current value but is available everywhere
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _pin_torch_threads():
+    import torch
+    torch.set_num_threads(MODEL_THREADS)
+    try:
+        torch.set_num_interop_threads(MODEL_THREADS)
+    except RuntimeError:
+        # can only be set once, before any inter-op work has started
+        pass
+
+
+def _load_whisper():
+    import whisper
+    _pin_torch_threads()
+    return whisper.load_model(WHISPER_MODEL)
+
+
+def _load_diarization():
+    from pyannote.audio import Pipeline
+    _pin_torch_threads()
+    return Pipeline.from_pretrained(DIARIZATION_MODEL, use_auth_token=os.getenv("HUGGING_FACE"))
+
+
+def _load_spacy():
+    import spacy
+    try:
+        return spacy.load(SPACY_MODEL, exclude=SPACY_EXCLUDE)
+    except OSError:
+        # first run on this machine, fetch the package once instead of on every startup
+        spacy.cli.download(SPACY_MODEL)
+        return spacy.load(SPACY_MODEL, exclude=SPACY_EXCLUDE)
+
+
+class ModelRegistry:
+    """
+    Loads each model once on first use and keeps it resident for the life of the process.
+    Records how long every load took and how much memory it added.
+    """
+
+    def __init__(self):
+        self.loaders = {
+            "whisper": (WHISPER_MODEL, _load_whisper),
+            "diarization": (DIARIZATION_MODEL, _load_diarization),
+            "spacy": (SPACY_MODEL, _load_spacy),
+        }
+        self.models = {}
+        self.stats = {}
+        self.locks = {name: threading.Lock() for name in self.loaders}
+        # whisper installs kv-cache hooks on the shared model while decoding, so concurrent jobs
+        # take turns per model call instead of running inference on it at the same time
+        self.inference_locks = {name: threading.Lock() for name in self.loaders}
+
+    def get(self, name: str):
+        if name in self.models:
+            return self.models[name]
+
+        # one lock per model so a slow pyannote load doesn't block whisper
+        with self.locks[name]:
+            if name not in self.models:
+                source, loader = self.loaders[name]
+
+                logger.info("Loading %s model %s", name, source)
+
+                rss_before = _rss_mb()
+                start = time.perf_counter()
+                model = loader()
+                self.stats[name] = {
+                    "source": source,
+                    "load_seconds": round(time.perf_counter() - start, 3),
+                    "rss_delta_mb": round(_rss_mb() - rss_before, 1),
+                    "threads": MODEL_THREADS if name != "spacy" else 1,
+                }
+                self.models[name] = model
+
+        return self.models[name]
+
+    def preload(self):
+        for name in self.loaders:
+            try:
+                self.get(name)
+            except Exception as e:
+                # leave it for the first request to retry, e.g. a missing Hugging Face token
+                logger.warning("failed to preload %s model: %s", name, e)
+
+    def report(self) -> dict:
+        return {
+            "rss_mb": round(_rss_mb(), 1),
+            "models": {
+                name: {"loaded": name in self.models, **self.stats.get(name, {"source": source})}
+                for name, (source, _) in self.loaders.items()
+            },
+        }
+
+
+# shared process-wide registry
+model_registry = ModelRegistry()
+
+
+def get_whisper_model():
+    return model_registry.get("whisper")
+
+
+def get_diarization_pipeline():
+    return model_registry.get("diarization")
+
+
+def get_spacy_pipeline():
+    return model_registry.get("spacy")
+
+
+def model_lock(name: str) -> threading.Lock:
+    """ Lock to hold while running inference on a shared model """
+    return model_registry.inference_locks[name]
+
+
+def preload_models():
+    model_registry.preload()
+
+
+def get_model_stats() -> dict:
+    return model_registry.report()
@@ -1,11 +1,27 @@
 import json
+import os
+import threading
+from collections import OrderedDict
 from typing import List
-import spacy
 from fastapi import HTTPException
 from typing import Optional
-import json
+from src.models.models import get_spacy_pipeline
+from src.config.config import get_metrics, get_metric_names, get_prompt_template
+from src.telemetry.telemetry import span
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+# QA leads reuse a handful of custom metric strings, keep their keywords around
+KEYWORD_CACHE_SIZE = int(os.getenv("KEYWORD_CACHE_SIZE", "1024"))
+keyword_cache = OrderedDict()
+keyword_cache_lock = threading.Lock()
 
-spacy.cli.download("en_core_web_sm")
+# a speaker label ("A: ", "B: ", ...) starting a turn in a map_speakers transcription. Only labels
+# at the start, on a new line or after the end of a sentence count, so "Plan B: ..." inside a turn
+# doesn't start a fake one. A turn without closing punctuation stays glued to the next one
+TURN_BOUNDARY = re.compile(r"(?:^|\s*\n\s*|(?<=[.!?…\"')\]])\s+)(?=[A-Z]: )")
 
 def load_json(filepath: str):
     """ Load JSON file """
@@ -16,31 +32,66 @@ def extract_keywords(user_prompt: str) -> List[str]:
     """
     Extract key phrases from user_prompt using NLP.
     """
-    nlp = spacy.load("en_core_web_sm")
-    doc = nlp(user_prompt)
-    
-    keywords = set()
+    cached = _cached_keywords(user_prompt)
+    if cached is not None:
+        return list(cached)
+
+    keywords = keywords_from_doc(get_spacy_pipeline()(user_prompt))
+    _cache_keywords(user_prompt, keywords)
+    return list(keywords)
+
+def extract_keywords_batch(user_prompts: List[str]) -> List[List[str]]:
+    """
+    Extract key phrases for many prompts at once, running the uncached ones through nlp.pipe.
+    """
+    results = {prompt: _cached_keywords(prompt) for prompt in user_prompts}
+    missing = [prompt for prompt, keywords in results.items() if keywords is None]
+
+    for prompt, doc in zip(missing, get_spacy_pipeline().pipe(missing)):
+        results[prompt] = keywords_from_doc(doc)
+        _cache_keywords(prompt, results[prompt])
+
+    return [list(results[prompt]) for prompt in user_prompts]
+
+def keywords_from_doc(doc) -> tuple:
+    # dict keeps first-seen order so the same prompt always builds the same text
+    keywords = {}
     for token, next_token in zip(doc, list(doc)[1:] + [None]):
         if next_token is not None and token.pos_ == "ADJ" and next_token.pos_ == "NOUN":
             phrase = f"{token.text} {next_token.text}".lower()
-            keywords.add(phrase)
+            keywords[phrase] = None
         elif token.pos_ == "NOUN" or token.pos_ == "ADJ":
-            keywords.add(token.text.lower())
+            keywords[token.text.lower()] = None
 
-    # Avoid duplicate n. without adj. exists
-    filtered_keywords = {kw for kw in keywords if not any(kw in other and kw != other for other in keywords)}
+    # Avoid duplicate n. without adj. exists: a keyword found anywhere else in the joined
+    # list is a substring of another keyword, one C-level count instead of comparing every pair
+    joined = "\n".join(keywords)
+    filtered_keywords = tuple(kw for kw in keywords if joined.count(kw) == 1)
 
-    return list(filtered_keywords)
+    return filtered_keywords
 
-def build_prompt(transcription: str, user_prompt: Optional[str], metric_name: Optional[str]):
-    
-    print("-----------------------")
-    print("Log: constructing prompts_payload")
-    print("-----------------------")
+def _cached_keywords(user_prompt: str) -> Optional[tuple]:
+    with keyword_cache_lock:
+        if user_prompt in keyword_cache:
+            keyword_cache.move_to_end(user_prompt)
+            return keyword_cache[user_prompt]
+    return None
+
+def _cache_keywords(user_prompt: str, keywords: tuple):
+    with keyword_cache_lock:
+        keyword_cache[user_prompt] = keywords
+        while len(keyword_cache) > KEYWORD_CACHE_SIZE:
+            keyword_cache.popitem(last=False)
+
+def prompt_fields(user_prompt: Optional[str], metric_name: Optional[str]):
+    """
+    Resolve the rubric and the user's extra metrics into the text that fills the templates.
 
-    # Load your configs
-    metrics = load_json("./backend/configs/metrics.json")
-    prompts = load_json("./backend/configs/prompts.json")
+    Returns:
+        tuple: (metric names text, user metrics text, resolved metric_name)
+    """
+    # Configs are parsed once and only reloaded when the files change
+    metrics = get_metrics()
 
     # Use default for metric_name if it is None or empty, had to do it this way instead of via param
     metric_name = metric_name or "customer_service_metrics"
@@ -59,21 +110,116 @@ def build_prompt(transcription: str, user_prompt: Optional[str], metric_name: Op
     else:
         prompt_user_text = "No additional metrics from user"
 
-    # Get the prompt template
-    prompt_template = prompts["template"]
-
-    # Format the final prompt
-    try:
-        formatted_prompt = prompt_template.format(
-            transcription=transcription,
-            metrics=", ".join(metrics[metric_name].keys()),
-            user_prompt=prompt_user_text
-        )
-    except Exception as e:
-        raise ValueError(f"Prompt generation failed: {str(e)}")
-
-    print("-----------------------")
-    print("Log: completed construction prompts_payload")
-    print("-----------------------")
+    return (get_metric_names(metric_name), prompt_user_text, metric_name)
+
+def build_prompt(transcription: str, user_prompt: Optional[str], metric_name: Optional[str]):
+    
+    logger.info("Constructing prompts_payload")
+
+    with span("prompt_build"):
+        metrics_text, prompt_user_text, metric_name = prompt_fields(user_prompt, metric_name)
+
+        # Get the prompt template, validated when prompts.json was loaded
+        prompt_template = get_prompt_template()
+
+        # Format the final prompt
+        try:
+            formatted_prompt = prompt_template.format(
+                transcription=transcription,
+                metrics=metrics_text,
+                user_prompt=prompt_user_text
+            )
+        except Exception as e:
+            raise ValueError(f"Prompt generation failed: {str(e)}")
+
+    logger.info("Completed construction prompts_payload")
     
     return (formatted_prompt, user_prompt, metric_name)
+
+def split_turns(transcription: str) -> List[str]:
+    """
+    Split a map_speakers transcription ("A: ... B: ...") back into its speaker turns.
+    """
+    return [turn.strip() for turn in TURN_BOUNDARY.split(transcription) if turn.strip()]
+
+def chunk_transcription(transcription: str, chunk_chars: int, overlap_chars: int) -> List[str]:
+    """
+    Cut a transcription into windows of at most chunk_chars on speaker-turn boundaries.
+
+    Each window after the first repeats the last turns of the previous one, up to overlap_chars,
+    so an exchange cut at a window edge is still seen whole by one of them. A single turn longer
+    than chunk_chars is split between words and keeps its speaker label on every piece.
+
+    Returns:
+        list of str: the windows, in order
+    """
+    turns = []
+    for turn in split_turns(transcription):
+        if len(turn) <= chunk_chars:
+            turns.append(turn)
+            continue
+        label, _, text = turn.partition(": ")
+        piece = []
+        # running length of "label: " plus the words joined by spaces
+        piece_size = len(label) + 2
+        for word in text.split():
+            if piece and piece_size + 1 + len(word) > chunk_chars:
+                turns.append(f"{label}: {' '.join(piece)}")
+                piece = []
+                piece_size = len(label) + 2
+            piece_size += len(word) + (1 if piece else 0)
+            piece.append(word)
+        if piece:
+            turns.append(f"{label}: {' '.join(piece)}")
+
+    windows = []
+    current = []
+    size = 0
+    for turn in turns:
+        if current and size + 1 + len(turn) > chunk_chars:
+            windows.append(" ".join(current))
+            # carry the tail of this window into the next one
+            overlap = []
+            overlap_size = 0
+            for previous in reversed(current):
+                if overlap_size + len(previous) + 1 > overlap_chars or overlap_size + len(previous) + 1 + len(turn) > chunk_chars:
+                    break
+                overlap.insert(0, previous)
+                overlap_size += len(previous) + 1
+            current, size = overlap, overlap_size
+        current.append(turn)
+        size += len(turn) + 1
+
+    if current:
+        windows.append(" ".join(current))
+    return windows
+
+def build_chunk_prompts(windows: List[str], user_prompt: Optional[str], metric_name: Optional[str]) -> List[str]:
+    """
+    One map prompt per transcription window, scoring the rubric on that part of the call only.
+    """
+    with span("prompt_build"):
+        metrics_text, prompt_user_text, _ = prompt_fields(user_prompt, metric_name)
+        template = get_prompt_template("chunk_template")
+        return [
+            template.format(
+                transcription=window,
+                metrics=metrics_text,
+                user_prompt=prompt_user_text,
+                part=i + 1,
+                parts=len(windows),
+            )
+            for i, window in enumerate(windows)
+        ]
+
+def build_reduce_prompt(scores: str, notes: str, user_prompt: Optional[str], metric_name: Optional[str]) -> str:
+    """
+    The reduce prompt that turns the per-part scores and notes into the final reasons and summary.
+    """
+    metrics_text, prompt_user_text, _ = prompt_fields(user_prompt, metric_name)
+    return get_prompt_template("reduce_template").format(
+        metrics=metrics_text,
+        user_prompt=prompt_user_text,
+        scores=scores,
+        notes=notes,
+    )
@@ -1,142 +1,253 @@
-from src.transcription.transcription import transcribe_file
-from src.prompts.prompts import build_prompt
-from src.evaluator.evaluator import evaluate_transcription_quality
+from src.transcription.transcription import transcribe_file, get_turn_stats
+from src.prompts.prompts import build_prompt, extract_keywords_batch
+from src.evaluator.evaluator import evaluate_transcription_quality, evaluate_transcription_quality_async, stream_transcription_quality, get_evaluator_stats
+from src.evaluator.chunked import evaluate_chunked, evaluation_mode, context_options
+from src.checkpoints.checkpoints import audio_digest
 from src.analysis.analysis import generate_analysis
-from src.analysis.general_analysis import extract_evaluated_metrics, create_trend_graphs, compute_overall_performance_percentages
+from src.analysis.general_analysis import extract_column_metrics, create_trend_graphs
+from src.analysis.aggregates import compute_performance_from_aggregates, OVERALL_SCOPE, employee_scope
+from src.analysis.analysis_cache import analysis_cache
+from src.analysis.leaderboard import build_leaderboard, leaderboard_rows, leaderboard_chart
+from src.analysis.trends import bucketed_trends, downsample_metrics, TREND_MAX_POINTS, TREND_WINDOW
+from src.analysis.charts import get_chart, get_chart_cache_stats, check_chart_mode
+from src.jobs.jobs import submit_job, get_job_status, get_job_result
+from src.jobs.scratch import remove_scratch_dir
+from src.jobs.batches import create_batch, get_batch_status, run_batch
+from src.models.models import preload_models, get_model_stats
+from src.config.config import get_metrics
+from src.telemetry.telemetry import job_context, span, render_metrics
+from src.storage.feed import follow_reports
+from src.storage.columns import get_score_columns, employee_mask, date_mask, date_bound, combine_masks
+from src.storage.storage import save_report, get_report, get_all_reports, get_reports_by_employee, get_reports_by_date, get_metric_aggregates, list_reports, get_store_version, parse_fields
 import uuid
+import numpy as np
 import json
+import asyncio
 import os
 from fastapi import HTTPException
+import logging
+
+logger = logging.getLogger(__name__)
+
+# audio items of a batch are referenced by path and must live under this directory
+BATCH_AUDIO_DIR = os.getenv("BATCH_AUDIO_DIR", "./audio")
+# reports per page of GET /reports when the client doesn't ask, and the most it may ask for
+REPORTS_PAGE_SIZE = int(os.getenv("REPORTS_PAGE_SIZE", "100"))
+REPORTS_PAGE_MAX = int(os.getenv("REPORTS_PAGE_MAX", "1000"))
 
 async def transcribe_audio(filepath: str):
-    return transcribe_file(filepath)
+    # run in a worker thread so concurrent uploads don't queue behind each other on the event loop
+    return await asyncio.to_thread(transcribe_file, filepath, audio_key=audio_digest(filepath))
 
 def generate_prompts(transcription: str, user_prompt: str, metric_name: str):
     return build_prompt(transcription, user_prompt, metric_name)
 
-def evaluate_transcription(prompt: str):
-    return evaluate_transcription_quality(prompt)
+def evaluate_transcription(prompt: str, use_cache: bool = True):
+    return evaluate_transcription_quality(prompt, use_cache=use_cache)
 
-def create_analysis(evaluation: list[tuple[str, int, str]]):
-    return generate_analysis(evaluation)
+def stream_evaluation(prompt: str, use_cache: bool = True):
+    return stream_transcription_quality(prompt, use_cache=use_cache)
 
-async def evaluate_conversation(filepath: str, employee_id: str, user_prompt: str, metric_name: str) -> dict:
+def get_evaluator_report():
+    return get_evaluator_stats()
 
-    print("-----------------------")
-    print(f"Log: evaluating conversation audio")
-    print("-----------------------")
+def create_analysis(evaluation: list[tuple[str, int, str]], summary: str, charts: str = "inline"):
+    return generate_analysis(evaluation, summary, chart_mode(charts))
 
-    #generate uuid
-    job_id = str(uuid.uuid4())
+async def evaluate_conversation(filepath: str, employee_id: str, user_prompt: str, metric_name: str, use_cache: bool = True) -> dict:
+    return await asyncio.to_thread(process_conversation, filepath, employee_id, user_prompt, metric_name, use_cache=use_cache)
 
-    transcription_final, timestamp, duration = transcribe_file(filepath)
-    prompt_payload, user_prompt, metric_name = build_prompt(transcription_final, user_prompt, metric_name)
-    result = evaluate_transcription_quality(prompt_payload)
-    print(result)
-    if isinstance(result, str):
-        try:
-            result = json.loads(result)
-        except json.JSONDecodeError as e:
-            raise ValueError(f"LLM output is not valid JSON:\n{result}\n\nError: {e}")
+def submit_conversation(filepath: str, employee_id: str, user_prompt: str, metric_name: str, use_cache: bool = True, scratch: str = None) -> str:
+    """
+    Queue the audio pipeline on the background worker pool and return its job_id right away.
+    The upload's scratch directory (or the file itself) is removed once the job finishes, whether it succeeded or not.
+    """
+    def run(job_id, progress):
+        return process_conversation(filepath, employee_id, user_prompt, metric_name, job_id=job_id, progress=progress, use_cache=use_cache)
 
-    complete_analysis = {
-        "job_id": job_id,
-        "employee_id": employee_id,
-        "submission_date_time": timestamp,
-        "audio_duration": duration, 
-        "transcription": transcription_final,
-        "input_user_prompt": user_prompt,
-        "input_metric_name": metric_name,
-        "prompt_payload": prompt_payload,
-        "evaluated_transcription": result["report"],
-        "evaluate_summary": result["summary"]
-    }
+    def cleanup():
+        if scratch is not None:
+            remove_scratch_dir(scratch)
+        elif os.path.exists(filepath):
+            os.remove(filepath)
 
-    # save to database 
-    os.makedirs("./reports", exist_ok=True)
-    output_path = "./reports/all_reports.json"
+    return submit_job(run, cleanup)
 
-    # Load existing data if file exists, otherwise start with empty dict
-    if os.path.exists(output_path):
-        with open(output_path, "r", encoding="utf-8") as f:
-            all_reports = json.load(f)
-    else:
-        all_reports = {}
+def get_conversation_status(job_id: str) -> dict:
+    return get_job_status(job_id)
 
-    # Add or update the current job's report
-    all_reports[job_id] = complete_analysis
+def get_conversation_result(job_id: str):
+    return get_job_result(job_id)
 
-    # Save back to file
-    with open(output_path, "w", encoding="utf-8") as f:
-        json.dump(all_reports, f, indent=2, ensure_ascii=False)
+def process_conversation(filepath: str, employee_id: str, user_prompt: str, metric_name: str, job_id: str = None, progress=None, use_cache: bool = True) -> dict:
+
+    logger.info("Evaluating conversation audio")
 
-    print("-----------------------")
-    print(f"Log: completed final report and saved to all_reports.json for job_id {job_id}")
-    print("-----------------------")
+    #generate uuid
+    job_id = job_id or str(uuid.uuid4())
+    progress = progress or (lambda stage, fraction: None)
+
+    # every span below is tagged with the job_id, see GET /jobs/{job_id} and /metrics
+    with job_context(job_id), span("job"):
+        # stage outputs are checkpointed under the audio's hash, a retry or duplicate upload resumes
+        audio_key = audio_digest(filepath)
+        transcription_final, timestamp, duration = transcribe_file(filepath, progress=progress, audio_key=audio_key)
+        prompt_payload, user_prompt, metric_name = build_prompt(transcription_final, user_prompt, metric_name)
+        progress("evaluating", 0.0)
+        # calls too long for one prompt are scored window by window and merged. A retry replays the
+        # model's answers from the LLM cache, keyed on the prompt, model and options
+        mode = evaluation_mode(transcription_final)
+        if mode == "chunked":
+            result = evaluate_chunked(transcription_final, user_prompt, metric_name, use_cache=use_cache)
+            logger.debug("LLM result for job_id %s: %s", job_id, result)
+            # the single prompt was never sent, the report keeps the window and reduce prompts that were
+            prompt_payload = result.pop("prompts")
+        else:
+            # sized to the prompt like the windows, a call just under EVAL_CHUNK_CHARS plus the rubric
+            # would not fit the server's default context
+            result = evaluate_transcription_quality(prompt_payload, use_cache=use_cache, options=context_options(prompt_payload))
+            logger.debug("LLM result for job_id %s: %s", job_id, result)
+            if isinstance(result, str):
+                with span("json_parse"):
+                    try:
+                        result = json.loads(result)
+                    except json.JSONDecodeError as e:
+                        raise ValueError(f"LLM output is not valid JSON:\n{result}\n\nError: {e}")
+        progress("evaluating", 1.0)
+
+        complete_analysis = {
+            "job_id": job_id,
+            "employee_id": employee_id,
+            "submission_date_time": timestamp,
+            "audio_duration": duration, 
+            "transcription": transcription_final,
+            "input_user_prompt": user_prompt,
+            "input_metric_name": metric_name,
+            "prompt_payload": prompt_payload,
+            "evaluation_mode": mode,
+            "evaluated_transcription": result["report"],
+            "evaluate_summary": result["summary"]
+        }
+
+        # save to database
+        save_report(complete_analysis)
+
+    logger.info("Completed final report and saved to the report store for job_id %s", job_id)
 
     return complete_analysis
 
-def read_all_reports():
-    print("-----------------------")
-    print(f"Log: reading all reports in the database")
-    print("-----------------------")
+def read_all_reports(fields: str = None):
+    logger.info("Reading all reports in the database")
 
-    report_path = "./reports/all_reports.json"
+    all_reports = get_all_reports(report_fields(fields))
 
-    if not os.path.exists(report_path):
+    if not all_reports:
         raise HTTPException(status_code=404, detail="Report database not found.")
 
-    try:
-        with open(report_path, "r", encoding="utf-8") as f:
-            all_reports = json.load(f)
-    except json.JSONDecodeError:
-        raise HTTPException(status_code=500, detail="Report database is not valid JSON.")
-        
     return all_reports
     
+def read_reports_page(cursor: int = 0, limit: int = None, fields: str = "summary", employee_ids: str = None, start: str = None, end: str = None) -> dict:
+    """
+    One page of reports in store order, with the cursor of the next page (None on the last one).
+    The cursor is the store version of the page's last report.
+    """
+    limit = min(max(limit or REPORTS_PAGE_SIZE, 1), REPORTS_PAGE_MAX)
+    fields = report_fields(fields)
+    # one extra row tells whether another page follows
+    rows = list_reports(cursor, split_ids(employee_ids), start, end, limit + 1, fields)
+    page = rows[:limit]
+    return {
+        "reports": [report if fields is not None else {"seq": seq, **report} for seq, report in page],
+        "next_cursor": page[-1][0] if len(rows) > limit else None,
+    }
+
+def get_reports_version() -> int:
+    return get_store_version()
+
+def report_fields(fields: str):
+    try:
+        return parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def chart_mode(charts: str) -> str:
+    try:
+        return check_chart_mode(charts)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def check_dates(start: str, end: str):
+    """ 400 for a start or end filter that isn't a date, instead of silently matching nothing """
+    try:
+        if start:
+            date_bound(start)
+        if end:
+            date_bound(end, end=True)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def split_ids(ids: str):
+    """ Comma-separated ids from a query parameter, None when there are none """
+    ids = [i.strip() for i in ids.split(",") if i.strip()] if ids else None
+    return ids or None
+
+async def follow_report_feed(since: int = 0, employee_ids: str = None, fields: str = "summary"):
+    """ Live report feed, employee_ids is a comma-separated filter """
+    fields = report_fields(fields)
+    employee_ids = split_ids(employee_ids)
+    logger.info("Opening report feed since version %d for employees %s", since, employee_ids or "all")
+    async for message in follow_reports(since, employee_ids, fields):
+        yield message
+
 def read_report_by_id(job_id: str):
-    print("-----------------------")
-    print(f"Log: retriving a report for {job_id}")
-    print("-----------------------")
+    logger.info("Retrieving a report for %s", job_id)
 
-    all_reports = read_all_reports()
+    report = get_report(job_id)
 
-    if job_id not in all_reports:
-        print("Log: job_id doesn't exist")
+    if report is None:
+        logger.info("job_id doesn't exist")
         return "job_id doesn't exist"
 
-    return all_reports[job_id]
+    return report
 
-def read_reports_by_employee(employee_id: str):
-    print("-----------------------")
-    print(f"Log: retrieving all reports for employee_id: {employee_id}")
-    print("-----------------------")
+def read_reports_by_employee(employee_id: str, fields: str = None):
+    logger.info("Retrieving all reports for employee_id: %s", employee_id)
 
-    all_reports = read_all_reports()
-
-    employee_reports = {
-        job_id: report for job_id, report in all_reports.items()
-        if report.get("employee_id") == employee_id
-    }
+    employee_reports = get_reports_by_employee(employee_id, report_fields(fields))
 
     if not employee_reports:
         raise HTTPException(status_code=404, detail=f"No reports found for employee_id: {employee_id}")
 
     return employee_reports
 
-def generate_reports_analysis():
-    print("-----------------------")
-    print(f"Log: generating overall analysis for all reports")
-    print("-----------------------")
+def read_reports_by_date(start: str, end: str, fields: str = None):
+    logger.info("Retrieving all reports submitted between %s and %s", start, end)
+
+    reports = get_reports_by_date(start, end, report_fields(fields))
+
+    if not reports:
+        raise HTTPException(status_code=404, detail=f"No reports found between {start} and {end}")
+
+    return reports
+
+def generate_reports_analysis(charts: str = "inline"):
+    """ Overall analysis, recomputed only after a report was saved since the last one """
+    charts = chart_mode(charts)
+    return analysis_cache.get((OVERALL_SCOPE, charts), OVERALL_SCOPE, lambda: compute_reports_analysis(charts))
+
+def compute_reports_analysis(charts: str = "inline"):
+    logger.info("Generating overall analysis for all reports")
 
-    all_reports = read_all_reports()
+    columns = get_score_columns()
+    if not len(columns["seq"]):
+        raise HTTPException(status_code=404, detail="Report database not found.")
 
-    # Trend Analysis
-    metrics_data = extract_evaluated_metrics(all_reports)
-    metrics_data_with_graphs64 = create_trend_graphs(metrics_data)
+    # Trend Analysis, read from the score columns instead of parsing every stored report and cut to TREND_MAX_POINTS
+    metrics_data = downsample_metrics(extract_column_metrics(columns))
+    metrics_data_with_graphs64 = create_trend_graphs(metrics_data, charts)
 
-    # Overall Analysis
-    overall_performance_percentages = compute_overall_performance_percentages(metrics_data)
+    # Overall Analysis, served from the running aggregates kept up to date on every save
+    overall_performance_percentages = compute_performance_from_aggregates(get_metric_aggregates())
 
     # Combine the data into a single dictionary
     overall_analysis = {
@@ -149,25 +260,30 @@ def generate_reports_analysis():
     with open('./analysis/overall_analysis.json', 'w') as f:
         json.dump(overall_analysis, f, indent=4)
 
-    print("-----------------------")
-    print(f"Log: completed overall analysis for all reports")
-    print("-----------------------")
+    logger.info("Completed overall analysis for all reports")
 
     return overall_analysis
 
-def generate_employee_analysis(employee_id: str):
-    print("-----------------------")
-    print(f"Log: generating analysis for employee_id: {employee_id}")
-    print("-----------------------")
+def generate_employee_analysis(employee_id: str, charts: str = "inline"):
+    """ Analysis of one employee, recomputed only after one of their reports was saved since the last one """
+    charts = chart_mode(charts)
+    scope = employee_scope(employee_id)
+    return analysis_cache.get((scope, charts), scope, lambda: compute_employee_analysis(employee_id, charts))
+
+def compute_employee_analysis(employee_id: str, charts: str = "inline"):
+    logger.info("Generating analysis for employee_id: %s", employee_id)
 
-    employee_reports = read_reports_by_employee(employee_id)
+    columns = get_score_columns()
+    rows = employee_mask(columns, [employee_id])
+    if not rows.any():
+        raise HTTPException(status_code=404, detail=f"No reports found for employee_id: {employee_id}")
 
-    # Trend Analysis
-    metrics_data = extract_evaluated_metrics(employee_reports)
-    metrics_data_with_graphs64 = create_trend_graphs(metrics_data)
+    # Trend Analysis, read from the score columns instead of parsing every stored report and cut to TREND_MAX_POINTS
+    metrics_data = downsample_metrics(extract_column_metrics(columns, rows))
+    metrics_data_with_graphs64 = create_trend_graphs(metrics_data, charts)
 
-    # Overall Analysis
-    overall_performance_percentages = compute_overall_performance_percentages(metrics_data)
+    # Overall Analysis, served from the employee's running aggregates
+    overall_performance_percentages = compute_performance_from_aggregates(get_metric_aggregates(employee_id))
 
     employee_analysis = {
         "employee_id": employee_id,
@@ -181,57 +297,166 @@ def generate_employee_analysis(employee_id: str):
     with open(output_path, "w", encoding="utf-8") as f:
         json.dump(employee_analysis, f, indent=4)
 
-    print("-----------------------")
-    print(f"Log: completed analysis for employee_id {employee_id}")
-    print("-----------------------")
+    logger.info("Completed analysis for employee_id %s", employee_id)
 
     return employee_analysis
 
-    
+def generate_leaderboard(
+    sort: str = "overall",
+    order: str = "desc",
+    threshold: float = 4.5,
+    min_reports: int = 1,
+    offset: int = 0,
+    limit: int = None,
+    charts: str = "none",
+    employee_ids: str = None,
+    start: str = None,
+    end: str = None,
+):
+    """
+    Every employee's statistics and rank on every metric, from one group-by over all reports.
+    The board is cached against the store version until read again after a save, sorting and paging it is cheap.
+    """
+    employee_ids = split_ids(employee_ids)
+    check_dates(start, end)
+    key = ("leaderboard", threshold, min_reports, tuple(employee_ids or ()), start, end)
+    board = analysis_cache.get(key, OVERALL_SCOPE, lambda: compute_leaderboard(threshold, min_reports, employee_ids, start, end), refresh=False)
+
+    try:
+        rows = leaderboard_rows(board["board"], board["employees"], board["metrics"], board["report_counts"], sort, order, max(offset, 0), limit)
+        chart = leaderboard_chart(rows, sort, charts)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    leaderboard = {
+        "sort": sort,
+        "order": order,
+        "threshold": threshold,
+        "metrics": board["metrics"],
+        "employees": len(board["employees"]),
+        "leaderboard": rows,
+    }
+    if chart:
+        leaderboard["chart"] = chart
+    return leaderboard
+
+def compute_leaderboard(threshold: float, min_reports: int, employee_ids: list = None, start: str = None, end: str = None) -> dict:
+    logger.info("Computing the leaderboard")
+
+    # straight from the score columns, reports without an employee aren't ranked
+    columns = get_score_columns()
+    rows = np.flatnonzero(combine_masks(columns["employee"] >= 0, employee_mask(columns, employee_ids), date_mask(columns, start, end)))
+    employee_codes, report_employees = np.unique(columns["employee"][rows], return_inverse=True)
+    employees = [columns["employees"][code] for code in employee_codes]
+    report_counts = np.bincount(report_employees, minlength=len(employees))
+
+    # one (employee, metric, score) entry per score, metrics nobody in the selection was scored on are dropped
+    scores = columns["scores"][rows]
+    pair_reports, pair_columns = np.nonzero(~np.isnan(scores))
+    metric_columns, metric_codes = np.unique(pair_columns, return_inverse=True)
+    metrics = [columns["metrics"][column] for column in metric_columns]
+
+    board = build_leaderboard(
+        report_employees[pair_reports],
+        metric_codes,
+        scores[pair_reports, pair_columns],
+        employees,
+        metrics,
+        report_counts,
+        threshold,
+        min_reports,
+    )
+
+    logger.info("Completed the leaderboard for %d employees and %d metrics", len(employees), len(metrics))
+
+    return {"board": board, "employees": employees, "metrics": metrics, "report_counts": report_counts}
+
+def generate_trends(
+    bucket: str = "week",
+    start: str = None,
+    end: str = None,
+    employee_ids: str = None,
+    window: int = None,
+    max_points: int = None,
+    charts: str = "none",
+):
+    """ Mean scores per day, week or month with a rolling mean, cached against the store version until read again after a save """
+    employee_ids = split_ids(employee_ids)
+    check_dates(start, end)
+    window = TREND_WINDOW if window is None else window
+    max_points = TREND_MAX_POINTS if max_points is None else max_points
+    key = ("trends", bucket, start, end, tuple(employee_ids or ()), window, max_points, charts)
+    try:
+        return analysis_cache.get(key, OVERALL_SCOPE, lambda: compute_trends(bucket, start, end, employee_ids, window, max_points, charts), refresh=False)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def compute_trends(bucket: str, start: str, end: str, employee_ids: list, window: int, max_points: int, charts: str) -> dict:
+    logger.info("Computing %s trends", bucket)
+
+    columns = get_score_columns()
+    rows = combine_masks(employee_mask(columns, employee_ids), date_mask(columns, start, end))
+
+    return {
+        "bucket": bucket,
+        "start": start,
+        "end": end,
+        "window": window,
+        "reports": int(rows.sum()) if rows is not None else len(columns["seq"]),
+        "metrics": bucketed_trends(columns, rows, bucket, window, max_points, charts),
+    }
+
 def get_reports_analysis():
-    print("-----------------------")
-    print(f"Log: reading analysis in the database")
-    print("-----------------------")
+    logger.info("Reading the cached overall analysis")
 
-    file_path = './analysis/overall_analysis.json'
-    
-    if not os.path.exists(file_path):
-        raise HTTPException(status_code=404, detail="Report database not found.")
+    # same cached result the generate endpoints and the websocket serve, ./analysis/overall_analysis.json
+    # is still written on every recompute for offline use
+    return generate_reports_analysis()
 
-    try:
-        with open(file_path, "r", encoding="utf-8") as f:
-            analysis = json.load(f)
-    except json.JSONDecodeError:
-        raise HTTPException(status_code=500, detail="Report database is not valid JSON.")
+def get_chart_image(key: str):
+    chart = get_chart(key)
+    if chart is None:
+        raise HTTPException(status_code=404, detail=f"Unknown chart: {key}")
+    return chart
+
+def get_charts_report():
+    return get_chart_cache_stats()
 
-    return analysis
+def load_models():
+    preload_models()
+
+def get_models_report():
+    return get_model_stats()
+
+def get_transcription_report():
+    return get_turn_stats()
+
+def get_metrics_text() -> str:
+    return render_metrics()
 
 def get_prompt_options():
-    metrics_path = os.path.join(os.path.dirname(__file__), "../configs/metrics.json")
     try:
-        with open(metrics_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        return data
+        return get_metrics()
     except Exception as e:
         raise RuntimeError(f"Failed to load prompt options: {e}")
 
-async def evaluate_script(transcript: str) -> dict:
+async def evaluate_script(transcript: str, use_cache: bool = True, user_prompt: str = "", metric_name: str = "customer_service_metrics") -> dict:
 
-    print("-----------------------")
-    print(f"Log: evaluating conversation script")
-    print("-----------------------")
+    logger.info("Evaluating conversation script")
 
     #generate uuid
     job_id = str(uuid.uuid4())
 
-    prompt_payload, user_prompt, metric_name = build_prompt(transcript, "", "customer_service_metrics")
-    result = evaluate_transcription_quality(prompt_payload)
+    with job_context(job_id):
+        prompt_payload, user_prompt, metric_name = build_prompt(transcript, user_prompt, metric_name)
+        result = await evaluate_transcription_quality_async(prompt_payload, use_cache=use_cache, options=context_options(prompt_payload))
 
-    if isinstance(result, str):
-        try:
-            result = json.loads(result)
-        except json.JSONDecodeError as e:
-            raise ValueError(f"LLM output is not valid JSON:\n{result}\n\nError: {e}")
+        if isinstance(result, str):
+            with span("json_parse"):
+                try:
+                    result = json.loads(result)
+                except json.JSONDecodeError as e:
+                    raise ValueError(f"LLM output is not valid JSON:\n{result}\n\nError: {e}")
 
     complete_analysis = {
         "job_id": job_id,
@@ -242,8 +467,46 @@ async def evaluate_script(transcript: str) -> dict:
         "evaluate_summary": result["summary"]
     }
 
-    print("-----------------------")
-    print(f"Log: completed final report and saved to all_reports.json for job_id {job_id}")
-    print("-----------------------")
+    logger.info("Completed evaluation of script for job_id %s", job_id)
 
     return complete_analysis
+
+def submit_batch(items: list, use_cache: bool = True) -> str:
+    return create_batch(items, use_cache)
+
+def read_batch_status(batch_id: str) -> dict:
+    return get_batch_status(batch_id)
+
+async def stream_batch(batch_id: str):
+    """ NDJSON lines for a batch, one per item as it finishes, unfinished items of an earlier run are resumed """
+    async for event in run_batch(batch_id, evaluate_batch_item, prepare=prepare_batch_items):
+        yield json.dumps(event, ensure_ascii=False) + "\n"
+
+def prepare_batch_items(items: list):
+    """ Keywords of every distinct user_prompt in the batch in one nlp.pipe pass, the items then find them cached """
+    user_prompts = list(dict.fromkeys(item["user_prompt"] for item in items if item.get("user_prompt")))
+    if user_prompts:
+        extract_keywords_batch(user_prompts)
+
+async def evaluate_batch_item(item: dict, use_cache: bool = True) -> dict:
+    """
+    Evaluate one batch item, either {"transcript": ...} like /test or {"audio_path": ...} like /evaluate_audio.
+    Raises for anything the batch should record as a failed item.
+    """
+    if item.get("transcript"):
+        result = await evaluate_script(item["transcript"], use_cache, item.get("user_prompt") or "", item.get("metric_name") or "customer_service_metrics")
+    elif item.get("audio_path"):
+        root = os.path.realpath(BATCH_AUDIO_DIR)
+        filepath = os.path.realpath(os.path.join(root, item["audio_path"]))
+        if os.path.commonpath([root, filepath]) != root or not os.path.isfile(filepath):
+            raise HTTPException(status_code=404, detail=f"Audio file not found: {item['audio_path']}")
+        if not item.get("employee_id"):
+            raise HTTPException(status_code=400, detail="Audio items need an employee_id.")
+        result = await asyncio.to_thread(process_conversation, filepath, item["employee_id"], item.get("user_prompt"), item.get("metric_name"), use_cache=use_cache)
+    else:
+        raise HTTPException(status_code=400, detail="Each item needs a transcript or an audio_path.")
+
+    if not isinstance(result["evaluated_transcription"], list):
+        # the evaluator reports its own failures in place of the report, keep the item retryable
+        raise ValueError(result["evaluated_transcription"])
+    return result
@@ -0,0 +1,370 @@
+import os
+import sqlite3
+import logging
+import datetime
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from src.storage.storage import list_reports, add_report_listener, get_store_version, normalize_timestamp
+from src.telemetry.telemetry import span
+
+logger = logging.getLogger(__name__)
+
+# memory-mapped score matrix and per-report columns, rebuilt from the report store whenever missing or behind
+COLUMNS_DIR = os.getenv("COLUMNS_DIR", "./reports/columns")
+# reports read from the store per round when catching up
+COLUMNS_SYNC_PAGE = int(os.getenv("COLUMNS_SYNC_PAGE", "5000"))
+
+INITIAL_ROWS = 1024
+INITIAL_METRICS = 16
+JOB_ID_BYTES = 64
+# report fields the columns are built from
+SOURCE_FIELDS = ("job_id", "employee_id", "submission_date_time", "audio_duration", "scores")
+
+# name -> (dtype, whether the file has one value per metric in each row)
+COLUMNS = {
+    "scores": (np.float32, True),
+    "seq": (np.int64, False),
+    "employee": (np.int32, False),
+    "timestamp": (np.dtype("datetime64[s]"), False),
+    "duration": (np.float32, False),
+    "job_id": (np.dtype(f"S{JOB_ID_BYTES}"), False),
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS rows (job_id TEXT PRIMARY KEY, row INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS metrics (code INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL);
+CREATE TABLE IF NOT EXISTS employees (code INTEGER PRIMARY KEY, employee_id TEXT UNIQUE NOT NULL);
+"""
+
+
+def parse_duration(value) -> float:
+    """ Seconds in an "HH:MM:SS" duration, NaN when missing or unreadable """
+    try:
+        seconds = 0.0
+        for part in str(value).split(":"):
+            seconds = seconds * 60 + float(part)
+        return seconds
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+def parse_timestamp(value) -> np.datetime64:
+    normalized = normalize_timestamp(value)
+    try:
+        return np.datetime64(datetime.datetime.strptime(normalized, "%Y-%m-%dT%H:%M:%S"), "s")
+    except (TypeError, ValueError):
+        return np.datetime64("NaT", "s")
+
+
+class ScoreColumns:
+    """
+    Columnar copy of the report store for analytics.
+
+    A reports x metrics float32 matrix (NaN where a report has no score for a metric) and parallel
+    seq, employee, timestamp, duration and job_id arrays, each in its own memory-mapped file. A report
+    keeps its row when it is saved again, new reports are appended. Files grow by doubling, and the
+    matrix gets wider the same way when new metrics show up.
+
+    The bookkeeping (store version covered, rows used, job_id -> row, metric and employee codes)
+    lives in a small sqlite database next to the files and is committed after the arrays are
+    written, so a crash in between is repaired by replaying the reports after the recorded version.
+    A resize commits the new capacity and width as soon as every file has been replaced, and the
+    files must have exactly the committed size on load. Anything that doesn't add up (files missing
+    or of another size, version ahead of the store) triggers a rebuild from the store.
+
+    Saves only schedule a sync on a background thread, readers catch up in snapshot() and get
+    read-only views of the used rows, nothing is copied. Rows appended later stay out of a view,
+    and a resize moves to new files while views keep the old mapping, but a report saved again
+    while a view is in use is overwritten in place and may show its new scores.
+    """
+
+    def __init__(self, directory: str = COLUMNS_DIR):
+        self.directory = directory
+        self.lock = threading.RLock()
+        self.conn = None
+        self.arrays = {}
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="columns")
+        self.sync_pending = False
+        self.pending_lock = threading.Lock()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, f"{name}.bin")
+
+    def _load(self):
+        if self.conn is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(self.directory, "columns.db"), isolation_level=None, check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+        meta = dict(self.conn.execute("SELECT key, value FROM meta").fetchall())
+        if set(meta) != {"version", "rows", "capacity", "width"} or not self._consistent(meta):
+            if meta:
+                logger.warning("score columns in %s are inconsistent with the report store, rebuilding", self.directory)
+            self._reset()
+            return
+
+        self.version, self.rows, self.capacity, self.width = meta["version"], meta["rows"], meta["capacity"], meta["width"]
+        self.metrics = [name for name, in self.conn.execute("SELECT name FROM metrics ORDER BY code")]
+        self.employees = [employee for employee, in self.conn.execute("SELECT employee_id FROM employees ORDER BY code")]
+        self.metric_codes = {name: code for code, name in enumerate(self.metrics)}
+        self.employee_codes = {employee: code for code, employee in enumerate(self.employees)}
+        self._open()
+
+    def _consistent(self, meta: dict) -> bool:
+        if meta["version"] > get_store_version():
+            return False
+        if self.conn.execute("SELECT COUNT(*) FROM rows").fetchone()[0] != meta["rows"]:
+            return False
+        for name, (dtype, per_metric) in COLUMNS.items():
+            size = meta["capacity"] * np.dtype(dtype).itemsize * (meta["width"] if per_metric else 1)
+            if not os.path.exists(self._path(name)) or os.path.getsize(self._path(name)) != size:
+                return False
+        return True
+
+    def _reset(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        for table in ("meta", "rows", "metrics", "employees"):
+            self.conn.execute(f"DELETE FROM {table}")
+        self.conn.executemany("INSERT INTO meta (key, value) VALUES (?, ?)", (("version", 0), ("rows", 0)))
+        self.conn.execute("COMMIT")
+        self.version, self.rows = 0, 0
+        self.metrics, self.employees, self.metric_codes, self.employee_codes = [], [], {}, {}
+        self.arrays = {}
+        for name in COLUMNS:
+            if os.path.exists(self._path(name)):
+                os.remove(self._path(name))
+        self._resize(INITIAL_ROWS, INITIAL_METRICS)
+
+    def _shape(self, name: str, capacity: int, width: int) -> tuple:
+        return (capacity, width) if COLUMNS[name][1] else (capacity,)
+
+    def _open(self):
+        self.arrays = {
+            name: np.memmap(self._path(name), dtype=dtype, mode="r+", shape=self._shape(name, self.capacity, self.width))
+            for name, (dtype, _) in COLUMNS.items()
+        }
+
+    def _resize(self, capacity: int, width: int):
+        """ Move every column to files of the new size, the current contents are copied over and the rest is empty """
+        for name, (dtype, _) in COLUMNS.items():
+            tmp = self._path(name) + ".tmp"
+            array = np.memmap(tmp, dtype=dtype, mode="w+", shape=self._shape(name, capacity, width))
+            array[:] = _empty(dtype)
+            old = self.arrays.get(name)
+            if old is not None:
+                array[tuple(slice(0, size) for size in old.shape)] = old
+            array.flush()
+            del array
+            os.replace(tmp, self._path(name))
+        self.capacity, self.width = capacity, width
+        # the files no longer match the old shape, committed before anything else is written to them
+        self._save_meta(("capacity", capacity), ("width", width))
+        self._open()
+
+    def _save_meta(self, *values):
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", values)
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def sync(self):
+        """ Apply every report saved since the last sync, in store order """
+        with self.lock, span("columns.sync"):
+            self._load()
+            while True:
+                page = list_reports(self.version, limit=COLUMNS_SYNC_PAGE, fields=SOURCE_FIELDS)
+                if not page:
+                    return
+                try:
+                    self._apply(page)
+                except Exception:
+                    # the in-memory bookkeeping may be ahead of the database, reload what was committed next time
+                    self.conn.close()
+                    self.conn = None
+                    raise
+                if len(page) < COLUMNS_SYNC_PAGE:
+                    return
+
+    def _apply(self, page: list):
+        known = dict(self.conn.execute(
+            f"SELECT job_id, row FROM rows WHERE job_id IN ({', '.join('?' * len(page))})",
+            [report["job_id"] for _, report in page],
+        ).fetchall())
+        new_rows, new_metrics, new_employees = {}, [], []
+
+        for seq, report in page:
+            job_id = report["job_id"]
+            row = known.get(job_id)
+            if row is None:
+                row = known[job_id] = new_rows[job_id] = self.rows
+                self.rows += 1
+
+            for metric in report["scores"]:
+                if metric not in self.metric_codes:
+                    self.metric_codes[metric] = len(self.metrics)
+                    self.metrics.append(metric)
+                    new_metrics.append(metric)
+            employee_id = report.get("employee_id")
+            if employee_id is not None and employee_id not in self.employee_codes:
+                self.employee_codes[employee_id] = len(self.employees)
+                self.employees.append(employee_id)
+                new_employees.append(employee_id)
+
+            if self.rows > self.capacity or len(self.metrics) > self.width:
+                self._resize(max(self.capacity, _grown(self.capacity, self.rows)), max(self.width, _grown(self.width, len(self.metrics))))
+
+            scores = np.full(self.width, np.nan, dtype=np.float32)
+            for metric, score in report["scores"].items():
+                scores[self.metric_codes[metric]] = score
+            self.arrays["scores"][row] = scores
+            self.arrays["seq"][row] = seq
+            self.arrays["employee"][row] = self.employee_codes[employee_id] if employee_id is not None else -1
+            self.arrays["timestamp"][row] = parse_timestamp(report.get("submission_date_time"))
+            self.arrays["duration"][row] = parse_duration(report.get("audio_duration"))
+            self.arrays["job_id"][row] = job_id.encode("utf-8")[:JOB_ID_BYTES]
+
+        self.version = page[-1][0]
+        for array in self.arrays.values():
+            array.flush()
+        self._commit(new_rows, new_metrics, new_employees)
+
+    def _commit(self, new_rows: dict, new_metrics: list, new_employees: list):
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.executemany("INSERT INTO rows (job_id, row) VALUES (?, ?)", new_rows.items())
+            self.conn.executemany(
+                "INSERT INTO metrics (code, name) VALUES (?, ?)", ((self.metric_codes[m], m) for m in new_metrics)
+            )
+            self.conn.executemany(
+                "INSERT INTO employees (code, employee_id) VALUES (?, ?)", ((self.employee_codes[e], e) for e in new_employees)
+            )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (("version", self.version), ("rows", self.rows))
+            )
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def snapshot(self) -> dict:
+        """
+        Read-only views of the used rows after catching up with the store: "scores" (reports x metrics),
+        "seq" each report was last saved at, "employee" codes into "employees" (-1 for none), "timestamp", "duration" in seconds,
+        "job_id" and the "metrics" naming the score columns.
+        """
+        with self.lock:
+            self.sync()
+            rows, width = self.rows, len(self.metrics)
+            return {
+                "version": self.version,
+                "scores": _read_only(self.arrays["scores"][:rows, :width]),
+                **{name: _read_only(self.arrays[name][:rows]) for name in ("seq", "employee", "timestamp", "duration", "job_id")},
+                "metrics": list(self.metrics),
+                "employees": list(self.employees),
+            }
+
+    def request_sync(self):
+        """ Sync on the background thread, saves made while one is pending fold into it """
+        with self.pending_lock:
+            if self.sync_pending:
+                return
+            self.sync_pending = True
+        self.executor.submit(self._pending_sync)
+
+    def _pending_sync(self):
+        with self.pending_lock:
+            self.sync_pending = False
+        try:
+            self.sync()
+        except Exception as e:
+            # readers catch up (or rebuild) on their next snapshot
+            logger.warning("failed to update score columns in %s: %s", self.directory, e)
+
+    def rebuild(self):
+        with self.lock:
+            self._load()
+            self._reset()
+            self.sync()
+
+
+def _empty(dtype):
+    dtype = np.dtype(dtype)
+    if dtype.kind == "f":
+        return np.nan
+    if dtype.kind == "M":
+        return np.datetime64("NaT")
+    if dtype.kind == "S":
+        return b""
+    if dtype == np.int64:
+        return 0
+    return -1
+
+
+def _read_only(array: np.memmap) -> np.ndarray:
+    view = array.view(np.ndarray)
+    view.setflags(write=False)
+    return view
+
+
+def _grown(size: int, needed: int) -> int:
+    while size < needed:
+        size *= 2
+    return size
+
+
+# shared process-wide columns, only one process should write to COLUMNS_DIR
+score_columns = ScoreColumns()
+
+
+def _on_report_saved(seq: int, report: dict):
+    # never on the saving thread, a first sync after deploy rebuilds the columns from the whole store
+    score_columns.request_sync()
+
+
+add_report_listener(_on_report_saved)
+
+
+def get_score_columns() -> dict:
+    return score_columns.snapshot()
+
+
+def employee_mask(columns: dict, employee_ids: Optional[list]) -> Optional[np.ndarray]:
+    """ Rows of the given employees, None for no filter """
+    if employee_ids is None:
+        return None
+    codes = [code for code, employee in enumerate(columns["employees"]) if employee in set(employee_ids)]
+    return np.isin(columns["employee"], codes)
+
+
+def date_bound(value: str, end: bool = False) -> np.datetime64:
+    """ Timestamp of a start or end date filter, a bare end date covers the whole day """
+    bound = parse_timestamp(f"{value}T23:59:59" if end and len(value) == 10 else value)
+    if np.isnat(bound):
+        raise ValueError(f"Unreadable date '{value}', expected YYYY-MM-DD or an ISO timestamp")
+    return bound
+
+
+def date_mask(columns: dict, start: Optional[str] = None, end: Optional[str] = None) -> Optional[np.ndarray]:
+    """ Rows submitted in [start, end], None for no filter. Raises ValueError for a date it can't read """
+    if not start and not end:
+        return None
+    mask = np.ones(len(columns["timestamp"]), dtype=bool)
+    if start:
+        mask &= columns["timestamp"] >= date_bound(start)
+    if end:
+        mask &= columns["timestamp"] <= date_bound(end, end=True)
+    return mask
+
+
+def combine_masks(*masks) -> Optional[np.ndarray]:
+    result = None
+    for mask in masks:
+        if mask is not None:
+            result = mask if result is None else result & mask
+    return result
@@ -0,0 +1,124 @@
+import os
+import asyncio
+import logging
+import threading
+from typing import List, Optional
+from src.storage.storage import list_reports, add_report_listener, get_store_version, SUMMARY_FIELDS
+from src.telemetry.telemetry import gauge
+
+logger = logging.getLogger(__name__)
+
+# reports per message, a large snapshot is sent in several pages
+REPORT_FEED_PAGE = int(os.getenv("REPORT_FEED_PAGE", "500"))
+# how often a subscription re-reads the store without a wake-up, catches writes from other processes
+REPORT_FEED_POLL_SECONDS = float(os.getenv("REPORT_FEED_POLL_SECONDS", "30"))
+
+
+class Subscription:
+    """ One live feed, woken up on its own event loop whenever a matching report is saved """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, employee_ids: Optional[List[str]] = None):
+        self.loop = loop
+        self.employee_ids = set(employee_ids) if employee_ids is not None else None
+        self.wake = asyncio.Event()
+
+    def notify(self, employee_id: Optional[str]):
+        if self.employee_ids is not None and employee_id not in self.employee_ids:
+            return
+        try:
+            self.loop.call_soon_threadsafe(self.wake.set)
+        except RuntimeError:
+            # the subscriber's loop is closed, it is removed when its feed exits
+            pass
+
+
+class ReportFeed:
+    """
+    Fan-out of report saves to the open subscriptions.
+
+    Saves only wake subscriptions up; each one then reads the changes after its own cursor from
+    the store. A burst of saves costs a subscriber one query, and a slow subscriber never holds
+    a backlog in memory.
+    """
+
+    def __init__(self):
+        self.subscriptions = set()
+        self.lock = threading.Lock()
+
+    def publish(self, seq: int, report: dict):
+        with self.lock:
+            subscriptions = list(self.subscriptions)
+        for subscription in subscriptions:
+            subscription.notify(report.get("employee_id"))
+
+    def subscribe(self, employee_ids: Optional[List[str]] = None) -> Subscription:
+        subscription = Subscription(asyncio.get_running_loop(), employee_ids)
+        with self.lock:
+            self.subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self.lock:
+            self.subscriptions.discard(subscription)
+
+    def count(self) -> int:
+        with self.lock:
+            return len(self.subscriptions)
+
+
+# shared process-wide feed, told about every report the store saves
+report_feed = ReportFeed()
+add_report_listener(report_feed.publish)
+
+gauge("report_feed_subscriptions", "Open live report feeds", callback=report_feed.count)
+
+
+async def follow_reports(since: int = 0, employee_ids: Optional[List[str]] = None, fields: Optional[tuple] = SUMMARY_FIELDS):
+    """
+    Yield the reports after store version `since` as snapshot pages, then the new and changed ones as they are saved.
+
+    Every message carries the cursor (the last store version it covers) that a reconnecting client passes back
+    as `since` to pick up where it left off. Reports are projected on `fields`, None sends them whole. A cursor ahead of the
+    store (the database was replaced) restarts from the beginning with "reset" set on the first page.
+    """
+    subscription = report_feed.subscribe(employee_ids)
+    reset = since > await asyncio.to_thread(get_store_version)
+    cursor = 0 if reset else since
+    try:
+        # subscribed before the first read, so a save made while the snapshot is sent still wakes the feed
+        while True:
+            rows = await asyncio.to_thread(_page, cursor, employee_ids, fields)
+            if rows:
+                cursor = rows[-1][0]
+            complete = len(rows) < REPORT_FEED_PAGE
+            yield {"type": "snapshot", "reports": _encode(rows, fields), "cursor": cursor, "complete": complete, "reset": reset}
+            reset = False
+            if complete:
+                break
+
+        while True:
+            try:
+                await asyncio.wait_for(subscription.wake.wait(), REPORT_FEED_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            # cleared before reading, a save that lands during the read wakes the next round
+            subscription.wake.clear()
+            while True:
+                rows = await asyncio.to_thread(_page, cursor, employee_ids, fields)
+                if rows:
+                    cursor = rows[-1][0]
+                    yield {"type": "changes", "reports": _encode(rows, fields), "cursor": cursor}
+                if len(rows) < REPORT_FEED_PAGE:
+                    break
+    finally:
+        report_feed.unsubscribe(subscription)
+
+
+def _page(cursor: int, employee_ids: Optional[List[str]], fields: Optional[tuple]) -> list:
+    return list_reports(cursor, employee_ids, limit=REPORT_FEED_PAGE, fields=fields)
+
+
+def _encode(rows: list, fields: Optional[tuple]) -> list:
+    if fields is None:
+        return [{"seq": seq, **report} for seq, report in rows]
+    return [report for _, report in rows]
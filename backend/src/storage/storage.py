@@ -0,0 +1,369 @@
+import os
+import re
+import json
+import logging
+import sqlite3
+import threading
+import datetime
+from typing import Dict, List, Optional
+from src.telemetry.telemetry import span
+from src.analysis.aggregates import MetricAggregateIndex, load_aggregates, report_scores, OVERALL_SCOPE, employee_scope
+
+logger = logging.getLogger(__name__)
+
+REPORTS_DB = os.getenv("REPORTS_DB", "./reports/reports.db")
+# the original whole-file database, imported once into sqlite and then renamed
+LEGACY_REPORTS_JSON = os.getenv("LEGACY_REPORTS_JSON", "./reports/all_reports.json")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reports (
+    job_id TEXT PRIMARY KEY,
+    employee_id TEXT,
+    submitted_at TEXT,
+    seq INTEGER NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_reports_employee ON reports(employee_id, seq);
+CREATE INDEX IF NOT EXISTS idx_reports_submitted_at ON reports(submitted_at);
+CREATE INDEX IF NOT EXISTS idx_reports_seq ON reports(seq);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0);
+"""
+
+# what a report list needs: "seq" is the store version the report was written at and
+# "scores" is {metric: score} taken from evaluated_transcription
+SUMMARY_FIELDS = ("seq", "job_id", "employee_id", "submission_date_time", "audio_duration", "evaluation_mode", "scores")
+FIELD_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+def parse_fields(fields: Optional[str]) -> Optional[tuple]:
+    """
+    Projection requested by a client: "summary", "full" (or nothing) for whole reports,
+    or a comma-separated list of report fields. None means whole reports.
+    """
+    if not fields or fields == "full":
+        return None
+    if fields == "summary":
+        return SUMMARY_FIELDS
+    names = tuple(dict.fromkeys(name.strip() for name in fields.split(",") if name.strip()))
+    invalid = [name for name in names if not FIELD_NAME.match(name)]
+    if invalid or not names:
+        raise ValueError(f"Invalid report fields: {', '.join(invalid) or fields}")
+    return names
+
+
+def _stored_keys(fields: tuple) -> tuple:
+    """ Report keys to read from the stored JSON for a projection """
+    keys = [name for name in fields if name not in ("seq", "scores")]
+    if "scores" in fields:
+        keys.append("evaluated_transcription")
+    return tuple(dict.fromkeys(keys))
+
+
+def _project(seq: int, keys: tuple, values: list, fields: tuple) -> dict:
+    stored = dict(zip(keys, values))
+    projected = {}
+    for name in fields:
+        if name == "seq":
+            projected[name] = seq
+        elif name == "scores":
+            projected[name] = dict(report_scores(stored))
+        elif stored.get(name) is not None:
+            projected[name] = stored[name]
+    return projected
+
+
+def normalize_timestamp(value: Optional[str]) -> Optional[str]:
+    """
+    Convert the submission time formats used over the years into sortable ISO text.
+
+    Reports written by transcribe_file use "%Y-%m-%d[%H:%M:%S]", older ones are ISO.
+    """
+    if not value:
+        return None
+    for fmt in ("%Y-%m-%d[%H:%M:%S]", "%Y-%m-%dT%H:%M:%S.%f", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d"):
+        try:
+            return datetime.datetime.strptime(value, fmt).strftime("%Y-%m-%dT%H:%M:%S")
+        except ValueError:
+            continue
+    return value
+
+
+class ReportStore:
+    """
+    Transactional report database on top of sqlite.
+
+    Reports are kept as JSON documents keyed by job_id, with indexed columns for employee_id
+    and submission time. Every write bumps a store-wide version and stamps the report with it,
+    so readers can ask for "everything after version N". WAL mode lets readers run alongside
+    a writer and BEGIN IMMEDIATE serializes concurrent writers instead of losing updates.
+
+    Indexes are kept up to date inside the same write transaction. Each one provides a schema,
+    apply(conn, report, sign) to fold a report in (+1) or out (-1), and a rebuild for existing data.
+    """
+
+    def __init__(self, path: str = REPORTS_DB, legacy_path: str = LEGACY_REPORTS_JSON, indexes: list = None):
+        self.path = path
+        self.legacy_path = legacy_path
+        self.indexes = indexes or []
+        self.local = threading.local()
+        self.init_lock = threading.Lock()
+        self.initialized = False
+        self.listeners = []
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            # autocommit mode, write transactions are opened explicitly with BEGIN IMMEDIATE
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        if not self.initialized:
+            self._initialize(conn)
+        return conn
+
+    def _initialize(self, conn: sqlite3.Connection):
+        with self.init_lock:
+            if self.initialized:
+                return
+            conn.executescript(SCHEMA)
+            self._migrate_legacy(conn)
+            self._init_indexes(conn)
+            self.initialized = True
+
+    def _init_indexes(self, conn: sqlite3.Connection):
+        for index in self.indexes:
+            conn.executescript(index.schema)
+            if not index.is_empty(conn) or conn.execute("SELECT 1 FROM reports LIMIT 1").fetchone() is None:
+                continue
+
+            logger.info("building %s from existing reports", type(index).__name__)
+
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                reports = (json.loads(data) for (data,) in conn.execute("SELECT data FROM reports ORDER BY seq").fetchall())
+                index.rebuild(conn, reports)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def _migrate_legacy(self, conn: sqlite3.Connection):
+        if not os.path.exists(self.legacy_path):
+            return
+
+        logger.info("Migrating %s into %s", self.legacy_path, self.path)
+
+        with open(self.legacy_path, "r", encoding="utf-8") as f:
+            all_reports = json.load(f)
+
+        # indexes are built from the imported reports afterwards
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for report in all_reports.values():
+                self._insert(conn, report, update_indexes=False)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        # keep the original around but make sure it is never imported twice
+        os.replace(self.legacy_path, f"{self.legacy_path}.migrated")
+
+        logger.info("migrated %d reports", len(all_reports))
+
+    def _insert(self, conn: sqlite3.Connection, report: dict, update_indexes: bool = True) -> int:
+        if update_indexes and self.indexes:
+            previous = conn.execute("SELECT data FROM reports WHERE job_id = ?", (report["job_id"],)).fetchone()
+            for index in self.indexes:
+                if previous:
+                    index.apply(conn, json.loads(previous[0]), -1)
+                index.apply(conn, report, 1)
+
+        conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+        seq = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+        conn.execute(
+            "INSERT OR REPLACE INTO reports (job_id, employee_id, submitted_at, seq, data) VALUES (?, ?, ?, ?, ?)",
+            (
+                report["job_id"],
+                report.get("employee_id"),
+                normalize_timestamp(report.get("submission_date_time")),
+                seq,
+                json.dumps(report, ensure_ascii=False),
+            ),
+        )
+        return seq
+
+    def save_report(self, report: dict) -> int:
+        """ Insert or replace a report and return the store version it was written at """
+        with span("storage.save"):
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                seq = self._insert(conn, report)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        self._notify(seq, report)
+        return seq
+
+    def add_listener(self, callback):
+        """ Call callback(seq, report) after every committed save, on the writer's thread """
+        self.listeners.append(callback)
+
+    def _notify(self, seq: int, report: dict):
+        for callback in self.listeners:
+            try:
+                callback(seq, report)
+            except Exception as e:
+                # the report is already committed, a listener problem must not fail the save
+                logger.warning("report listener failed for version %d: %s", seq, e)
+
+    def _select(self, where: str, params: tuple, fields: Optional[tuple], limit: int = -1) -> List[tuple]:
+        """
+        (seq, job_id, report) rows ordered by seq. With a projection only the requested keys are
+        pulled out of the stored JSON by sqlite, so transcriptions and prompts never reach Python.
+        """
+        with span("storage.read"):
+            if fields is None:
+                rows = self._connect().execute(f"SELECT seq, job_id, data FROM reports {where} ORDER BY seq LIMIT ?", (*params, limit))
+                return [(seq, job_id, json.loads(data)) for seq, job_id, data in rows]
+
+            keys = _stored_keys(fields)
+            if not keys:
+                rows = self._connect().execute(f"SELECT seq, job_id FROM reports {where} ORDER BY seq LIMIT ?", (*params, limit))
+                return [(seq, job_id, _project(seq, (), [], fields)) for seq, job_id in rows]
+
+            paths = ", ".join(f"'$.\"{key}\"'" for key in keys)
+            # with several paths json_extract returns a JSON array of the values in path order,
+            # the last path never matches and only keeps a single key in array form
+            extract = f"json_extract(data, {paths}, '$.__none__')"
+            rows = self._connect().execute(f"SELECT seq, job_id, {extract} FROM reports {where} ORDER BY seq LIMIT ?", (*params, limit))
+            return [(seq, job_id, _project(seq, keys, json.loads(values), fields)) for seq, job_id, values in rows]
+
+    def _query(self, where: str = "", params: tuple = (), fields: Optional[tuple] = None) -> Dict[str, dict]:
+        return {job_id: report for _, job_id, report in self._select(where, params, fields)}
+
+    def get_report(self, job_id: str) -> Optional[dict]:
+        row = self._connect().execute("SELECT data FROM reports WHERE job_id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_all_reports(self, fields: Optional[tuple] = None) -> Dict[str, dict]:
+        return self._query(fields=fields)
+
+    def get_reports_by_employee(self, employee_id: str, fields: Optional[tuple] = None) -> Dict[str, dict]:
+        return self._query("WHERE employee_id = ?", (employee_id,), fields)
+
+    def get_reports_by_date(self, start: Optional[str] = None, end: Optional[str] = None, fields: Optional[tuple] = None) -> Dict[str, dict]:
+        """ Reports submitted in [start, end], both inclusive and in any supported timestamp format """
+        clauses, params = _date_clauses(start, end)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return self._query(where, tuple(params), fields)
+
+    def list_reports(
+        self,
+        after: int = 0,
+        employee_ids: Optional[List[str]] = None,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        limit: int = 500,
+        fields: Optional[tuple] = None,
+    ) -> List[tuple]:
+        """
+        (seq, report) for up to `limit` reports written after store version `after`, oldest first.
+
+        Paging on the version never skips or repeats a report that stays unchanged. A replaced
+        report is written at a new version, so it shows up again after its old one.
+        """
+        clauses, params = _date_clauses(start, end)
+        clauses.append("seq > ?")
+        params.append(after)
+        if employee_ids is not None:
+            clauses.append(f"employee_id IN ({', '.join('?' * len(employee_ids))})")
+            params.extend(employee_ids)
+        rows = self._select(f"WHERE {' AND '.join(clauses)}", tuple(params), fields, limit)
+        return [(seq, report) for seq, _, report in rows]
+
+    def version(self) -> int:
+        return self._connect().execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+
+    def scope_version(self, scope: str) -> int:
+        """ Store version of the latest save to a scope, changes whenever a report of the scope is saved """
+        if scope == OVERALL_SCOPE:
+            return self.version()
+        employee_id = scope[len(employee_scope("")):]
+        row = self._connect().execute("SELECT MAX(seq) FROM reports WHERE employee_id = ?", (employee_id,)).fetchone()
+        return row[0] or 0
+
+    def aggregates(self, scope: str) -> dict:
+        return load_aggregates(self._connect(), scope)
+
+
+def _date_clauses(start: Optional[str], end: Optional[str]) -> tuple:
+    clauses, params = [], []
+    if start:
+        clauses.append("submitted_at >= ?")
+        params.append(normalize_timestamp(start))
+    if end:
+        clauses.append("submitted_at <= ?")
+        # a bare date covers the whole day
+        params.append(f"{end}T23:59:59" if len(end) == 10 else normalize_timestamp(end))
+    return clauses, params
+
+
+# shared process-wide store
+report_store = ReportStore(indexes=[MetricAggregateIndex()])
+
+
+def save_report(report: dict) -> int:
+    return report_store.save_report(report)
+
+
+def get_report(job_id: str) -> Optional[dict]:
+    return report_store.get_report(job_id)
+
+
+def get_all_reports(fields: Optional[tuple] = None) -> Dict[str, dict]:
+    return report_store.get_all_reports(fields)
+
+
+def get_reports_by_employee(employee_id: str, fields: Optional[tuple] = None) -> Dict[str, dict]:
+    return report_store.get_reports_by_employee(employee_id, fields)
+
+
+def get_reports_by_date(start: Optional[str] = None, end: Optional[str] = None, fields: Optional[tuple] = None) -> Dict[str, dict]:
+    return report_store.get_reports_by_date(start, end, fields)
+
+
+def list_reports(
+    after: int = 0,
+    employee_ids: Optional[List[str]] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    limit: int = 500,
+    fields: Optional[tuple] = None,
+) -> List[tuple]:
+    return report_store.list_reports(after, employee_ids, start, end, limit, fields)
+
+
+def add_report_listener(callback):
+    report_store.add_listener(callback)
+
+
+def get_store_version() -> int:
+    return report_store.version()
+
+
+def get_scope_version(scope: str) -> int:
+    return report_store.scope_version(scope)
+
+
+def get_metric_aggregates(employee_id: Optional[str] = None) -> dict:
+    """ Running per-metric aggregates over all reports, or over one employee's reports """
+    return report_store.aggregates(employee_scope(employee_id) if employee_id is not None else OVERALL_SCOPE)
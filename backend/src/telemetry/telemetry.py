@@ -0,0 +1,238 @@
+import os
+import math
+import time
+import logging
+import threading
+import contextvars
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# DEBUG adds a line per span and the LLM's raw answers, INFO logs one line per pipeline step
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# jobs whose per-stage timings are kept for GET /jobs/{job_id}
+TELEMETRY_JOBS = int(os.getenv("TELEMETRY_JOBS", "1000"))
+
+# seconds, from a short prompt build up to a long call's diarization
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+# job the current thread or task is working on, set by job_context and read by every span
+current_job = contextvars.ContextVar("current_job", default=None)
+
+logger = logging.getLogger(__name__)
+
+
+def configure_logging(level: str = LOG_LEVEL):
+    """ Leveled logging for the whole backend, called once at startup """
+    logging.basicConfig(level=level, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """ A named metric with a fixed set of label names, one series per label combination """
+
+    kind = None
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(name, "") for name in self.label_names)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            for key, value in sorted(self.series.items()):
+                lines.extend(self._render_series(key, value))
+        return lines
+
+    def _render_series(self, key: tuple, value) -> list:
+        return [f"{self.name}{_labels(self.label_names, key)} {_number(value)}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.series[key] = self.series.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """ Set directly, or read from a callback at scrape time when one is given """
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), callback=None):
+        super().__init__(name, help, labels)
+        self.callback = callback
+
+    def set(self, value: float, **labels):
+        with self.lock:
+            self.series[self._key(labels)] = value
+
+    def render(self) -> list:
+        if self.callback is not None:
+            try:
+                value = self.callback()
+            except Exception as e:
+                logger.warning("gauge %s callback failed: %s", self.name, e)
+                value = None
+            if value is not None:
+                self.set(value)
+        return super().render()
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = DURATION_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [[0] * len(self.buckets), 0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += 1
+            series[2] += value
+
+    def _render_series(self, key: tuple, value) -> list:
+        counts, count, total = value
+        lines = []
+        for bound, bucket in zip(self.buckets + (math.inf,), counts + [count]):
+            le = 'le="' + _number(bound) + '"'
+            lines.append(f"{self.name}_bucket{_labels(self.label_names, key, le)} {bucket}")
+        lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {_number(total)}")
+        lines.append(f"{self.name}_count{_labels(self.label_names, key)} {count}")
+        return lines
+
+
+class Registry:
+    """ Every metric of the process, rendered together in the Prometheus text format """
+
+    def __init__(self):
+        self.metrics = OrderedDict()
+        self.lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self.lock:
+            # modules can be re-imported (reload in dev), keep the first instance
+            return self.metrics.setdefault(metric.name, metric)
+
+    def render(self) -> str:
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def counter(name: str, help: str, labels: tuple = ()) -> Counter:
+    return registry.register(Counter(name, help, labels))
+
+
+def gauge(name: str, help: str, labels: tuple = (), callback=None) -> Gauge:
+    return registry.register(Gauge(name, help, labels, callback))
+
+
+def histogram(name: str, help: str, labels: tuple = (), buckets: tuple = DURATION_BUCKETS) -> Histogram:
+    return registry.register(Histogram(name, help, labels, buckets))
+
+
+stage_seconds = histogram("pipeline_stage_seconds", "Time spent in each pipeline stage", ("stage",))
+stage_errors = counter("pipeline_stage_errors_total", "Pipeline stages that raised", ("stage",))
+
+
+class JobTimings:
+    """ Seconds spent per stage for the most recent jobs, so a slow job can be looked at after the fact """
+
+    def __init__(self, max_jobs: int = TELEMETRY_JOBS):
+        self.max_jobs = max_jobs
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+
+    def add(self, job_id: str, stage: str, seconds: float):
+        with self.lock:
+            timings = self.jobs.get(job_id)
+            if timings is None:
+                timings = self.jobs[job_id] = {}
+                while len(self.jobs) > self.max_jobs:
+                    self.jobs.popitem(last=False)
+            timings[stage] = timings.get(stage, 0.0) + seconds
+
+    def get(self, job_id: str) -> dict:
+        with self.lock:
+            return {stage: round(seconds, 4) for stage, seconds in self.jobs.get(job_id, {}).items()}
+
+
+job_timings = JobTimings()
+
+
+@contextmanager
+def job_context(job_id: str):
+    """ Tag every span inside the block with job_id """
+    token = current_job.set(job_id)
+    try:
+        yield
+    finally:
+        current_job.reset(token)
+
+
+@contextmanager
+def span(stage: str):
+    """
+    Time a pipeline stage: observed in pipeline_stage_seconds, added to the current job's timings
+    and logged at DEBUG with the job_id.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        stage_errors.inc(stage=stage)
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        stage_seconds.observe(seconds, stage=stage)
+        job_id = current_job.get()
+        if job_id is not None:
+            job_timings.add(job_id, stage, seconds)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("span stage=%s job_id=%s seconds=%.4f", stage, job_id, seconds)
+
+
+def get_job_timings(job_id: str) -> dict:
+    return job_timings.get(job_id)
+
+
+def render_metrics() -> str:
+    return registry.render()
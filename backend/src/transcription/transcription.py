@@ -1,13 +1,48 @@
-import whisper
-from pyannote.audio import Pipeline
+from src.models.models import get_whisper_model, get_diarization_pipeline, model_lock, WHISPER_MODEL, DIARIZATION_MODEL
+from src.checkpoints.checkpoints import checkpoints, stage_key
+from src.jobs.scratch import scratch_dir
+from src.telemetry.telemetry import span, counter, gauge
+from whisper.audio import SAMPLE_RATE
 import os
-from dotenv import load_dotenv
-from pydub import AudioSegment
-import re
+from time import perf_counter
 import datetime
+import threading
+import subprocess
+import numpy as np
+import torch
+import logging
 
-# Load the Whisper model globally
-whisper_model = whisper.load_model("small")
+logger = logging.getLogger(__name__)
+
+# "single_pass" transcribes the whole call once and aligns words to speaker turns,
+# "per_turn" runs whisper separately on every diarization turn
+TRANSCRIPTION_MODE = os.getenv("TRANSCRIPTION_MODE", "single_pass")
+# same-speaker turns separated by at most this much silence are transcribed as one turn
+MERGE_GAP_MS = int(os.getenv("MERGE_GAP_MS", "500"))
+# turns shorter than this are absorbed into a neighbouring turn, or dropped when they have none
+MIN_TURN_MS = int(os.getenv("MIN_TURN_MS", "400"))
+# back the decoded call with a file in the job's scratch directory instead of process memory
+AUDIO_MEMMAP = os.getenv("AUDIO_MEMMAP", "0") == "1"
+
+# silence added in front of the call so the models don't miss any audio
+PAD_MS = 2000
+PAD_SAMPLES = PAD_MS * SAMPLE_RATE // 1000
+BYTES_PER_SAMPLE = 4
+DECODE_CHUNK_BYTES = 1024 * 1024
+
+# how much coalescing shrank the diarization output since startup
+turn_stats_lock = threading.Lock()
+turn_stats = {
+    "diarizations": 0,
+    "diarized_turns": 0,
+    "coalesced_turns": 0,
+    "blips_absorbed": 0,
+    "blips_dropped": 0,
+    "asr_calls_saved": 0,
+}
+
+audio_seconds = counter("audio_processed_seconds_total", "Seconds of call audio diarized and transcribed")
+audio_wall_seconds = counter("audio_processing_wall_seconds_total", "Wall-clock seconds spent diarizing and transcribing")
 
 def map_speakers(transcription):
     """
@@ -37,82 +72,343 @@ def map_speakers(transcription):
     # Join lines with a space (or newline if you prefer).
     return " ".join(formatted_lines)
 
-def transcribe_file(filepath: str):
+def transcribe_file(filepath: str, progress=None, mode: str = None, audio_key: str = None):
+    """
+    Diarize and transcribe an audio file.
+
+    The upload is decoded once into a 16 kHz mono float32 buffer that diarization and whisper both read.
+    When audio_key (the SHA-256 of the file) is given, every stage's output is checkpointed
+    under it and the model versions, and a repeated call resumes after the last finished stage.
+    """
+    mode = mode or TRANSCRIPTION_MODE
+    progress = progress or (lambda stage, fraction: None)
     time = datetime.datetime.now().strftime("%Y-%m-%d[%H:%M:%S]")
-    temp_name = "audio.wav"
-    
-    audio = AudioSegment.from_file(filepath)
 
-    duration_ms = len(audio)
-    duration_sec = int(duration_ms / 1000)  
+    audio_stage = stage_key(audio_key) if audio_key else None
+    diarization_stage = stage_key(audio_key, DIARIZATION_MODEL) if audio_key else None
+    transcription_stage = stage_key(audio_key, DIARIZATION_MODEL, WHISPER_MODEL, mode, MERGE_GAP_MS, MIN_TURN_MS) if audio_key else None
+
+    audio_meta = checkpoints.load("audio", audio_stage)
+    transcription_final = checkpoints.load("transcription", transcription_stage)
+    if audio_meta is not None and transcription_final is not None:
+        progress("diarizing", 1.0)
+        progress("transcribing", 1.0)
+        return (transcription_final, time, audio_meta["duration"])
+
+    # every intermediate file lives in a private scratch directory that is always removed,
+    # so concurrent jobs never touch each other's audio
+    with scratch_dir("transcribe-") as workdir:
+        started = perf_counter()
+        with span("decode"):
+            samples = decode_audio(filepath, workdir)
+
+        if audio_meta is None:
+            audio_meta = {"duration": format_duration((len(samples) - PAD_SAMPLES) // SAMPLE_RATE)}
+            checkpoints.save("audio", audio_stage, audio_meta)
+
+        if transcription_final is None:
+            transcription = transcribe_samples(samples, mode, diarization_stage, progress)
+            transcription_final = map_speakers(transcription)
+            checkpoints.save("transcription", transcription_stage, transcription_final)
+            audio_seconds.inc((len(samples) - PAD_SAMPLES) / SAMPLE_RATE)
+            audio_wall_seconds.inc(perf_counter() - started)
+
+        # drop the buffer before its backing file is removed
+        del samples
+
+    return (transcription_final, time, audio_meta["duration"])
+
+def transcribe_samples(samples, mode: str, diarization_stage: str, progress):
+    """
+    Diarize the decoded call, coalesce the turns and transcribe them.
+
+    Returns:
+        list of tuple: (speaker_id, text) for each turn
+    """
+    progress("diarizing", 0.0)
+    # the raw turns are checkpointed so changing the coalescing thresholds doesn't rerun pyannote
+    turns = checkpoints.load("diarization", diarization_stage)
+    if turns is None:
+        turns = diarize(samples)
+        checkpoints.save("diarization", diarization_stage, turns)
+    dzList = coalesce_turns(turns)
+    progress("diarizing", 1.0)
+
+    logger.info("Diarization done, %d turns coalesced into %d", len(turns), len(dzList))
+
+    # Use the resident Whisper model from the registry
+    model = get_whisper_model()
+
+    logger.info("Adding items to transcription list (%s)", mode)
+    progress("transcribing", 0.0)
+    transcription = None
+    if mode == "single_pass":
+        transcription = transcribe_single_pass(model, samples, dzList)
+    if transcription is None:
+        transcription = transcribe_per_turn(model, samples, dzList, progress)
+        with turn_stats_lock:
+            turn_stats["asr_calls_saved"] += len(turns) - len(dzList)
+    progress("transcribing", 1.0)
+
+    logger.info("Transcription done")
+
+    return transcription
 
+def decode_audio(filepath: str, workdir: str = None):
+    """
+    Decode an upload with a single streaming ffmpeg pass into 16 kHz mono float32,
+    preceded by PAD_MS of silence so the models don't miss the first words.
+
+    ffmpeg's output is read in chunks straight into the final buffer, so the original
+    sample rate and channel count are never held in memory. With AUDIO_MEMMAP=1 the
+    buffer is a file in workdir mapped into memory instead of a heap allocation.
+
+    Returns:
+        np.ndarray: float32 samples at SAMPLE_RATE, including the leading pad
+    """
+    cmd = [
+        "ffmpeg", "-nostdin", "-loglevel", "error", "-threads", "0",
+        "-i", filepath,
+        "-f", "f32le", "-ac", "1", "-acodec", "pcm_f32le", "-ar", str(SAMPLE_RATE),
+        "-",
+    ]
+    pad = bytes(PAD_SAMPLES * BYTES_PER_SAMPLE)
+    use_memmap = AUDIO_MEMMAP and workdir is not None
+    if use_memmap:
+        buffer_path = os.path.join(workdir, "audio.f32")
+        buffer = open(buffer_path, "wb")
+        buffer.write(pad)
+    else:
+        buffer = bytearray(pad)
+
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        for chunk in iter(lambda: process.stdout.read(DECODE_CHUNK_BYTES), b""):
+            if use_memmap:
+                buffer.write(chunk)
+            else:
+                buffer += chunk
+        stderr = process.stderr.read()
+        process.wait()
+    finally:
+        if use_memmap:
+            buffer.close()
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+
+    if process.returncode != 0:
+        raise RuntimeError(f"Failed to decode audio: {stderr.decode(errors='replace').strip()}")
+
+    if use_memmap:
+        return np.memmap(buffer_path, dtype=np.float32, mode="r+")
+    return np.frombuffer(buffer, dtype=np.float32)
+
+def format_duration(duration_sec: int) -> str:
+    """ Length of the recording as HH:MM:SS """
     hours = duration_sec // 3600
     minutes = (duration_sec % 3600) // 60
     seconds = duration_sec % 60
 
-    duration = f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
 
-    file = pad_audio(filepath, temp_name)
-    
-    load_dotenv()
-    pipeline = Pipeline.from_pretrained("pyannote/speaker-diarization-3.1", use_auth_token=os.getenv("HUGGING_FACE"))
-    dz = pipeline(file)
-    
-    with open("diarization.txt", "w") as text_file:
-        text_file.write(str(dz))
-
-    # extract the diarization data into an easily parsable list
-    dz = open('diarization.txt').read().splitlines()
-    dzList = []
-    for l in dz:
-        start, end =  tuple(re.findall('[0-9]+:[0-9]+:[0-9]+\.[0-9]+', string=l))
-        start = millisec(start)
-        end = millisec(end)
-        lex = re.findall('\sSPEAKER_(\d\d)', string=l)
-        dzList.append((start, end, lex[0]))
-    
-    print("---------------------") 
-    print("Log: diarization done")
-    print("---------------------")
-    
-    # Use the pre-loaded Whisper model
-    model = whisper_model  # No need to load it again
-    
+def diarize(samples):
+    """
+    Run the resident pyannote pipeline on the decoded call and read the turns off the annotation.
+
+    Args:
+        samples (np.ndarray): padded 16 kHz mono float32 audio from decode_audio
+
+    Returns:
+        list of tuple: (start_ms, end_ms, speaker_id) for each turn, sorted by start
+    """
+    pipeline = get_diarization_pipeline()
+    # in-memory input, the tensor shares the decoded buffer instead of pyannote reading the file again
+    waveform = torch.from_numpy(samples).unsqueeze(0)
+    with model_lock("diarization"), span("diarization"):
+        dz = pipeline({"waveform": waveform, "sample_rate": SAMPLE_RATE})
+
+    return [
+        (int(turn.start * 1000), int(turn.end * 1000), speaker)
+        for turn, _, speaker in dz.itertracks(yield_label=True)
+    ]
+
+def coalesce_turns(turns, merge_gap_ms: int = None, min_turn_ms: int = None):
+    """
+    Merge consecutive same-speaker turns separated by short gaps and fold short blips into their neighbours,
+    so whisper runs on fewer, longer turns.
+
+    A blip shorter than min_turn_ms extends the previous turn when it starts within merge_gap_ms of it,
+    otherwise the next turn when that starts within merge_gap_ms, and is dropped when neither is close.
+    If every turn is a blip they are all kept, a very short call still gets transcribed.
+
+    Args:
+        turns (list of tuple): (start_ms, end_ms, speaker_id) from diarize
+        merge_gap_ms (int): longest silence bridged between two turns, MERGE_GAP_MS when None
+        min_turn_ms (int): shortest turn transcribed on its own, MIN_TURN_MS when None
+
+    Returns:
+        list of tuple: (start_ms, end_ms, speaker_id) for each coalesced turn, sorted by start
+    """
+    merge_gap_ms = MERGE_GAP_MS if merge_gap_ms is None else merge_gap_ms
+    min_turn_ms = MIN_TURN_MS if min_turn_ms is None else min_turn_ms
+    turns = sorted((tuple(turn) for turn in turns), key=lambda turn: (turn[0], turn[1]))
+
+    kept = []
+    absorbed = dropped = 0
+    if all(end - start < min_turn_ms for start, end, _ in turns):
+        kept = [list(turn) for turn in turns]
+    else:
+        pending = None  # [start, end, count] of blips waiting to be absorbed by the next turn
+        for start, end, speaker in turns:
+            if end - start >= min_turn_ms:
+                if pending is not None:
+                    if start - pending[1] <= merge_gap_ms:
+                        start = min(start, pending[0])
+                        absorbed += pending[2]
+                    else:
+                        dropped += pending[2]
+                    pending = None
+                kept.append([start, end, speaker])
+            elif kept and pending is None and start - kept[-1][1] <= merge_gap_ms:
+                kept[-1][1] = max(kept[-1][1], end)
+                absorbed += 1
+            elif pending is not None and start - pending[1] <= merge_gap_ms:
+                pending[1] = max(pending[1], end)
+                pending[2] += 1
+            else:
+                if pending is not None:
+                    dropped += pending[2]
+                pending = [start, end, 1]
+        if pending is not None:
+            dropped += pending[2]
+
+    merged = []
+    for start, end, speaker in kept:
+        if merged and merged[-1][2] == speaker and start - merged[-1][1] <= merge_gap_ms:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end, speaker])
+
+    with turn_stats_lock:
+        turn_stats["diarizations"] += 1
+        turn_stats["diarized_turns"] += len(turns)
+        turn_stats["coalesced_turns"] += len(merged)
+        turn_stats["blips_absorbed"] += absorbed
+        turn_stats["blips_dropped"] += dropped
+
+    return [tuple(turn) for turn in merged]
+
+def transcribe_per_turn(model, samples, dzList, progress):
+    """
+    Run whisper separately on every diarization turn.
+
+    Returns:
+        list of tuple: (speaker_id, text) for each turn
+    """
     # for each segment transcribe it and append to the list
     transcription = []
-    print("Log: adding items to transcription list")
-    for item in dzList:
-        audio = AudioSegment.from_wav(file)
-        a = audio[item[0]: item[1]]
-        a.export("a.wav", format="wav")
-        result = model.transcribe("a.wav")
-        transcription.append((item[2], result["text"]))
-    
-    print("-----------------------")
-    print("Log: transcription done")
-    print("-----------------------")
-    
-    # clean up temp files
-    os.remove("a.wav")
-    os.remove("audio.wav")
-    os.remove("diarization.txt")
-    
-    transcription_final = map_speakers(transcription)
+    for i, item in enumerate(dzList):
+        segment = slice_turn(samples, item[0], item[1])
+        text = ""
+        if len(segment):
+            with model_lock("whisper"), span("asr_segment"):
+                text = model.transcribe(segment)["text"]
+        transcription.append((item[2], text))
+        progress("transcribing", (i + 1) / len(dzList))
+    return transcription
 
-    return (transcription_final, time, duration)
+def transcribe_single_pass(model, samples, dzList):
+    """
+    Transcribe the whole call once with word timestamps and assign each word to a diarization turn.
 
-# adds a blank 2 second pad to the beginning of the clip to ensure the model doesn't miss any audio
-def pad_audio(filepath, output_name="audio.wav"):    
-    audio = AudioSegment.from_file(filepath)
-    spacermilli = 2000
-    spacer = AudioSegment.silent(duration=spacermilli)
-    audio = spacer.append(audio, crossfade=0)
+    Returns:
+        list of tuple: (speaker_id, text) for each turn, same shape as transcribe_per_turn,
+        or None if whisper returned no word timestamps so the caller can fall back
+    """
+    with model_lock("whisper"), span("asr_single_pass"):
+        result = model.transcribe(samples, word_timestamps=True)
+    words = [
+        (word["start"] * 1000, word["end"] * 1000, word["word"])
+        for segment in result["segments"]
+        for word in segment.get("words", [])
+    ]
+    if not words and result["text"].strip():
+        return None
+
+    turn_words = assign_words_to_turns(words, dzList)
+    return [(item[2], "".join(turn_words[i])) for i, item in enumerate(dzList)]
+
+def assign_words_to_turns(words, dzList):
+    """
+    Assign each timed word to the diarization turn it overlaps most, or the nearest turn if it overlaps none.
+
+    Args:
+        words (list of tuple): (start_ms, end_ms, text) sorted by start
+        dzList (list of tuple): (start_ms, end_ms, speaker_id) sorted by start
+
+    Returns:
+        list of list: the words' text for each turn, in turn order
+    """
+    turn_words = [[] for _ in dzList]
+    if not dzList:
+        return turn_words
+
+    # running max of turn ends, lets the scan skip turns that finished before the current word
+    max_end = []
+    for start, end, _ in dzList:
+        max_end.append(max(end, max_end[-1]) if max_end else end)
+
+    first = 0
+    for word_start, word_end, text in words:
+        while first < len(dzList) - 1 and max_end[first] <= word_start:
+            first += 1
+
+        best, best_overlap = None, 0
+        k = first
+        while k < len(dzList) and dzList[k][0] < word_end:
+            overlap = min(word_end, dzList[k][1]) - max(word_start, dzList[k][0])
+            if overlap > best_overlap:
+                best, best_overlap = k, overlap
+            k += 1
+
+        if best is None:
+            # word falls in a gap, give it to whichever neighbouring turn is closer
+            candidates = {max(first - 1, 0), first, min(k, len(dzList) - 1)}
+            best = min(candidates, key=lambda i: max(dzList[i][0] - word_end, word_start - dzList[i][1]))
+
+        turn_words[best].append(text)
+
+    return turn_words
+
+def slice_turn(samples, start_ms, end_ms):
+    """
+    Return the samples of a diarization turn as a view into the decoded call, no copy is made.
+
+    Args:
+        samples (np.ndarray): 16 kHz mono float32 audio of the whole call
+        start_ms (int): turn start in milliseconds
+        end_ms (int): turn end in milliseconds
+
+    Returns:
+        np.ndarray: the turn's samples
+    """
+    start = start_ms * SAMPLE_RATE // 1000
+    end = end_ms * SAMPLE_RATE // 1000
+    return samples[start:end]
+
+def get_turn_stats() -> dict:
+    """ Diarization turns before and after coalescing and the whisper calls it saved, since startup """
+    with turn_stats_lock:
+        stats = dict(turn_stats)
+    stats["merge_gap_ms"] = MERGE_GAP_MS
+    stats["min_turn_ms"] = MIN_TURN_MS
+    return stats
+
+
+def _audio_speed():
+    wall = sum(audio_wall_seconds.series.values())
+    return sum(audio_seconds.series.values()) / wall if wall else None
 
-    audio.export(output_name, format='wav')
-    
-    return output_name
 
-def millisec(timeStr):
-    spl = timeStr.split(":")
-    s = (int)((int(spl[0]) * 60 * 60 + int(spl[1]) * 60 + float(spl[2]) )* 1000)
-    return s
+gauge("audio_seconds_per_wall_second", "Call audio processed per second of processing since startup", callback=_audio_speed)
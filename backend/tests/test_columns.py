@@ -0,0 +1,103 @@
+import os
+import numpy as np
+import pytest
+from src.storage import storage
+from src.storage.columns import ScoreColumns, INITIAL_ROWS, INITIAL_METRICS
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    # a private report store the columns read through the module-level helpers
+    report_store = storage.ReportStore(str(tmp_path / "reports.db"), str(tmp_path / "all_reports.json"))
+    monkeypatch.setattr(storage, "report_store", report_store)
+    return report_store
+
+
+def report(i: int, metrics: int = 3, score: float = None) -> dict:
+    return {
+        "job_id": f"job-{i}",
+        "employee_id": f"e{i % 4}",
+        "submission_date_time": f"2024-01-{1 + i % 28:02d}[10:00:00]",
+        "audio_duration": "00:02:05",
+        "evaluated_transcription": [[f"m{m}", score if score is not None else (i + m) % 5 + 1, ""] for m in range(metrics)],
+    }
+
+
+def table(snapshot: dict) -> dict:
+    """ (job_id, metric) -> score, independent of row and column order """
+    return {
+        (job_id.decode(), metric): float(snapshot["scores"][r, m])
+        for r, job_id in enumerate(snapshot["job_id"])
+        for m, metric in enumerate(snapshot["metrics"])
+        if not np.isnan(snapshot["scores"][r, m])
+    }
+
+
+def test_sync_appends_and_replaces(store, tmp_path):
+    for i in range(5):
+        store.save_report(report(i))
+    store.save_report(report(2, score=1.5))
+
+    snapshot = ScoreColumns(str(tmp_path / "columns")).snapshot()
+
+    assert len(snapshot["seq"]) == 5
+    assert table(snapshot)[("job-2", "m0")] == 1.5
+    assert snapshot["duration"][0] == 125
+    assert str(snapshot["timestamp"][1]) == "2024-01-02T10:00:00"
+    assert sorted(snapshot["employees"]) == ["e0", "e1", "e2", "e3"]
+
+
+def test_snapshot_is_a_read_only_view(store, tmp_path):
+    for i in range(10):
+        store.save_report(report(i))
+    columns = ScoreColumns(str(tmp_path / "columns"))
+    snapshot = columns.snapshot()
+    expected = table(snapshot)
+
+    with pytest.raises(ValueError):
+        snapshot["scores"][0, 0] = 2.0
+
+    # appending past the capacity moves the columns to new files, the view keeps its rows
+    for i in range(10, INITIAL_ROWS + 10):
+        store.save_report(report(i, metrics=INITIAL_METRICS + 2))
+    columns.sync()
+
+    assert len(snapshot["seq"]) == 10
+    assert table(snapshot) == expected
+
+
+def test_reload_after_interrupted_apply_with_resize(store, tmp_path, monkeypatch):
+    directory = str(tmp_path / "columns")
+    for i in range(10):
+        store.save_report(report(i))
+    ScoreColumns(directory).sync()
+
+    # enough new reports and metrics to grow the files in both directions, then fail before the commit
+    for i in range(10, INITIAL_ROWS + 10):
+        store.save_report(report(i, metrics=INITIAL_METRICS + 2))
+    interrupted = ScoreColumns(directory)
+
+    def crash(*args):
+        raise RuntimeError("crash before commit")
+
+    monkeypatch.setattr(interrupted, "_commit", crash)
+    with pytest.raises(RuntimeError):
+        interrupted.sync()
+    assert os.path.getsize(os.path.join(directory, "scores.bin")) > INITIAL_ROWS * INITIAL_METRICS * 4
+
+    reloaded = ScoreColumns(directory).snapshot()
+    rebuilt = ScoreColumns(str(tmp_path / "rebuilt")).snapshot()
+    assert len(reloaded["seq"]) == INITIAL_ROWS + 10
+    assert table(reloaded) == table(rebuilt)
+
+
+def test_rebuild_when_files_do_not_match(store, tmp_path):
+    directory = str(tmp_path / "columns")
+    for i in range(20):
+        store.save_report(report(i))
+    expected = table(ScoreColumns(directory).snapshot())
+
+    with open(os.path.join(directory, "scores.bin"), "ab") as f:
+        f.write(b"\0" * 64)
+
+    assert table(ScoreColumns(directory).snapshot()) == expected
@@ -0,0 +1,56 @@
+import numpy as np
+from src.analysis.leaderboard import grouped_quantiles, grouped_statistics, competition_rank, build_leaderboard, PERCENTILES
+
+
+def test_grouped_quantiles_match_np_percentile():
+    rng = np.random.default_rng(0)
+    groups = rng.integers(0, 6, size=500)
+    scores = rng.uniform(1, 5, size=500).round(1)
+
+    # group 6 has no scores at all
+    result = grouped_quantiles(groups, scores, 7, PERCENTILES)
+
+    for g in range(6):
+        for name, q in PERCENTILES.items():
+            assert np.isclose(result[name][g], np.percentile(scores[groups == g], q))
+    assert all(np.isnan(values[6]) for values in result.values())
+
+
+def test_grouped_quantiles_single_score():
+    result = grouped_quantiles(np.array([1]), np.array([3.5]), 2, PERCENTILES)
+    assert [values[1] for values in result.values()] == [3.5, 3.5, 3.5]
+
+
+def test_grouped_statistics():
+    groups = np.array([0, 0, 0, 1])
+    scores = np.array([4.0, 5.0, 3.0, 2.0])
+
+    stats = grouped_statistics(groups, scores, 3, threshold=4.5)
+
+    assert stats["count"].tolist() == [3, 1, 0]
+    assert np.allclose(stats["mean"][:2], [4.0, 2.0])
+    assert np.isclose(stats["std"][0], np.std([4.0, 5.0, 3.0]))
+    assert stats["min"][0] == 3.0 and stats["max"][0] == 5.0
+    assert np.isclose(stats["percentage_above_threshold"][0], 100 / 3)
+    assert np.isnan(stats["mean"][2]) and np.isnan(stats["min"][2])
+
+
+def test_competition_rank_ties():
+    ranks = competition_rank(np.array([4.0, 5.0, 4.0, np.nan, 3.0, 5.0]))
+    # 1224 ranking, unscored stays unranked
+    assert ranks.tolist() == [3, 1, 3, 0, 5, 1]
+
+
+def test_build_leaderboard_min_reports():
+    employees, metrics = ["a", "b", "c"], ["m0", "m1"]
+    employee_codes = np.array([0, 0, 1, 1, 2])
+    metric_codes = np.array([0, 1, 0, 1, 0])
+    scores = np.array([5.0, 4.0, 3.0, 5.0, 5.0])
+    report_counts = np.array([2, 2, 1])
+
+    board = build_leaderboard(employee_codes, metric_codes, scores, employees, metrics, report_counts, min_reports=2)
+
+    assert board["rank"][0].tolist() == [1, 2, 0]
+    assert np.allclose(board["overall"], [4.5, 4.0, 5.0])
+    # c has the best overall mean but too few reports
+    assert board["overall_rank"].tolist() == [1, 2, 0]
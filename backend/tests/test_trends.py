@@ -0,0 +1,107 @@
+import numpy as np
+import pytest
+from src.analysis.trends import lttb, downsample_metrics, bucket_starts, bucketed_trends
+from src.storage.columns import date_mask
+
+
+def test_lttb_keeps_endpoints_and_peaks():
+    x = np.arange(1000)
+    y = np.sin(x / 50)
+    y[437], y[812] = 10, -10
+
+    kept = lttb(x, y, 40)
+
+    assert len(kept) == 40
+    assert kept[0] == 0 and kept[-1] == 999
+    assert 437 in kept and 812 in kept
+    assert np.all(np.diff(kept) > 0)
+
+
+def test_lttb_short_series_untouched():
+    assert lttb(np.arange(5), np.ones(5), 10).tolist() == [0, 1, 2, 3, 4]
+    assert lttb(np.arange(2), np.ones(2), 1).tolist() == [0, 1]
+
+
+def test_downsample_metrics_keeps_labels_aligned():
+    scores = list(range(100))
+    data = downsample_metrics({"m": {"scores": scores, "labels": [f"r{i}" for i in scores]}}, 10)["m"]
+
+    assert len(data["scores"]) == 10 and data["reports"] == 100
+    assert data["labels"] == [f"r{score}" for score in data["scores"]]
+
+
+def test_bucket_starts():
+    timestamps = np.array(
+        ["2024-10-13T23:59:59", "2024-10-14T00:00:00", "2024-10-20T12:00:00", "2024-10-21T08:00:00", "2024-02-29T08:00:00"],
+        dtype="datetime64[s]",
+    )
+
+    # 2024-10-14 was a Monday
+    assert [str(d) for d in bucket_starts(timestamps, "week")] == ["2024-10-07", "2024-10-14", "2024-10-14", "2024-10-21", "2024-02-26"]
+    assert [str(d) for d in bucket_starts(timestamps, "month")] == ["2024-10-01"] * 4 + ["2024-02-01"]
+    assert str(bucket_starts(timestamps, "day")[0]) == "2024-10-13"
+    with pytest.raises(ValueError):
+        bucket_starts(timestamps, "year")
+
+
+def columns(days: list, scores: list) -> dict:
+    return {
+        "timestamp": np.array([f"{day}T12:00:00" if day else "NaT" for day in days], dtype="datetime64[s]"),
+        "scores": np.array(scores, dtype=np.float32).reshape(len(scores), -1),
+        "metrics": ["m0", "m1"][:np.array(scores).reshape(len(scores), -1).shape[1]],
+    }
+
+
+def test_bucketed_trends_rolling_window():
+    # buckets of one score each except day 3 (two scores), day 5 has none and day 2's report has no time
+    days = ["2024-01-01", None, "2024-01-03", "2024-01-03", "2024-01-04", "2024-01-06"]
+    data = columns(days, [1, 5, 2, 4, 4, 5])
+
+    trend = bucketed_trends(data, bucket="day", window=2)["m0"]
+
+    assert trend["buckets"] == ["2024-01-01", "2024-01-03", "2024-01-04", "2024-01-06"]
+    assert trend["mean"] == [1.0, 3.0, 4.0, 5.0]
+    assert trend["count"] == [1, 2, 1, 1]
+    assert trend["min"] == [1.0, 2.0, 4.0, 5.0] and trend["max"] == [1.0, 4.0, 4.0, 5.0]
+    # weighted by count over the last two buckets with scores, the first bucket only has itself
+    assert trend["rolling_mean"] == [1.0, round(7 / 3, 4), round(10 / 3, 4), 4.5]
+
+
+def test_bucketed_trends_window_covering_everything_and_filters():
+    data = columns(["2024-01-01", "2024-01-02", "2024-01-03"], [[1, np.nan], [2, np.nan], [3, np.nan]])
+
+    trends = bucketed_trends(data, np.array([True, True, False]), bucket="day", window=10)
+
+    # m1 was never scored
+    assert list(trends) == ["m0"]
+    assert trends["m0"]["rolling_mean"] == [1.0, 1.5]
+
+
+def test_bucketed_trends_downsampled():
+    days = np.arange(np.datetime64("2024-01-01"), np.datetime64("2024-12-31")).astype(str).tolist()
+    data = columns(days, np.linspace(1, 5, len(days)).tolist())
+
+    trend = bucketed_trends(data, bucket="day", max_points=20)["m0"]
+
+    assert len(trend["buckets"]) == 20 and trend["buckets_total"] == len(days)
+    assert trend["buckets"][0] == days[0] and trend["buckets"][-1] == days[-1]
+
+
+def test_bucketed_trends_rejects_bad_arguments():
+    data = columns(["2024-01-01"], [1])
+    with pytest.raises(ValueError):
+        bucketed_trends(data, window=0)
+    with pytest.raises(ValueError):
+        bucketed_trends(data, max_points=2)
+
+
+def test_date_mask_bounds():
+    data = columns(["2024-01-01", "2024-01-02", "2024-01-03"], [1, 2, 3])
+
+    # a bare end date covers the whole day
+    assert date_mask(data, "2024-01-02", "2024-01-03").tolist() == [False, True, True]
+    assert date_mask(data) is None
+    with pytest.raises(ValueError):
+        date_mask(data, start="last week")
+    with pytest.raises(ValueError):
+        date_mask(data, end="2024-13-45")
@@ -0,0 +1,402 @@
+# Offline benchmark of the evaluation pipeline.
+#   python benchmarks/run.py                                  # everything, writes benchmark_results.json
+#   python benchmarks/run.py --skip-audio --repeats 50        # text stages only, no whisper/pyannote needed
+#   python benchmarks/run.py --output new.json --baseline benchmarks/baseline.json
+# The LLM is a local stub (benchmarks/stub_ollama.py) unless --ollama-host is given, every store, cache
+# and scratch file goes to a temporary directory, and all inputs come from fixed seeds and data/example.json,
+# so two runs on the same machine measure the same work. Stages whose models can't be loaded are
+# reported as skipped instead of failing the run.
+# With --baseline the run exits 1 if any stage's p50/p90 latency grew, or any throughput dropped,
+# by more than --tolerance.
+import os
+import sys
+import ast
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import resource
+import datetime
+import tempfile
+import subprocess
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from stub_ollama import start_stub
+from synthetic_audio import write_call
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND_DIR = os.path.join(ROOT_DIR, "backend")
+EXAMPLE_PATH = os.path.join(ROOT_DIR, "data", "example.json")
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def summarize(seconds: list) -> dict:
+    values = np.array(seconds) * 1000
+    return {
+        "count": len(values),
+        "mean_ms": round(float(values.mean()), 3),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p90_ms": round(float(np.percentile(values, 90)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+        "max_ms": round(float(values.max()), 3),
+    }
+
+
+class Results:
+    """ Latencies per stage, throughput figures and the peak RSS seen after each stage """
+
+    def __init__(self):
+        self.latencies = {}
+        self.stages = {}
+        self.throughput = {}
+        self.skipped = {}
+
+    @contextmanager
+    def timed(self, stage: str):
+        start = time.perf_counter()
+        yield
+        self.latencies.setdefault(stage, []).append(time.perf_counter() - start)
+
+    def close_stage(self, stage: str, **extra):
+        self.stages[stage] = {**summarize(self.latencies[stage]), "peak_rss_mb": peak_rss_mb(), **extra}
+
+    def skip(self, stage: str, reason: str):
+        print(f"skipping {stage}: {reason}")
+        self.skipped[stage] = reason
+
+
+def example_report() -> dict:
+    with open(EXAMPLE_PATH, "r", encoding="utf-8") as f:
+        report = json.load(f)
+    # the example predates reports storing the evaluation as a list
+    if isinstance(report["evaluated_transcription"], str):
+        report["evaluated_transcription"] = ast.literal_eval(report["evaluated_transcription"])
+    return report
+
+
+def synthetic_reports(example: dict, count: int, employees: int, seed: int) -> list:
+    """ Reports shaped like the example with seeded scores, employees and submission times over 90 days """
+    rng = random.Random(seed)
+    start = datetime.datetime(2025, 1, 1)
+    reports = []
+    for i in range(count):
+        submitted = start + datetime.timedelta(seconds=rng.randint(0, 90 * 24 * 3600))
+        reports.append({
+            **example,
+            "job_id": f"bench-{seed}-{i}",
+            "employee_id": f"emp-{rng.randrange(employees)}",
+            "submission_date_time": submitted.strftime("%Y-%m-%d[%H:%M:%S]"),
+            "evaluated_transcription": [
+                [metric, rng.choice([1, 2, 3, 3.5, 4, 4.5, 5]), reason]
+                for metric, _, reason in example["evaluated_transcription"]
+            ],
+        })
+    return reports
+
+
+def bench_prompts(results: Results, example: dict, repeats: int):
+    from src.prompts.prompts import build_prompt
+    for _ in range(repeats):
+        with results.timed("build_prompt"):
+            prompt = build_prompt(example["transcription"], example["input_user_prompt"], example["input_prompt_name"])[0]
+    results.close_stage("build_prompt")
+    return prompt
+
+
+def bench_llm(results: Results, prompt: str, repeats: int):
+    from src.evaluator.evaluator import evaluate_transcription_quality
+    for _ in range(repeats):
+        with results.timed("evaluate_transcription_quality"):
+            feedback = evaluate_transcription_quality(prompt)
+        if not isinstance(feedback, str):
+            raise RuntimeError(feedback["report"])
+    results.close_stage("evaluate_transcription_quality", prompt_chars=len(prompt))
+
+
+def bench_storage(results: Results, reports: list):
+    from src.storage.storage import save_report, get_all_reports, get_reports_by_employee, get_metric_aggregates
+    for report in reports:
+        with results.timed("storage.save_report"):
+            save_report(report)
+    results.close_stage("storage.save_report")
+
+    for _ in range(5):
+        with results.timed("storage.get_all_reports"):
+            get_all_reports()
+    results.close_stage("storage.get_all_reports", reports=len(reports))
+
+    for employee in sorted({report["employee_id"] for report in reports}):
+        with results.timed("storage.get_reports_by_employee"):
+            get_reports_by_employee(employee)
+        with results.timed("storage.get_metric_aggregates"):
+            get_metric_aggregates(employee)
+    results.close_stage("storage.get_reports_by_employee")
+    results.close_stage("storage.get_metric_aggregates")
+
+
+def metrics_from_reports(all_reports: dict) -> dict:
+    """ Per-report trend extraction the score columns replaced, kept as the baseline they are measured against """
+    result = {}
+    for report in all_reports.values():
+        label = f"{report.get('employee_id', 'unknown')}-{report.get('job_id', 'unknown')[:5]}"
+        for metric, score, _ in report.get("evaluated_transcription", []):
+            entry = result.setdefault(metric, {"scores": [], "labels": []})
+            entry["scores"].append(score)
+            entry["labels"].append(label)
+    return result
+
+
+def bench_analysis(results: Results, example: dict, repeats: int, charts: str):
+    from src.analysis.analysis import generate_analysis
+    from src.analysis.general_analysis import extract_column_metrics, create_trend_graphs
+    from src.analysis.aggregates import compute_performance_from_aggregates
+    from src.storage.storage import get_all_reports, get_metric_aggregates
+    from src.storage.columns import score_columns, get_score_columns
+
+    for _ in range(repeats):
+        with results.timed("analysis.generate_analysis"):
+            generate_analysis(example["evaluated_transcription"], example["evaluate_summary"], charts)
+    results.close_stage("analysis.generate_analysis", charts=charts)
+
+    for _ in range(max(repeats // 5, 1)):
+        with results.timed("analysis.overall"):
+            metrics_data = extract_column_metrics(get_score_columns())
+            create_trend_graphs(metrics_data, charts)
+            compute_performance_from_aggregates(get_metric_aggregates())
+    results.close_stage("analysis.overall", charts=charts)
+
+    # trend extraction alone, parsing every stored report against reading the score columns
+    for _ in range(max(repeats // 5, 1)):
+        with results.timed("analysis.trends_from_reports"):
+            metrics_from_reports(get_all_reports())
+    results.close_stage("analysis.trends_from_reports")
+
+    with results.timed("columns.rebuild"):
+        score_columns.rebuild()
+    results.close_stage("columns.rebuild")
+
+    for _ in range(max(repeats // 5, 1)):
+        with results.timed("analysis.trends_from_columns"):
+            extract_column_metrics(get_score_columns())
+    results.close_stage("analysis.trends_from_columns")
+
+
+def bench_text_jobs(results: Results, example: dict, jobs: int, workers: int, with_prompt: bool):
+    """
+    Transcript in, report saved: build_prompt + LLM + store, `workers` at a time like the job queue.
+    Without with_prompt (spaCy unavailable) the example's stored prompt is sent instead.
+    """
+    from src.evaluator.evaluator import evaluate_transcription_quality
+    from src.storage.storage import save_report
+
+    def job(i):
+        with results.timed("text_job"):
+            prompt = example["prompt_payload"]
+            if with_prompt:
+                from src.prompts.prompts import build_prompt
+                prompt = build_prompt(example["transcription"], example["input_user_prompt"], example["input_prompt_name"])[0]
+            result = json.loads(evaluate_transcription_quality(prompt))
+            save_report({
+                **example,
+                "job_id": f"text-job-{i}",
+                "employee_id": "bench",
+                "prompt_payload": prompt,
+                "evaluated_transcription": result["report"],
+                "evaluate_summary": result["summary"],
+            })
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(job, range(jobs)))
+    elapsed = time.perf_counter() - start
+    results.close_stage("text_job", workers=workers)
+    results.throughput["text_jobs_per_min"] = round(jobs / elapsed * 60, 2)
+
+
+def bench_audio(results: Results, workdir: str, durations: list, repeats: int, workers: int):
+    from src.models.models import get_whisper_model, get_diarization_pipeline, get_model_stats
+    from src.transcription.transcription import transcribe_file
+
+    # load outside the timings, model load is reported separately
+    get_whisper_model()
+    get_diarization_pipeline()
+    results.throughput["model_load"] = get_model_stats()
+
+    files = []
+    for seconds in durations:
+        for r in range(repeats):
+            path = write_call(os.path.join(workdir, f"call-{seconds}s-{r}.wav"), seconds, speakers=2 + r % 2, seed=seconds * 100 + r)
+            files.append((seconds, path))
+
+    audio_seconds = 0
+    wall_seconds = 0
+    for seconds, path in files:
+        stage = f"transcribe_file.{seconds}s"
+        start = time.perf_counter()
+        with results.timed(stage):
+            transcribe_file(path)
+        audio_seconds += seconds
+        wall_seconds += time.perf_counter() - start
+    for seconds in durations:
+        results.close_stage(f"transcribe_file.{seconds}s")
+    results.throughput["audio_seconds_per_wall_second"] = round(audio_seconds / wall_seconds, 3)
+
+    # whole pipeline per upload: transcription, prompt, LLM, store
+    from src.service import process_conversation
+
+    start = time.perf_counter()
+
+    def job(item):
+        seconds, path = item
+        with results.timed("audio_job"):
+            process_conversation(path, "bench-audio", None, None, use_cache=False)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(job, files))
+    elapsed = time.perf_counter() - start
+    results.close_stage("audio_job", workers=workers)
+    results.throughput["audio_jobs_per_min"] = round(len(files) / elapsed * 60, 2)
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list:
+    """ Lines describing every regression beyond tolerance, empty when there is none """
+    regressions = []
+    for stage, stats in current["stages"].items():
+        previous = baseline.get("stages", {}).get(stage)
+        if previous is None:
+            continue
+        for key in ("p50_ms", "p90_ms"):
+            if previous[key] > 0 and stats[key] > previous[key] * (1 + tolerance):
+                regressions.append(f"{stage} {key}: {previous[key]} -> {stats[key]} (+{(stats[key] / previous[key] - 1) * 100:.0f}%)")
+
+    for key, value in current["throughput"].items():
+        previous = baseline.get("throughput", {}).get(key)
+        if isinstance(value, (int, float)) and isinstance(previous, (int, float)) and previous > 0 and value < previous * (1 - tolerance):
+            regressions.append(f"{key}: {previous} -> {value} ({(value / previous - 1) * 100:.0f}%)")
+    return regressions
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeats", type=int, default=20, help="iterations of each text stage")
+    parser.add_argument("--reports", type=int, default=500, help="synthetic reports saved in the storage stage")
+    parser.add_argument("--employees", type=int, default=20)
+    parser.add_argument("--jobs", type=int, default=40, help="transcripts pushed through the text pipeline")
+    parser.add_argument("--workers", type=int, default=4, help="pipelines running at once")
+    parser.add_argument("--durations", default="30,120,300", help="seconds of synthetic audio per call")
+    parser.add_argument("--audio-repeats", type=int, default=2, help="calls per duration")
+    parser.add_argument("--skip-audio", action="store_true", help="leave out whisper and pyannote")
+    parser.add_argument("--charts", default="inline", choices=["inline", "url", "none"])
+    parser.add_argument("--ollama-host", default=None, help="real Ollama server instead of the stub")
+    parser.add_argument("--stub-latency", type=float, default=0.05)
+    parser.add_argument("--stub-tokens-per-second", type=float, default=1000.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", default=None, help="earlier results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown before a stage counts as a regression")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="agent-reviewer-bench-")
+    host = args.ollama_host
+    if host is None:
+        stub = start_stub(0, args.stub_latency, args.stub_tokens_per_second)
+        host = f"http://127.0.0.1:{stub.server_address[1]}"
+
+    # everything the pipeline writes goes to the temp dir, and nothing is served from a cache
+    os.environ.update({
+        "OLLAMA_HOST": host,
+        "REPORTS_DB": os.path.join(workdir, "reports.db"),
+        "LEGACY_REPORTS_JSON": os.path.join(workdir, "all_reports.json"),
+        "LLM_CACHE_ENABLED": "0",
+        "LLM_CACHE_DB": os.path.join(workdir, "llm_cache.db"),
+        "CHECKPOINTS_ENABLED": "0",
+        "CHECKPOINT_DIR": os.path.join(workdir, "checkpoints"),
+        "SCRATCH_DIR": os.path.join(workdir, "scratch"),
+        "BATCH_DB": os.path.join(workdir, "batches.db"),
+        "COLUMNS_DIR": os.path.join(workdir, "columns"),
+        "PRELOAD_MODELS": "0",
+    })
+    sys.path.insert(0, BACKEND_DIR)
+
+    results = Results()
+    example = example_report()
+    started = time.perf_counter()
+    try:
+        try:
+            prompt = bench_prompts(results, example, args.repeats)
+        except Exception as e:
+            results.skip("build_prompt", f"{type(e).__name__}: {e}")
+            prompt = None
+
+        # the LLM stages fall back to the example's stored prompt so they don't depend on spaCy
+        bench_llm(results, prompt or example["prompt_payload"], args.repeats)
+        bench_text_jobs(results, example, args.jobs, args.workers, with_prompt=prompt is not None)
+
+        bench_storage(results, synthetic_reports(example, args.reports, args.employees, args.seed))
+        bench_analysis(results, example, args.repeats, args.charts)
+
+        if args.skip_audio:
+            results.skip("transcribe_file", "--skip-audio")
+        else:
+            try:
+                bench_audio(results, workdir, [int(d) for d in args.durations.split(",")], args.audio_repeats, args.workers)
+            except Exception as e:
+                results.skip("transcribe_file", f"{type(e).__name__}: {e}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    output = {
+        "meta": {
+            "timestamp": datetime.datetime.now().isoformat(),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "ollama": "stub" if args.ollama_host is None else args.ollama_host,
+            "args": vars(args),
+            "elapsed_seconds": round(time.perf_counter() - started, 1),
+        },
+        "stages": results.stages,
+        "throughput": results.throughput,
+        "skipped": results.skipped,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(output, f, indent=2)
+
+    print(f"\n{'stage':<36}{'count':>7}{'p50 ms':>12}{'p90 ms':>12}{'p99 ms':>12}{'rss MB':>10}")
+    for stage, stats in results.stages.items():
+        print(f"{stage:<36}{stats['count']:>7}{stats['p50_ms']:>12.2f}{stats['p90_ms']:>12.2f}{stats['p99_ms']:>12.2f}{stats['peak_rss_mb']:>10.1f}")
+    for key, value in results.throughput.items():
+        if not isinstance(value, dict):
+            print(f"{key}: {value}")
+    print(f"peak rss: {output['peak_rss_mb']} MB, results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(output, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print(f"no regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
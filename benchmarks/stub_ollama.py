@@ -0,0 +1,117 @@
+# Stand-in for the Ollama server so benchmarks run offline and give the same answers every time.
+# Implements POST /api/chat (streaming and not) and answers every evaluation prompt with valid JSON
+# for the metrics named in it, after a delay that mimics generation speed.
+#   python benchmarks/stub_ollama.py --port 11435
+import re
+import json
+import time
+import hashlib
+import argparse
+import datetime
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_PATTERN = re.compile(r'these metrics: "([^"]*)"')
+
+
+def answer(prompt: str) -> str:
+    """ Deterministic evaluation for the prompt, shaped after the template the prompt came from """
+    match = METRICS_PATTERN.search(prompt)
+    metrics = [name.strip() for name in match.group(1).split(",")] if match else ["Overall"]
+    seed = hashlib.sha256(prompt.encode("utf-8")).digest()
+    report = [
+        [name, 1 + seed[i % len(seed)] % 5, f"Stub reason for {name.lower()}."]
+        for i, name in enumerate(metrics)
+        if name
+    ]
+
+    if '"notes"' in prompt:
+        return json.dumps({"report": report, "notes": "Stub notes for this part of the call."})
+    return json.dumps({"report": report, "summary": "Stub summary of the agent's performance. " * 10})
+
+
+class StubOllamaHandler(BaseHTTPRequestHandler):
+    latency = 0.05
+    tokens_per_second = 1000.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path in ("/", "/api/version"):
+            self._send_json({"version": "stub"})
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        if self.path != "/api/chat":
+            self.send_error(404)
+            return
+
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        prompt = request["messages"][-1]["content"]
+        content = answer(prompt)
+        prompt_tokens = len(prompt) // 4
+        completion_tokens = max(len(content) // 4, 1)
+        generation = completion_tokens / self.tokens_per_second
+
+        time.sleep(self.latency)
+        base = {"model": request.get("model", "stub"), "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat()}
+        final = {
+            **base,
+            "done": True,
+            "done_reason": "stop",
+            "prompt_eval_count": prompt_tokens,
+            "eval_count": completion_tokens,
+            "eval_duration": int(generation * 1e9),
+        }
+
+        if not request.get("stream", True):
+            time.sleep(generation)
+            self._send_json({**final, "message": {"role": "assistant", "content": content}})
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        tokens = re.findall(r"\S+\s*", content)
+        for token in tokens:
+            time.sleep(generation / len(tokens))
+            self.wfile.write((json.dumps({**base, "done": False, "message": {"role": "assistant", "content": token}}) + "\n").encode("utf-8"))
+        self.wfile.write((json.dumps({**final, "message": {"role": "assistant", "content": ""}}) + "\n").encode("utf-8"))
+
+    def _send_json(self, value: dict):
+        body = json.dumps(value).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_stub(port: int = 0, latency: float = 0.05, tokens_per_second: float = 1000.0) -> ThreadingHTTPServer:
+    """ Serve the stub on a background thread, port 0 picks a free one (server.server_address[1]) """
+    handler = type("Handler", (StubOllamaHandler,), {"latency": latency, "tokens_per_second": tokens_per_second})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="stub-ollama", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=1000.0)
+    args = parser.parse_args()
+
+    server = start_stub(args.port, args.latency, args.tokens_per_second)
+    print(f"stub ollama listening on http://127.0.0.1:{server.server_address[1]}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from "react";
+import React, { useState, useEffect, useRef } from "react";
 import axios from "axios";
 import {
   Box,
@@ -29,7 +29,7 @@ function App() {
   const [activeEmployeeId, setActiveEmployeeId] = useState(null);
   const [userPrompt, setUserPrompt] = useState("");
   const [promptName, setPromptName] = useState("");
-  const [reports, setReports] = useState([]);
+  const [reports, setReports] = useState({});
   const [selectedReport, setSelectedReport] = useState(null);
   const [overallAnalysis, setOverallAnalysis] = useState(null);
   const [employeeReports, setEmployeeReports] = useState(null);
@@ -39,6 +39,9 @@ function App() {
   const [isEvaluating, setIsEvaluating] = useState(false);
   const { colorMode, toggleColorMode } = useColorMode();
   const [fileInputKey, setFileInputKey] = useState(Date.now());
+  // last store version received on the report feed, a reconnect resumes after it
+  const reportCursor = useRef(0);
+  const reportSocket = useRef(null);
 
   const boxBg = useColorModeValue("gray.50", "gray.700");
 
@@ -55,7 +58,7 @@ function App() {
     try {
       const res = await axios.post("http://localhost:8000/evaluate_audio", formData);
       setApiLog((log) => [...log, `Evaluate Audio Success: ${JSON.stringify(res.data)}`]);
-      fetchReports();
+      // the new report arrives on the report feed
       fetchOverallAnalysis();
       setFile(null);
       setFileInputKey(Date.now());
@@ -69,20 +72,39 @@ function App() {
     }
   };
 
-  const fetchReports = () => {
-    const socket = new WebSocket("ws://localhost:8000/ws/reports");
+  const subscribeReports = () => {
+    // stays open: a snapshot of the report summaries first, then every new or changed report
+    const socket = new WebSocket(`ws://localhost:8000/ws/reports?since=${reportCursor.current}`);
     socket.onmessage = (event) => {
       const data = JSON.parse(event.data);
       if (data.error) {
         setApiLog((log) => [...log, `WebSocket Reports Error: ${data.error}`]);
-      } else {
-        setReports(data);
+        return;
+      }
+      reportCursor.current = data.cursor;
+      setReports((current) => {
+        const next = data.reset ? {} : { ...current };
+        data.reports.forEach((report) => {
+          next[report.job_id] = report;
+        });
+        return next;
+      });
+      if (data.type === "changes") {
+        setApiLog((log) => [...log, `WebSocket Received ${data.reports.length} New Report(s)`]);
+      } else if (data.complete) {
         setApiLog((log) => [...log, `WebSocket Received Reports`]);
       }
     };
     socket.onerror = () => {
       setApiLog((log) => [...log, `WebSocket Reports Connection Error`]);
     };
+    socket.onclose = () => {
+      // reconnect unless the dashboard closed this feed on purpose
+      setTimeout(() => {
+        if (reportSocket.current === socket) reportSocket.current = subscribeReports();
+      }, 3000);
+    };
+    return socket;
   };
 
   const fetchReportById = async (jobId) => {
@@ -113,7 +135,8 @@ function App() {
   const handleEmployeeSearch = async () => {
     try {
       const reportRes = await axios.get("http://localhost:8000/get-report-employee", {
-        params: { employee_id: searchEmployeeId },
+        // the list only shows job ids, the full report is fetched when one is selected
+        params: { employee_id: searchEmployeeId, fields: "summary" },
       });
       setEmployeeReports(reportRes.data);
 
@@ -143,7 +166,7 @@ function App() {
   };
 
   useEffect(() => {
-    fetchReports();
+    reportSocket.current = subscribeReports();
     fetchOverallAnalysis();
     axios
       .get("http://localhost:8000/get-prompt-options")
@@ -151,6 +174,11 @@ function App() {
       .catch((error) => {
         setApiLog((log) => [...log, `Get Prompt Options Error: ${error.message}`]);
       });
+    return () => {
+      const socket = reportSocket.current;
+      reportSocket.current = null;
+      if (socket) socket.close();
+    };
   }, []);
 
   return (
@@ -0,0 +1,105 @@
+# Concurrency stress test for the audio pipeline.
+# Start the server first (see BUILD.md), then:
+#   python stress_test.py --jobs 8
+#   python stress_test.py --jobs 8 --sync        # hit /evaluate_audio instead of the job queue
+#   python stress_test.py --scratch-dir /tmp     # also check the server's SCRATCH_DIR is left empty
+# Every upload is a different synthetic two-speaker call with its own length, all named call.wav.
+# The test fails if any job fails or a report comes back with another upload's duration, which is
+# what happened when concurrent jobs shared temp_{filename}, audio.wav, a.wav and diarization.txt.
+import os
+import argparse
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+
+# the benchmark suite's call generator, so both tools upload the same kind of audio
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks"))
+from synthetic_audio import synthetic_call, to_wav
+
+
+def expected_duration(seconds: int) -> str:
+    return f"{seconds // 3600:02d}:{(seconds % 3600) // 60:02d}:{seconds % 60:02d}"
+
+
+def run_job(client: httpx.Client, index: int, seconds: int, sync: bool, timeout: float) -> dict:
+    # seeded per upload, the noise makes every file hash differently
+    audio = to_wav(synthetic_call(seconds, seed=int(time.time() * 1000) + index))
+    files = {"file": ("call.wav", audio, "audio/wav")}
+    data = {"employee_id": f"stress-{index}", "use_cache": "false"}
+
+    if sync:
+        response = client.post("/evaluate_audio", files=files, data=data, timeout=timeout)
+        response.raise_for_status()
+        return response.json()
+
+    response = client.post("/jobs/evaluate_audio", files=files, data=data)
+    response.raise_for_status()
+    job_id = response.json()["job_id"]
+
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        status = client.get(f"/jobs/{job_id}").json()
+        if status["status"] in ("done", "failed"):
+            break
+        time.sleep(1)
+
+    response = client.get(f"/jobs/{job_id}/result")
+    if response.status_code != 200:
+        raise RuntimeError(f"job {job_id} did not finish: {response.text}")
+    return response.json()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--jobs", type=int, default=8)
+    parser.add_argument("--sync", action="store_true")
+    parser.add_argument("--timeout", type=float, default=1800)
+    parser.add_argument("--scratch-dir", default=None)
+    args = parser.parse_args()
+
+    # same file name for every upload on purpose, the server must keep them apart
+    durations = [20 + 3 * i for i in range(args.jobs)]
+    failures = []
+    start = time.time()
+
+    with httpx.Client(base_url=args.url, timeout=60) as client:
+        with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+            futures = [pool.submit(run_job, client, i, seconds, args.sync, args.timeout) for i, seconds in enumerate(durations)]
+
+        reports = 0
+        job_ids = set()
+        for i, future in enumerate(futures):
+            try:
+                report = future.result()
+            except Exception as e:
+                failures.append(f"upload {i}: {e}")
+                continue
+
+            reports += 1
+            job_ids.add(report["job_id"])
+            if report["employee_id"] != f"stress-{i}":
+                failures.append(f"upload {i}: got employee {report['employee_id']}")
+            if report["audio_duration"] != expected_duration(durations[i]):
+                failures.append(f"upload {i}: duration {report['audio_duration']}, expected {expected_duration(durations[i])}")
+
+        if len(job_ids) != reports:
+            failures.append(f"expected {reports} distinct job ids, got {len(job_ids)}")
+
+    if args.scratch_dir:
+        leftovers = [name for name in os.listdir(args.scratch_dir) if name.startswith(("upload-", "transcribe-"))]
+        if leftovers:
+            failures.append(f"scratch directories left behind: {', '.join(leftovers)}")
+
+    elapsed = time.time() - start
+    print(f"{args.jobs} concurrent uploads in {elapsed:.1f}s ({args.jobs / elapsed * 60:.1f} jobs/min)")
+    for failure in failures:
+        print(f"FAIL {failure}")
+    if failures:
+        sys.exit(1)
+    print("OK - every job finished with its own audio")
+
+
+if __name__ == "__main__":
+    main()
@@ -26,27 +26,33 @@ df = spark.read.json("./call_center_data.json").select(["transcript"]).cache()
 
 # list of transcripts
 transcripts = df.select("transcript").rdd.flatMap(lambda x: x).collect()
-i = 0
-def call_api(transcript):
-    print(i)
-    i += 1
+def call_api(transcripts):
+    # one request for the whole batch, results stream back as NDJSON as each transcript finishes
+    output = [None] * len(transcripts)
     try:
-        response = requests.post(
-            "http://localhost:8000/test",
-            data={"transcript": transcript}
-        )
-        result = response.json()
-        return {
-            "input_transcript": transcript,
-            "api_response": result
-        }
+        with requests.post(
+            "http://localhost:8000/batch",
+            json={"items": [{"id": str(i), "transcript": t} for i, t in enumerate(transcripts)]},
+            stream=True
+        ) as response:
+            response.raise_for_status()
+            print("batch_id: " + response.headers["X-Batch-Id"])
+            for line in response.iter_lines():
+                event = json.loads(line)
+                if "index" not in event:
+                    print(event)
+                    continue
+                print(event["index"], event["status"])
+                output[event["index"]] = {
+                    "input_transcript": transcripts[event["index"]],
+                    "api_response": event.get("result") or {"error": event.get("error")}
+                }
     except Exception as e:
-        return {
-            "input_transcript": transcript,
-            "api_response": {"error": str(e)}
-        }
+        # unfinished items can be picked up again with POST /batch/{batch_id}/resume
+        print("batch interrupted: " + str(e))
+    return [item for item in output if item is not None]
 
-output_list = [call_api(t) for t in transcripts[:20]]
+output_list = call_api(transcripts[:20])
 
 print("total rows:" + str(len(transcripts)))
 